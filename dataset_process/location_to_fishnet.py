@@ -1,7 +1,9 @@
+import os
+import numpy as np
 import pandas as pd
 import random
 import geopandas as gpd
-from shapely.geometry import Point, Polygon
+import shapely
 import logging
 
 # 配置日志
@@ -19,17 +21,66 @@ def read_excel(file_path):
         raise
 
 
+# 函数1.1：将Excel一次性导入为按 Dataset、Type 排序的 Parquet 目录，之后直接读取 Parquet
+def build_catalog(file_path, catalog_path):
+    df = read_excel(file_path)
+    for column in df.columns:
+        # 混合类型的列（如同时含数字和字符串的 TID）统一为字符串，保证能写入 Parquet
+        if df[column].dtype == object and pd.api.types.infer_dtype(df[column], skipna=True).startswith('mixed'):
+            df[column] = df[column].astype(str)
+    for column in ('Dataset', 'Type'):
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    if {'Dataset', 'Type'}.issubset(df.columns):
+        df = df.sort_values(['Dataset', 'Type'], kind='stable').reset_index(drop=True)
+    df.to_parquet(catalog_path, index=False)
+    logging.info(f"Catalog {catalog_path} built from {file_path}.")
+    return df
+
+
+def load_catalog(file_path, catalog_path=None):
+    """读取 Excel 对应的 Parquet 目录；目录不存在或早于 Excel 时重新导入。"""
+    catalog_path = catalog_path or os.path.splitext(file_path)[0] + '.parquet'
+    if os.path.exists(catalog_path) and os.path.getmtime(catalog_path) >= os.path.getmtime(file_path):
+        df = pd.read_parquet(catalog_path)
+        logging.info(f"Catalog {catalog_path} read successfully.")
+        return df
+    return build_catalog(file_path, catalog_path)
+
+
 # 函数2：根据用户提供不同屏障类型数量随机筛选数据
+def stratified_sample(df, quotas, random_seed=None):
+    """
+    按 (Dataset, Type) 配额一次性分层抽样。
+    quotas 可以是 {Dataset: {Type: count}} 字典，也可以是行为 Dataset、列为 Type 的 DataFrame。
+    先整体随机打乱，再用 groupby.cumcount 得到组内序号，保留序号小于配额的行。
+    """
+    if not isinstance(quotas, pd.DataFrame):
+        quotas = pd.DataFrame(quotas).T
+    quota = quotas.stack()
+    quota = quota[quota > 0].astype(int)
+
+    # 配额不足的组给出警告
+    available = df.groupby(['Dataset', 'Type'], observed=True).size()
+    available = available.reindex(quota.index, fill_value=0)
+    for (dataset, type_), count in available[available < quota].items():
+        logging.warning(f"There are not enough {type_} in {dataset}.")
+
+    shuffled = df.sample(frac=1, random_state=random_seed)
+    rank = shuffled.groupby(['Dataset', 'Type'], observed=True, sort=False).cumcount().to_numpy()
+    keys = pd.MultiIndex.from_arrays([shuffled['Dataset'].to_numpy(dtype=object),
+                                      shuffled['Type'].to_numpy(dtype=object)])
+    position = quota.index.get_indexer(keys)
+    need = np.where(position >= 0, quota.to_numpy()[np.maximum(position, 0)], 0)
+    keep = rank < need
+
+    # 按配额顺序输出，组内保持随机顺序
+    order = np.lexsort((rank[keep], position[keep]))
+    return shuffled[keep].iloc[order]
+
+
 def filter_data(df, criteria, random_seed=None):
-    filtered_data = pd.DataFrame(columns=df.columns)
-    for dataset, types in criteria.items():
-        for type_, count in types.items():
-            subset = df[(df['Dataset'] == dataset) & (df['Type'] == type_)]
-            if len(subset) < count:
-                logging.warning(f"There are not enough {type_} in {dataset}.")
-            sample = subset.sample(min(len(subset), count), random_state=random_seed)
-            filtered_data = pd.concat([filtered_data, sample])
-    return filtered_data
+    return stratified_sample(df, criteria, random_seed=random_seed)
 
 
 # 函数3：保存筛选后的数据重新编号并导出到新的Excel文件
@@ -44,38 +95,104 @@ def save_to_excel(data, file_path):
         raise
 
 
+# 矢量输出：按扩展名选择格式，.shp 为 Shapefile，.gpkg 为 GeoPackage，.parquet 为 GeoParquet
+VECTOR_SUFFIXES = {'shp': '.shp', 'gpkg': '.gpkg', 'parquet': '.parquet'}
+
+
+def save_vector(gdf, file_path):
+    suffix = os.path.splitext(file_path)[1].lower()
+    if suffix == '.parquet':
+        gdf.to_parquet(file_path, index=False)
+    elif suffix == '.gpkg':
+        gdf.to_file(file_path, driver='GPKG', layer=os.path.splitext(os.path.basename(file_path))[0])
+    else:
+        gdf.to_file(file_path)
+
+
 # 函数4：将筛选的坐标点转换为点矢量文件
 def save_to_shapefile(data, file_path):
     try:
-        geometry = [Point(xy) for xy in zip(data['Lon'], data['Lat'])]
+        geometry = gpd.points_from_xy(data['Lon'], data['Lat'])
         gdf_points = gpd.GeoDataFrame(data, geometry=geometry, crs='EPSG:4326')
-        gdf_points.to_file(file_path)
-        logging.info(f"Points shapefile {file_path} created successfully.")
+        save_vector(gdf_points, file_path)
+        logging.info(f"Points file {file_path} created successfully.")
     except Exception as e:
-        logging.error(f"Error saving shapefile {file_path}: {e}")
+        logging.error(f"Error saving points file {file_path}: {e}")
         raise
 
 
 # 函数5：根据每个点生成一个矩形矢量边界，并记录 ID
+def build_rectangles(x, y, size):
+    """由中心点坐标数组一次性生成边长为 2 * size 的矩形数组。"""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    return shapely.box(x - size, y - size, x + size, y + size)
+
+
 def create_and_save_rectangles(gdf_points, file_path, size=4000):
     try:
-        rectangles = []
-        ids = []  # 用于记录矩形的 ID
-        for index, row in gdf_points.iterrows():
-            point = row.geometry
-            minx, miny, maxx, maxy = point.buffer(size).bounds
-            rectangle = Polygon([(minx, miny), (minx, maxy), (maxx, maxy), (maxx, miny)])
-            rectangles.append(rectangle)
-            ids.append(row['ID'])  # 将当前点的 ID 添加到列表中
-        gdf_rectangles = gpd.GeoDataFrame(geometry=rectangles, crs='EPSG:3857')
-        gdf_rectangles['ID'] = ids  # 将记录的 ID 添加为新的列
-        gdf_rectangles.to_file(file_path)
-        logging.info(f"Fishnet shapefile {file_path} created successfully.")
+        coords = shapely.get_coordinates(gdf_points.geometry.values)
+        rectangles = build_rectangles(coords[:, 0], coords[:, 1], size)
+        gdf_rectangles = gpd.GeoDataFrame({'ID': gdf_points['ID'].to_numpy()}, geometry=rectangles,
+                                          crs=gdf_points.crs or 'EPSG:3857')
+        save_vector(gdf_rectangles, file_path)
+        logging.info(f"Fishnet file {file_path} created successfully.")
     except Exception as e:
-        logging.error(f"Error creating fishnet shapefile {file_path}: {e}")
+        logging.error(f"Error creating fishnet file {file_path}: {e}")
         raise
 
 
+# 函数6：用 STRtree 查找窗口相互重叠的坐标点，并按行顺序贪心去重
+def find_overlaps(x, y, size):
+    """
+    返回所有窗口（边长 2 * size）面积重叠的点对 (i, j)，i < j，以及重叠面积占单个窗口面积的比例。
+    STRtree 建树与查询为 O(n log n + k)，k 为重叠点对数。
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    rectangles = build_rectangles(x, y, size)
+    tree = shapely.STRtree(rectangles)
+    i, j = tree.query(rectangles, predicate='intersects')
+    keep = i < j
+    i, j = i[keep], j[keep]
+    # 同尺寸正方形的重叠面积可直接由坐标差计算，只有边界相接的点对面积为 0，予以剔除
+    overlap = np.clip(2 * size - np.abs(x[i] - x[j]), 0, None) * np.clip(2 * size - np.abs(y[i] - y[j]), 0, None)
+    overlap = overlap / (2 * size) ** 2
+    keep = overlap > 0
+    order = np.lexsort((j[keep], i[keep]))
+    return i[keep][order], j[keep][order], overlap[keep][order]
+
+
+def deduplicate_points(data, size, crs='EPSG:3857'):
+    """
+    去除窗口与已保留点窗口重叠的坐标点（跨 GROD/MRBD/AMBER 数据集），靠前的行优先保留。
+    返回 (去重后的数据, 重叠报告)，报告中每行为一对重叠点及后者是否被去除。
+    """
+    points = gpd.GeoSeries(gpd.points_from_xy(data['Lon'], data['Lat']), crs='EPSG:4326').to_crs(crs)
+    coords = shapely.get_coordinates(points.values)
+    i, j, overlap = find_overlaps(coords[:, 0], coords[:, 1], size)
+
+    removed = np.zeros(len(data), dtype=bool)
+    starts = np.searchsorted(i, np.arange(len(data) + 1))
+    for k in np.unique(i):
+        if not removed[k]:
+            removed[j[starts[k]:starts[k + 1]]] = True
+
+    report = pd.DataFrame({
+        'TID': data['TID'].to_numpy()[i],
+        'Dataset': data['Dataset'].to_numpy()[i],
+        'TID_overlap': data['TID'].to_numpy()[j],
+        'Dataset_overlap': data['Dataset'].to_numpy()[j],
+        'Distance': np.hypot(coords[i, 0] - coords[j, 0], coords[i, 1] - coords[j, 1]),
+        'Overlap': overlap,
+        'Removed': removed[j] & ~removed[i],
+    })
+    if len(report):
+        summary = report.groupby(['Dataset', 'Dataset_overlap'], observed=True).size()
+        logging.info(f"{len(report)} overlapping windows found, {removed.sum()} points removed:\n{summary}")
+    return data[~removed], report
+
+
 # 新增的函数：根据需求筛选数据并统计
 def filter_and_sample(input_file_1, input_file_2, criteria):
     try:
@@ -83,27 +200,20 @@ def filter_and_sample(input_file_1, input_file_2, criteria):
         df2 = input_file_2
 
         # 集合 A: 从 input_file_2 中筛选出除 input_file_1 外的部分
-        set_A = df2[~df2['TID'].isin(df1['TID'])]
+        set_A = df2[~df2['TID'].astype(str).isin(df1['TID'].astype(str))]
 
         # 集合 B: 从 input_file_1 中筛选出 check_results 为 “有效图片”的部分
         set_B = df1[df1['check_results'] == '有效图片']
 
         # 统计集合 B 中不同 Dataset 的不同 Type 的数量
-        counts_B = set_B.groupby(['Dataset', 'Type']).size().unstack(fill_value=0)
+        counts_B = set_B.groupby(['Dataset', 'Type'], observed=True).size().unstack(fill_value=0)
 
         # 计算集合 C: 需要补充的数量
         criteria_df = pd.DataFrame(criteria).T
         counts_C = criteria_df.sub(counts_B, fill_value=0).clip(lower=0).fillna(0).astype(int)
 
         # 从集合 A 中随机抽取集合 C 所需数量的坐标点
-        filtered_data = pd.DataFrame(columns=set_A.columns)
-        for dataset, types in counts_C.iterrows():
-            for type_, count in types.items():
-                subset = set_A[(set_A['Dataset'] == dataset) & (set_A['Type'] == type_)]
-                if len(subset) < count:
-                    logging.warning(f"There are not enough {type_} in {dataset} in set_A.")
-                sample = subset.sample(min(len(subset), count), random_state=42)
-                filtered_data = pd.concat([filtered_data, sample])
+        filtered_data = stratified_sample(set_A, counts_C, random_seed=42)
 
         return filtered_data
     except Exception as e:
@@ -112,15 +222,24 @@ def filter_and_sample(input_file_1, input_file_2, criteria):
 
 
 # 主函数
-def main(input_file_1, input_file_2, output_file, criteria, rectangle_size=4000):
+def main(input_file_1, input_file_2, output_file, criteria, rectangle_size=4000, vector_format='shp',
+         deduplicate=True):
     try:
         # 过滤纬度超过 52° 的屏障
-        df_2 = read_excel(input_file_2)
+        df_2 = load_catalog(input_file_2)
         df_2 = df_2[df_2['Lat'] <= 52]
+        df_1 = load_catalog(input_file_1) if input_file_1.strip() else None
+
+        # 抽样前去除窗口重叠的坐标点，已检查过的坐标点优先保留，重叠报告保存为csv
+        if deduplicate:
+            if df_1 is not None:
+                checked = df_2['TID'].astype(str).isin(df_1['TID'].astype(str))
+                df_2 = pd.concat([df_2[checked], df_2[~checked]])
+            df_2, report = deduplicate_points(df_2, rectangle_size)
+            report.to_csv(output_file.replace('.xlsx', '_overlaps.csv'), index=False)
 
         # 若未输入检查结果则直接按预定数量随机筛选坐标点；若输入检查结果则补充坐标点
-        if input_file_1.strip():  # 如果 input_file_1 非空
-            df_1 = read_excel(input_file_1)
+        if df_1 is not None:  # 如果 input_file_1 非空
             # 使用 filter_and_sample 函数补充坐标点
             filtered_data = filter_and_sample(df_1, df_2, criteria)
         else:  # 如果 input_file_1 为空
@@ -130,16 +249,17 @@ def main(input_file_1, input_file_2, output_file, criteria, rectangle_size=4000)
         # 保存结果到新的Excel文件
         save_to_excel(filtered_data, output_file)
 
-        # 将筛选的坐标点转换为点矢量文件并保存为Shapefile格式
-        save_to_shapefile(filtered_data, output_file.replace('.xlsx', '_points.shp'))
+        # 将筛选的坐标点转换为点矢量文件并按 vector_format 保存（shp / gpkg / parquet）
+        suffix = VECTOR_SUFFIXES[vector_format]
+        save_to_shapefile(filtered_data, output_file.replace('.xlsx', '_points' + suffix))
 
         # 将筛选的坐标点转换到投影坐标系（EPSG:3857）
-        geometry = [Point(xy) for xy in zip(filtered_data['Lon'], filtered_data['Lat'])]
+        geometry = gpd.points_from_xy(filtered_data['Lon'], filtered_data['Lat'])
         gdf_points = gpd.GeoDataFrame(filtered_data, geometry=geometry, crs='EPSG:4326')
         gdf_points = gdf_points.to_crs('EPSG:3857')
 
-        # 根据每个点生成一个矩形边界，并将生成的矩形保存为Shapefile格式
-        create_and_save_rectangles(gdf_points, output_file.replace('.xlsx', '_fishnet.shp'), size=rectangle_size)
+        # 根据每个点生成一个矩形边界，并将生成的矩形按 vector_format 保存
+        create_and_save_rectangles(gdf_points, output_file.replace('.xlsx', '_fishnet' + suffix), size=rectangle_size)
 
     except Exception as e:
         logging.error(f"An error occurred in the main process: {e}")
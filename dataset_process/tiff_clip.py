@@ -1,6 +1,8 @@
 # 代码说明：批量裁剪图片至统一尺寸
+# 按输出分块（tile）逐块读取源影像窗口并直接写入分块压缩的GeoTIFF，单个进程的内存占用只与分块大小有关；
+# 多个文件通过进程池并行处理，输出文件比输入文件新时直接跳过。
 import os
-from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from osgeo import gdal
 
 # 设置输入和输出文件夹路径
@@ -11,46 +13,122 @@ output_tiff_folder = r"F:\river_barrier\output results\geotiff_clip" # 输出存
 min_width = 3359
 min_height = 3359
 
-# 创建输出文件夹
-if not os.path.exists(output_tiff_folder):
-    os.makedirs(output_tiff_folder)
-
-# 遍历所有tiff文件进行裁剪
-for tiff_file in os.listdir(input_tiff_folder):
-    if tiff_file.endswith(".tif") or tiff_file.endswith(".tiff"):
-        tiff_path = os.path.join(input_tiff_folder, tiff_file)
-        # 读取tiff图像
-        dataset = gdal.Open(tiff_path)
-        if dataset is None:
-            print("文件 {} 无法打开或不是有效的图像文件。".format(tiff_file))
-            continue
-
-        # 获取地理空间信息
-        geotransform = dataset.GetGeoTransform()
-        projection = dataset.GetProjection()
-
-        # 计算裁剪框的大小
-        left = (dataset.RasterXSize - min_width) // 2
-        top = (dataset.RasterYSize - min_height) // 2
-        right = left + min_width
-        bottom = top + min_height
-
-        # 读取图像数据
-        data = dataset.ReadAsArray(left, top, min_width, min_height)
-
-        # 创建输出文件
-        output_path = os.path.join(output_tiff_folder, tiff_file)
-        driver = gdal.GetDriverByName("GTiff")
-        out_dataset = driver.Create(output_path, min_width, min_height, dataset.RasterCount, dataset.GetRasterBand(1).DataType)
-        out_dataset.SetProjection(projection)
-        out_dataset.SetGeoTransform((geotransform[0] + left * geotransform[1], geotransform[1], 0, geotransform[3] + top * geotransform[5], 0, geotransform[5]))
-        for i in range(1, dataset.RasterCount + 1):
-            out_band = out_dataset.GetRasterBand(i)
-            out_band.WriteArray(data[i - 1])
-            out_band.FlushCache()
-
-        # 关闭数据集
-        dataset = None
-        out_dataset = None
-
-print("数据处理完成-----------------------------")
\ No newline at end of file
+# 分块大小（单位pixel，需为16的倍数）、压缩方式、并行进程数
+tile_size = 512
+compress = "LZW"
+num_workers = os.cpu_count()
+
+# 每个进程的GDAL块缓存上限（单位MB）
+gdal_cache_mb = 64
+
+
+def is_up_to_date(input_path, output_path):
+    """输出文件存在且修改时间不早于输入文件时视为已是最新。"""
+    return os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(input_path)
+
+
+def iter_tiles(width, height, tile_size):
+    """按输出分块网格遍历窗口，返回 (xoff, yoff, xsize, ysize)。"""
+    for yoff in range(0, height, tile_size):
+        ysize = min(tile_size, height - yoff)
+        for xoff in range(0, width, tile_size):
+            xsize = min(tile_size, width - xoff)
+            yield xoff, yoff, xsize, ysize
+
+
+def clip_tiff(tiff_path, output_path, width, height, tile_size=512, compress="LZW"):
+    """
+    从影像中心裁剪 width x height 窗口并写入分块压缩的GeoTIFF。
+    逐块使用 ReadRaster/WriteRaster 搬运原始字节，不会把整幅窗口读入内存。
+    返回 True 表示裁剪成功，False 表示文件无法打开或尺寸不足。
+    """
+    gdal.SetCacheMax(gdal_cache_mb * 1024 * 1024)
+
+    # 读取tiff图像
+    dataset = gdal.Open(tiff_path)
+    if dataset is None:
+        print("文件 {} 无法打开或不是有效的图像文件。".format(tiff_path))
+        return False
+    if dataset.RasterXSize < width or dataset.RasterYSize < height:
+        print("文件 {} 尺寸 {}x{} 小于裁剪尺寸。".format(tiff_path, dataset.RasterXSize, dataset.RasterYSize))
+        return False
+
+    # 获取地理空间信息
+    geotransform = dataset.GetGeoTransform()
+    projection = dataset.GetProjection()
+    band_count = dataset.RasterCount
+    data_type = dataset.GetRasterBand(1).DataType
+    band_list = list(range(1, band_count + 1))
+
+    # 计算裁剪框的位置
+    left = (dataset.RasterXSize - width) // 2
+    top = (dataset.RasterYSize - height) // 2
+
+    # 先写入临时文件，完成后再重命名，避免中断产生的残缺文件被误判为最新
+    tmp_path = output_path + ".part"
+    driver = gdal.GetDriverByName("GTiff")
+    options = [
+        "TILED=YES",
+        "BLOCKXSIZE={}".format(tile_size),
+        "BLOCKYSIZE={}".format(tile_size),
+        "COMPRESS={}".format(compress),
+        "BIGTIFF=IF_SAFER",
+    ]
+    if band_count > 1:
+        options.append("INTERLEAVE=PIXEL")
+    out_dataset = driver.Create(tmp_path, width, height, band_count, data_type, options=options)
+    out_dataset.SetProjection(projection)
+    out_dataset.SetGeoTransform((geotransform[0] + left * geotransform[1], geotransform[1], 0, geotransform[3] + top * geotransform[5], 0, geotransform[5]))
+
+    # 逐块读取源窗口并写入对应的输出分块
+    for xoff, yoff, xsize, ysize in iter_tiles(width, height, tile_size):
+        buffer = dataset.ReadRaster(left + xoff, top + yoff, xsize, ysize, band_list=band_list)
+        out_dataset.WriteRaster(xoff, yoff, xsize, ysize, buffer, band_list=band_list)
+
+    # 关闭数据集
+    out_dataset.FlushCache()
+    dataset = None
+    out_dataset = None
+    os.replace(tmp_path, output_path)
+    return True
+
+
+def clip_folder(input_folder, output_folder, width, height, tile_size=512, compress="LZW", workers=None):
+    """并行裁剪文件夹内所有tiff文件，跳过已是最新的输出，返回 (裁剪数, 跳过数, 失败数)。"""
+    # 创建输出文件夹
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    jobs = []
+    skipped = 0
+    for tiff_file in os.listdir(input_folder):
+        if tiff_file.endswith(".tif") or tiff_file.endswith(".tiff"):
+            tiff_path = os.path.join(input_folder, tiff_file)
+            output_path = os.path.join(output_folder, tiff_file)
+            if is_up_to_date(tiff_path, output_path):
+                skipped += 1
+                continue
+            jobs.append((tiff_path, output_path))
+
+    clipped = failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(clip_tiff, tiff_path, output_path, width, height, tile_size, compress): tiff_path
+                   for tiff_path, output_path in jobs}
+        for future in as_completed(futures):
+            try:
+                ok = future.result()
+            except Exception as e:
+                print("文件 {} 裁剪失败：{}".format(futures[future], e))
+                ok = False
+            if ok:
+                clipped += 1
+            else:
+                failed += 1
+    return clipped, skipped, failed
+
+
+if __name__ == "__main__":
+    clipped, skipped, failed = clip_folder(input_tiff_folder, output_tiff_folder, min_width, min_height,
+                                           tile_size=tile_size, compress=compress, workers=num_workers)
+    print("裁剪 {} 个，跳过 {} 个，失败 {} 个".format(clipped, skipped, failed))
+    print("数据处理完成-----------------------------")
@@ -1,46 +1,139 @@
 #代码说明：批量geotiff格式图片转换为jpg格式图片
+# 每个文件按行条带（strip）逐波段读取到预分配的 uint8 缓冲区，再用 libjpeg-turbo 编码；
+# 多个文件通过进程池并行处理，已完成的文件记录在状态文件中，中断后重新运行会从断点继续。
 import os
 import time
-from osgeo import gdal
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from osgeo import gdal, gdal_array
 import numpy as np
 from PIL import Image
 
-def geotiff_to_jpg(input_geotiff, output_folder):
-    # 打开 GeoTIFF 文件
-    dataset = gdal.Open(input_geotiff)
+try:
+    # PyTurboJPEG 直接调用 libjpeg-turbo；未安装时退回到 Pillow（其发行版同样基于 libjpeg-turbo）
+    from turbojpeg import TurboJPEG
+except ImportError:
+    TurboJPEG = None
+
+# 状态文件名，记录已经成功转换的文件
+STATE_FILE = ".tiff_to_jpg_done.txt"
+STAGES = ("read", "encode", "write")
+
+_jpeg = None
+
 
-    # 获取地图的宽度和高度
+def _get_jpeg_encoder():
+    global _jpeg
+    if _jpeg is None and TurboJPEG is not None:
+        _jpeg = TurboJPEG()
+    return _jpeg
+
+
+def read_rgb(dataset, strip_rows=256):
+    """
+    按行条带读取前三个波段，裁剪到 0 到 255 后写入一块预分配的 (height, width, 3) uint8 缓冲区。
+    """
     width = dataset.RasterXSize
     height = dataset.RasterYSize
+    img_data = np.empty((height, width, 3), dtype=np.uint8)
+    for b in range(3):
+        band = dataset.GetRasterBand(b + 1)
+        # 每个波段只分配一次条带缓冲区，按波段原始数据类型读取
+        strip_buf = np.empty((min(strip_rows, height), width),
+                             dtype=gdal_array.GDALTypeCodeToNumericTypeCode(band.DataType))
+        for y in range(0, height, strip_rows):
+            rows = min(strip_rows, height - y)
+            strip = band.ReadAsArray(0, y, width, rows, buf_obj=strip_buf[:rows])
+            if strip.dtype != np.uint8:
+                np.clip(strip, 0, 255, out=strip)
+            img_data[y:y + rows, :, b] = strip
+    return img_data
 
-    # 读取地图数据（三个波段）
-    band1 = dataset.GetRasterBand(1)
-    band2 = dataset.GetRasterBand(2)
-    band3 = dataset.GetRasterBand(3)
-    data1 = band1.ReadAsArray()
-    data2 = band2.ReadAsArray()
-    data3 = band3.ReadAsArray()
 
-    # 将三个波段数据合并为 RGB 图像
-    img_data = np.dstack((data1, data2, data3))
+def encode_jpg(img_data, quality=75):
+    """将 RGB uint8 数组编码为 JPEG 字节。"""
+    jpeg = _get_jpeg_encoder()
+    if jpeg is not None:
+        from turbojpeg import TJPF_RGB
+        return jpeg.encode(img_data, quality=quality, pixel_format=TJPF_RGB)
+    from io import BytesIO
+    buffer = BytesIO()
+    Image.fromarray(img_data).save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
 
-    # 将数据裁剪到 0 到 255 之间，并转换为无符号 8 位整数
-    img_data = np.clip(img_data, 0, 255).astype(np.uint8)
 
-    # 创建 PIL 图片对象
-    img = Image.fromarray(img_data)
+def geotiff_to_jpg(input_geotiff, output_folder, strip_rows=256, quality=75):
+    """
+    将单个 GeoTIFF 转换为 JPEG，返回各阶段耗时（秒）的字典。
+    """
+    timings = {}
 
-    # 获取输入 GeoTIFF 文件的文件名（不包括扩展名）
-    filename = os.path.splitext(os.path.basename(input_geotiff))[0]
+    # 打开 GeoTIFF 文件并读取三个波段
+    start = time.perf_counter()
+    dataset = gdal.Open(input_geotiff)
+    if dataset is None:
+        raise IOError("文件 {} 无法打开或不是有效的图像文件。".format(input_geotiff))
+    img_data = read_rgb(dataset, strip_rows)
+    dataset = None
+    timings["read"] = time.perf_counter() - start
+
+    # 编码为 JPEG
+    start = time.perf_counter()
+    jpg_bytes = encode_jpg(img_data, quality)
+    timings["encode"] = time.perf_counter() - start
 
-    # 构建输出 JPEG 文件的路径
+    # 构建输出 JPEG 文件的路径，先写临时文件再重命名
+    start = time.perf_counter()
+    filename = os.path.splitext(os.path.basename(input_geotiff))[0]
     output_jpg = os.path.join(output_folder, f"{filename}.jpg")
+    with open(output_jpg + ".part", "wb") as f:
+        f.write(jpg_bytes)
+    os.replace(output_jpg + ".part", output_jpg)
+    timings["write"] = time.perf_counter() - start
+    return timings
 
-    # 保存为 JPEG 格式的图片
-    img.save(output_jpg)
 
-    # 关闭数据集
-    dataset = None
+def load_state(output_folder):
+    """读取状态文件，返回已经完成转换的文件名集合。"""
+    state_path = os.path.join(output_folder, STATE_FILE)
+    if not os.path.exists(state_path):
+        return set()
+    with open(state_path, encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def convert_folder(input_folder, output_folder, workers=None, strip_rows=256, quality=75):
+    """
+    并行转换文件夹中的所有 GeoTIFF，跳过状态文件中已记录的文件，
+    返回 (完成数, 跳过数, 失败数, 各阶段累计耗时)。
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    done = load_state(output_folder)
+    filenames = [f for f in sorted(os.listdir(input_folder)) if f.endswith(".tif") or f.endswith(".tiff")]
+    todo = [f for f in filenames if f not in done]
+
+    totals = defaultdict(float)
+    converted = failed = 0
+    with open(os.path.join(output_folder, STATE_FILE), "a", encoding="utf-8") as state, \
+            ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(geotiff_to_jpg, os.path.join(input_folder, f), output_folder, strip_rows, quality): f
+                   for f in todo}
+        for future in as_completed(futures):
+            filename = futures[future]
+            try:
+                timings = future.result()
+            except Exception as e:
+                print(f"{filename} 转换失败：{e}")
+                failed += 1
+                continue
+            for stage, seconds in timings.items():
+                totals[stage] += seconds
+            # 每完成一个文件立即写入状态文件，保证中断后可以续跑
+            state.write(filename + "\n")
+            state.flush()
+            converted += 1
+    return converted, len(filenames) - len(todo), failed, dict(totals)
+
 
 if __name__ == "__main__":
     input_folder = r"F:\river_barrier\output results\geotiff_clip"  # 输入geotiff文件的文件夹路径
@@ -49,13 +142,13 @@ if __name__ == "__main__":
     # 开始计时
     start_time = time.time()
 
-    # 遍历输入文件夹中的所有文件
-    for filename in os.listdir(input_folder):
-        if filename.endswith(".tif") or filename.endswith(".tiff"):  # 确保是 GeoTIFF 文件
-            input_geotiff = os.path.join(input_folder, filename)
-            geotiff_to_jpg(input_geotiff, output_folder)
+    converted, skipped, failed, totals = convert_folder(input_folder, output_folder, workers=os.cpu_count())
 
     # 计算总运行时间
     end_time = time.time()
     elapsed_time = end_time - start_time
+    print(f"Converted: {converted}, skipped: {skipped}, failed: {failed}")
+    for stage in STAGES:
+        mean = totals.get(stage, 0.0) / converted if converted else 0.0
+        print(f"{stage:>6}: {totals.get(stage, 0.0):.2f} s total (worker time), {mean * 1000:.1f} ms per file")
     print(f"Total elapsed time: {elapsed_time:.2f} seconds")
@@ -1,35 +1,275 @@
 import os
+import hashlib
+from collections import Counter
 import pandas as pd
-import xml.etree.ElementTree as ET
 import matplotlib.pyplot as plt
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 
-def load_annotations(xml_folder):
+try:
+    from lxml.etree import iterparse
+except ImportError:
+    from xml.etree.ElementTree import iterparse
+
+CACHE_VERSION = 1
+STATS_VERSION = 1
+
+# Fixed bin edges for the incremental histograms (log10(x + 1) scale), so per-file partials can be summed
+AREA_BINS = np.linspace(0, 7, 141)
+RATIO_BINS = np.linspace(0, 3, 301)
+DIAGONAL_BINS = np.linspace(0, 4, 301)
+# Below this many changed files the parse runs in-process instead of starting a pool
+POOL_THRESHOLD = 64
+
+def parse_annotation(xml_path):
+    """
+    Parses the robndbox objects of a single .xml file with iterparse.
+    Parameters:
+    xml_path (str): The path to the .xml file.
+    output:
+    list: One (name, cx, cy, w, h, angle) tuple per object.
+    """
+    objects = []
+    for _, elem in iterparse(xml_path, events=('end',)):
+        if elem.tag != 'object':
+            continue
+        robndbox = elem.find('robndbox')
+        angle = robndbox.find('angle')
+        objects.append((elem.find('name').text,
+                        float(robndbox.find('cx').text),
+                        float(robndbox.find('cy').text),
+                        float(robndbox.find('w').text),
+                        float(robndbox.find('h').text),
+                        float(angle.text) if angle is not None else 0.0))
+        elem.clear()
+    return objects
+
+def _file_stamps(xml_folder):
+    """Returns {xml filename: (mtime_ns, size)} for every .xml file in the folder."""
+    stamps = {}
+    with os.scandir(xml_folder) as entries:
+        for entry in entries:
+            if entry.name.endswith('.xml'):
+                stat = entry.stat()
+                stamps[entry.name] = (stat.st_mtime_ns, stat.st_size)
+    return stamps
+
+def _cache_path(xml_folder):
+    xml_folder = os.path.normpath(xml_folder)
+    return os.path.join(os.path.dirname(xml_folder), os.path.basename(xml_folder) + '.cache.pkl')
+
+def _build_table(files, objects_per_file):
+    """Builds the columnar object table; the 'file' column is categorical over all files so empty files are kept."""
+    counts = np.array([len(objects) for objects in objects_per_file], dtype=np.int64)
+    rows = [obj for objects in objects_per_file for obj in objects]
+    values = np.array([obj[1:] for obj in rows], dtype=np.float64).reshape(-1, 5)
+    table = pd.DataFrame({
+        'file': pd.Categorical.from_codes(np.repeat(np.arange(len(files)), counts), categories=files),
+        'name': np.array([obj[0] for obj in rows], dtype=object),
+        'cx': values[:, 0], 'cy': values[:, 1], 'w': values[:, 2], 'h': values[:, 3], 'angle': values[:, 4],
+    })
+    table['area'] = table['w'] * table['h']
+    return table
+
+def load_annotations(xml_folder, workers=None, use_cache=True):
     """
-    Loads all .xml annotation files from the specified folder and parses the object information in each file.
+    Loads all .xml annotation files from the specified folder into one columnar table.
+    Files are parsed in a process pool and the table is cached next to the folder, keyed by
+    the modification time and size of every file, so unchanged folders are loaded from disk.
     Parameters:
     xml_folder (str): The path to the folder where the .xml file is stored.
+    workers (int): Number of worker processes, defaults to the number of CPUs.
+    use_cache (bool): Whether to read and write the on-disk cache.
     output:
-    dict: A dictionary with the key being the filename and the value being a list of information about the objects in each file.
-    """
-    annotations = {}
-    for xml_file in os.listdir(xml_folder):
-        if xml_file.endswith('.xml'):
-            tree = ET.parse(os.path.join(xml_folder, xml_file))
-            root = tree.getroot()
-            objects = []
-            for obj in root.findall('object'):
-                name = obj.find('name').text
-                robndbox = obj.find('robndbox')
-                cx = float(robndbox.find('cx').text)
-                cy = float(robndbox.find('cy').text)
-                w = float(robndbox.find('w').text)
-                h = float(robndbox.find('h').text)
-                area = w * h
-                objects.append((name, area, w, h, cx, cy))
-            annotations[xml_file] = objects
+    DataFrame: One row per object with columns file, name, cx, cy, w, h, angle and area.
+    """
+    stamps = _file_stamps(xml_folder)
+    files = sorted(stamps)
+    cache_path = _cache_path(xml_folder)
+    if use_cache and os.path.exists(cache_path):
+        cache = pd.read_pickle(cache_path)
+        if cache.get('version') == CACHE_VERSION and cache.get('stamps') == stamps:
+            return cache['table']
+
+    paths = [os.path.join(xml_folder, xml_file) for xml_file in files]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        objects_per_file = list(executor.map(parse_annotation, paths, chunksize=64))
+    table = _build_table(files, objects_per_file)
+
+    if use_cache:
+        pd.to_pickle({'version': CACHE_VERSION, 'stamps': stamps, 'table': table}, cache_path)
+    return table
+
+def join_split(annotations, metadata):
+    """
+    Adds the train/val/test split of every object with a single merge on the image ID.
+    Parameters:
+    annotations (DataFrame): Table returned by load_annotations.
+    metadata (DataFrame): Picture coordinate position information.
+    output:
+    DataFrame: The annotation table with an extra 'split' column.
+    """
+    ids = annotations['file'].astype(str).str.slice(stop=-len('.xml'))
+    splits = metadata[['ID', 'Folder']].astype({'ID': str}).drop_duplicates('ID')
+    joined = pd.DataFrame({'ID': ids.to_numpy()}).merge(splits, on='ID', how='left')
+    annotations = annotations.copy()
+    annotations['split'] = joined['Folder'].to_numpy()
     return annotations
 
+def _file_digest(xml_path):
+    with open(xml_path, 'rb') as f:
+        return hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+
+def _histogram(values, bins):
+    return np.histogram(np.clip(values, bins[0], bins[-1]), bins)[0]
+
+def file_partial(objects):
+    """
+    Computes the per-file partial aggregates used by update_statistics.
+    Parameters:
+    objects (list): (name, cx, cy, w, h, angle) tuples returned by parse_annotation.
+    output:
+    dict: Object count, class counts and area / aspect ratio / diagonal length histograms.
+    """
+    values = np.array([obj[1:] for obj in objects], dtype=np.float64).reshape(-1, 5)
+    w, h = values[:, 2], values[:, 3]
+    aspect_ratio = np.divide(w, h, out=np.zeros_like(w), where=h > 0)
+    return {
+        'count': len(objects),
+        'classes': Counter(obj[0] for obj in objects),
+        'area': _histogram(np.log10(w * h + 1), AREA_BINS),
+        'ratio': _histogram(np.log10(aspect_ratio + 1), RATIO_BINS),
+        'diagonal': _histogram(np.log10(np.sqrt(w ** 2 + h ** 2) + 1), DIAGONAL_BINS),
+    }
+
+def _parse_partial(xml_path):
+    return _file_digest(xml_path), file_partial(parse_annotation(xml_path))
+
+def _empty_totals():
+    return {'files': Counter(), 'classes': Counter(), 'area': np.zeros(len(AREA_BINS) - 1, dtype=np.int64),
+            'ratio': np.zeros(len(RATIO_BINS) - 1, dtype=np.int64),
+            'diagonal': np.zeros(len(DIAGONAL_BINS) - 1, dtype=np.int64)}
+
+def _merge_partial(totals, split, partial, sign):
+    total = totals.setdefault(split, _empty_totals())
+    total['files'][partial['count']] += sign
+    if sign > 0:
+        total['classes'].update(partial['classes'])
+    else:
+        total['classes'].subtract(partial['classes'])
+    for key in ('area', 'ratio', 'diagonal'):
+        total[key] += sign * partial[key]
+
+def update_statistics(xml_folder, metadata=None, workers=None):
+    """
+    Incrementally refreshes the dataset statistics of a label folder.
+    A per-file state (mtime/size stamp, content digest, split and partial aggregates) is kept next to the
+    folder together with the merged totals. Only files whose stamp changed are re-hashed, only files whose
+    digest changed are re-parsed, and their old partials are subtracted from the totals before the new ones
+    are added, so a rerun costs time proportional to the edits.
+    Parameters:
+    xml_folder (str): The path to the folder where the .xml file is stored.
+    metadata (DataFrame): Optional picture coordinate position information used to split the totals.
+    workers (int): Number of worker processes used when many files changed.
+    output:
+    dict: Totals keyed by split (None without metadata), each with the object-count frequency ('files'),
+    class counts and the area / aspect ratio / diagonal length histograms over AREA_BINS, RATIO_BINS
+    and DIAGONAL_BINS.
+    """
+    xml_folder = os.path.normpath(xml_folder)
+    state_path = os.path.join(os.path.dirname(xml_folder), os.path.basename(xml_folder) + '.stats.pkl')
+    state = None
+    if os.path.exists(state_path):
+        state = pd.read_pickle(state_path)
+    if state is None or state.get('version') != STATS_VERSION:
+        state = {'version': STATS_VERSION, 'files': {}, 'totals': {}}
+    entries, totals = state['files'], state['totals']
+
+    split_of = {}
+    if metadata is not None:
+        split_of = dict(zip(metadata['ID'].astype(str), metadata['Folder']))
+
+    stamps = _file_stamps(xml_folder)
+    removed = [f for f in entries if f not in stamps]
+    for xml_file in removed:
+        entry = entries.pop(xml_file)
+        _merge_partial(totals, entry['split'], entry['partial'], -1)
+
+    changed, moved = [], 0
+    for xml_file, stamp in stamps.items():
+        entry = entries.get(xml_file)
+        split = split_of.get(os.path.splitext(xml_file)[0])
+        # Move every known file to its current split first, so a touched file keeps the split change too
+        if entry is not None and entry['split'] != split:
+            _merge_partial(totals, entry['split'], entry['partial'], -1)
+            entry['split'] = split
+            _merge_partial(totals, split, entry['partial'], 1)
+            moved += 1
+        if entry is None or entry['stamp'] != stamp:
+            changed.append(xml_file)
+
+    # Re-hash the files whose stamp changed and re-parse only those whose content changed
+    paths = [os.path.join(xml_folder, xml_file) for xml_file in changed]
+    digests = [_file_digest(path) for path in paths]
+    stale = [(xml_file, path) for xml_file, path, digest in zip(changed, paths, digests)
+             if xml_file not in entries or entries[xml_file]['digest'] != digest]
+    for xml_file, digest in zip(changed, digests):
+        if xml_file in entries and entries[xml_file]['digest'] == digest:
+            entries[xml_file]['stamp'] = stamps[xml_file]
+    if len(stale) > POOL_THRESHOLD:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_parse_partial, [path for _, path in stale], chunksize=64))
+    else:
+        results = [_parse_partial(path) for _, path in stale]
+
+    for (xml_file, _), (digest, partial) in zip(stale, results):
+        split = split_of.get(os.path.splitext(xml_file)[0])
+        if xml_file in entries:
+            old = entries[xml_file]
+            _merge_partial(totals, old['split'], old['partial'], -1)
+        entries[xml_file] = {'stamp': stamps[xml_file], 'digest': digest, 'split': split, 'partial': partial}
+        _merge_partial(totals, split, partial, 1)
+
+    for total in totals.values():
+        total['files'] = +total['files']
+        total['classes'] = +total['classes']
+    if removed or changed or moved:
+        pd.to_pickle(state, state_path)
+    return totals
+
+def plot_incremental_statistics(totals):
+    """
+    Plot the category counts, object-count distribution and box-size histograms from the incremental totals.
+    Parameters:
+    totals (dict): Totals returned by update_statistics.
+    """
+    splits = [split for split in ('train', 'val', 'test') if split in totals] or list(totals)
+    df_counts = pd.DataFrame({split: pd.Series(totals[split]['classes'], dtype=np.int64) for split in splits})
+    df_counts = df_counts.fillna(0).astype(np.int64).rename_axis(index='Name', columns='Folder')
+    print(df_counts)
+
+    count_freq = sum((totals[split]['files'] for split in totals), Counter())
+    max_count = max(count_freq) if count_freq else 0
+    freq = np.array([count_freq.get(n, 0) for n in range(max_count + 1)])
+    plt.plot(range(len(freq)), freq, marker='o', markersize=2.5, alpha=0.7)
+    plt.xlabel('Number of Objects per .xml File')
+    plt.ylabel('Count')
+    plt.show()
+
+    plt.stairs(sum(totals[split]['area'] for split in totals), AREA_BINS, fill=True, alpha=0.7)
+    plt.xlabel('Log10(Area)')
+    plt.ylabel('Frequency')
+    plt.show()
+
+    plt.figure(figsize=(10, 6))
+    for split in splits:
+        plt.stairs(totals[split]['ratio'], RATIO_BINS, alpha=0.7, label=f'{split} - Length-width')
+        plt.stairs(totals[split]['diagonal'], DIAGONAL_BINS, alpha=0.7, label=f'{split} - Diagonal')
+    plt.xlabel('Diagonal length and length-width ratio of labeled boxes')
+    plt.ylabel('Frequency')
+    plt.legend()
+    plt.show()
+
 def load_metadata(metadata_file):
     """
     Load image coordinate position information from Excel file.
@@ -40,30 +280,19 @@ def load_metadata(metadata_file):
     """
     return pd.read_excel(metadata_file)
 
-def plot_category_counts(annotations, metadata):
+def plot_category_counts(annotations):
     """
     Plot the stacked bars for the number of different target detection categories.
     Parameters:
-    annotations (dict): Loaded labeled file object information
-    metadata (DataFrame): Picture coordinate position information.
+    annotations (DataFrame): Annotation table with the 'split' column added by join_split.
     """
-    category_counts = {}
     target_categories = ['dam', 'groyne', 'lock', 'sluice', 'weir']
 
-    for xml_file, objects in annotations.items():
-        folder = metadata.loc[metadata['ID'] == os.path.splitext(xml_file)[0], 'Folder'].values[0]
-        for name, _, _, _, _, _ in objects:
-            if name in target_categories:
-                category_counts.setdefault((folder, name), 0)
-                category_counts[(folder, name)] += 1
-
-    df_counts = pd.DataFrame(category_counts.items(), columns=['Category', 'Count'])
-    df_counts[['Folder', 'Name']] = pd.DataFrame(df_counts['Category'].tolist(), index=df_counts.index)
-
-    df_counts = df_counts[df_counts['Name'].isin(target_categories)]
-    df_counts = df_counts.pivot_table(index='Name', columns='Folder', values='Count', fill_value=0)
+    objects = annotations[annotations['name'].isin(target_categories)]
+    df_counts = objects.groupby(['name', 'split']).size().unstack(fill_value=0)
+    df_counts = df_counts.rename_axis(index='Name', columns='Folder')
 
-    df_counts = df_counts[['train', 'val', 'test']]
+    df_counts = df_counts.reindex(columns=['train', 'val', 'test'], fill_value=0)
     print(df_counts)
 
     df_counts.plot(kind='barh', stacked=True)
@@ -77,11 +306,12 @@ def plot_object_counts_distribution(annotations):
     """
     Plotting a line graph of the distribution of the number of target objects
     Parameters:
-    annotations (dict): Loaded labeled file object information.
+    annotations (DataFrame): Annotation table returned by load_annotations.
     """
-    object_counts = [len(objects) for objects in annotations.values()]
+    # 'file' is categorical over every .xml file, so files without objects are counted as 0
+    object_counts = annotations['file'].value_counts(sort=False).to_numpy()
 
-    max_count = max(object_counts) if object_counts else 0
+    max_count = object_counts.max() if len(object_counts) else 0
 
     count_freq = np.bincount(object_counts)
 
@@ -97,11 +327,11 @@ def plot_area_frequency(annotations):
     """
     Plot the frequency distribution of the target object's labeled box area.
     Parameters:
-    annotations (dict):  information about the loaded annotation file objects.
+    annotations (DataFrame): Annotation table returned by load_annotations.
     """
-    areas = [area for objects in annotations.values() for name, area, w, h, cx, cy in objects]
+    areas = annotations['area'].to_numpy()
 
-    if areas:
+    if len(areas):
         median_area = np.log10(np.median(areas))
         max_area = np.log10(np.max(areas))
         min_area = np.log10(np.min(areas))
@@ -109,7 +339,7 @@ def plot_area_frequency(annotations):
 
         print(f"面积统计信息:\n中位数: {median_area}\n最大值: {max_area}\n最小值: {min_area}\n平均值: {mean_area}")
 
-    log_areas = np.log10(np.array(areas) + 1)
+    log_areas = np.log10(areas + 1)
 
     plt.hist(log_areas, bins=70, alpha=0.7)
     plt.xlabel('Log10(Area)')
@@ -122,55 +352,42 @@ def plot_area_boxplot(annotations):
     Plot box-and-line diagrams of labeled box areas for different target object classes.
 
     Parameters:
-    annotations (dict): Loaded labeled file object information.
+    annotations (DataFrame): Annotation table returned by load_annotations.
     """
-    area_dict = {}
-
-    for objects in annotations.values():
-        for name, area, w, h, cx, cy in objects:
-            if name not in area_dict:
-                area_dict[name] = []
-            area_dict[name].append(area)
-
-    log_area_dict = {name: np.log10(np.array(areas) + 1) for name, areas in area_dict.items()}
+    log_areas = np.log10(annotations['area'] + 1)
+    log_area_dict = {name: group.to_numpy() for name, group in log_areas.groupby(annotations['name'], sort=False)}
 
     plt.boxplot(log_area_dict.values(), labels=log_area_dict.keys(), widths=0.3)
     plt.ylabel('Log10(Area)')
     plt.savefig(r'G:\目标检测标注数据集\2024河流屏障目标检测数据集分析\不同类别标注框面积直方图.eps', format='eps')
     plt.show()
 
-def plot_aspect_ratio_diagonal_length(annotations, metadata):
+def plot_aspect_ratio_diagonal_length(annotations):
     """
     Plot the frequency histogram of the labeled box aspect ratio and diagonal length of the target object, sub-train/test/val.
     Parameters:
-    annotations (dict): Loaded labeled file object information.
-    metadata (DataFrame): Picture coordinate position information.
+    annotations (DataFrame): Annotation table with the 'split' column added by join_split.
     """
-    ratios = []
-    diagonal_lengths = []
-
-    for xml_file, objects in annotations.items():
-        folder = metadata.loc[metadata['ID'] == os.path.splitext(xml_file)[0], 'Folder'].values[0]
-        for _, _, w, h, _, _ in objects:
-            aspect_ratio = w / h if h > 0 else 0
-            diagonal_length = np.sqrt(w ** 2 + h ** 2)
-
-            log_aspect_ratio = np.log10(aspect_ratio + 1)
-            log_diagonal_length = np.log10(diagonal_length + 1)
-
-            ratios.append((folder, log_aspect_ratio))
-            diagonal_lengths.append((folder, log_diagonal_length))
-
-    if ratios:
-        log_ratios = np.array([ratio[1] for ratio in ratios])
+    w = annotations['w'].to_numpy()
+    h = annotations['h'].to_numpy()
+    aspect_ratio = np.divide(w, h, out=np.zeros_like(w), where=h > 0)
+    diagonal_length = np.sqrt(w ** 2 + h ** 2)
+
+    df_ratios = pd.DataFrame({'Folder': annotations['split'].to_numpy(),
+                              'Log Aspect Ratio': np.log10(aspect_ratio + 1)})
+    df_diagonal_lengths = pd.DataFrame({'Folder': annotations['split'].to_numpy(),
+                                        'Log Diagonal Length': np.log10(diagonal_length + 1)})
+
+    if len(df_ratios):
+        log_ratios = df_ratios['Log Aspect Ratio'].to_numpy()
         median_ratios = np.median(log_ratios)
         mean_ratios = np.mean(log_ratios)
         min_ratios = np.min(log_ratios)
         max_ratios = np.max(log_ratios)
         print(
             f"宽高比统计信息：\n中位数: {median_ratios}\n最大值: {mean_ratios}\n最小值: {min_ratios}\n平均值: {max_ratios}")
-    if diagonal_lengths:
-        log_diagonal_lengths = np.array([length[1] for length in diagonal_lengths])
+    if len(df_diagonal_lengths):
+        log_diagonal_lengths = df_diagonal_lengths['Log Diagonal Length'].to_numpy()
         median_diagonal_lengths = np.median(log_diagonal_lengths)
         mean_diagonal_lengths = np.mean(log_diagonal_lengths)
         min_diagonal_lengths = np.min(log_diagonal_lengths)
@@ -178,9 +395,6 @@ def plot_aspect_ratio_diagonal_length(annotations, metadata):
         print(
             f"对角线长度统计信息：\n中位数: {median_diagonal_lengths}\n最大值: {mean_diagonal_lengths}\n最小值: {min_diagonal_lengths}\n平均值: {max_diagonal_lengths}")
 
-    df_ratios = pd.DataFrame(ratios, columns=['Folder', 'Log Aspect Ratio'])
-    df_diagonal_lengths = pd.DataFrame(diagonal_lengths, columns=['Folder', 'Log Diagonal Length'])
-
     color_map_diagonal = {'train': '#95cdfe', 'val': '#3a63b5', 'test': '#5d97c5'}
     color_map_ratios = {'train': '#dacefe', 'val': '#ad81c1', 'test': '#a398c5'}
 
@@ -204,11 +418,17 @@ if __name__ == "__main__":
     xml_folder = r"G:\目标检测标注数据集\2024河流屏障目标检测数据集分析\YRBD-voc格式\labels"
     metadata_file = r"G:\目标检测标注数据集\2024河流屏障目标检测数据集分析\图片坐标位置\图片对应坐标.xlsx"
 
-    annotations = load_annotations(xml_folder)
-    metadata = load_metadata(metadata_file)
+    # Set to True to refresh only the statistics of files changed since the last run
+    incremental = False
 
-    plot_category_counts(annotations, metadata)
-    plot_object_counts_distribution(annotations)
-    plot_area_frequency(annotations)
-    plot_area_boxplot(annotations)
-    plot_aspect_ratio_diagonal_length(annotations, metadata)
+    metadata = load_metadata(metadata_file)
+    if incremental:
+        plot_incremental_statistics(update_statistics(xml_folder, metadata))
+    else:
+        annotations = join_split(load_annotations(xml_folder), metadata)
+
+        plot_category_counts(annotations)
+        plot_object_counts_distribution(annotations)
+        plot_area_frequency(annotations)
+        plot_area_boxplot(annotations)
+        plot_aspect_ratio_diagonal_length(annotations)
@@ -1,27 +1,69 @@
 # Copyright (c) OpenMMLab. All rights reserved.
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
 import mmcv
 import numpy as np
 import torch
 from mmcv.ops import RoIPool
 from mmcv.parallel import collate, scatter
+from mmcv.utils import print_log
 from mmdet.datasets import replace_ImageToTensor
 from mmdet.datasets.pipelines import Compose
 
 from mmrotate.core import get_multiscale_patch, merge_results, slide_window
 
 
+def _prepare_batch(img, windows, test_pipeline, pin_memory=False):
+    """Run the test pipeline on the windows of a batch and collate them.
+
+    Args:
+        img (np.ndarray): The huge image.
+        windows (np.ndarray): Windows of the batch.
+        test_pipeline (Compose): The test pipeline.
+        pin_memory (bool): Whether to put the images in pinned memory for
+            faster copies to the GPU. Default: False.
+
+    Returns:
+        dict: The collated data of the batch.
+    """
+    patch_datas = [
+        test_pipeline(dict(img=img, win=window.tolist()))
+        for window in windows
+    ]
+    data = collate(patch_datas, samples_per_gpu=len(patch_datas))
+    # just get the actual data from DataContainer
+    data['img_metas'] = [img_metas.data[0] for img_metas in data['img_metas']]
+    data['img'] = [img.data[0] for img in data['img']]
+    if pin_memory:
+        data['img'] = [img.pin_memory() for img in data['img']]
+    return data
+
+
 def inference_detector_by_patches(model,
                                   img,
                                   sizes,
                                   steps,
                                   ratios,
                                   merge_iou_thr,
-                                  bs=1):
+                                  bs=1,
+                                  bucketed_merge=False,
+                                  num_workers=None,
+                                  logger=None):
     """inference patches with the detector.
 
     Split huge image(s) into patches and inference them with the detector.
     Finally, merge patch results on one huge image by nms.
 
+    The patches are prepared by a thread pool: while the model runs on a
+    batch, the following batches are sliced, run through the test pipeline
+    and collated (into pinned memory when the model is on the GPU). At most
+    ``num_workers + 1`` prepared batches are queued at a time, so the pinned
+    memory held is bounded by the worker count rather than the image size.
+
     Args:
         model (nn.Module): The loaded detector.
         img (str | ndarray or): Either an image file or loaded image.
@@ -30,6 +72,13 @@ def inference_detector_by_patches(model,
         ratios (list): Image resizing ratios for multi-scale detecting.
         merge_iou_thr (float): IoU threshold for merging results.
         bs (int): Batch size, must greater than or equal to 1.
+        bucketed_merge (bool): Whether to only run NMS between overlapping
+            bboxes when merging, see :func:`merge_results`. Default: False.
+        num_workers (int, optional): Number of threads preparing batches.
+            Defaults to ``min(4, os.cpu_count())``.
+        logger (logging.Logger | str | None): The way to print the
+            throughput in windows/s. See `mmcv.utils.print_log()` for
+            details. Default: None.
 
     Returns:
         list[np.ndarray]: Detection results.
@@ -37,6 +86,12 @@ def inference_detector_by_patches(model,
     assert bs >= 1, 'The batch size must greater than or equal to 1'
     cfg = model.cfg
     device = next(model.parameters()).device  # model device
+    is_cuda = next(model.parameters()).is_cuda
+    if not is_cuda:
+        for m in model.modules():
+            assert not isinstance(
+                m, RoIPool
+            ), 'CPU inference with RoIPool is not supported currently.'
     cfg = cfg.copy()
     # set loading pipeline type
     cfg.data.test.pipeline[0].type = 'LoadPatchFromImage'
@@ -49,46 +104,45 @@ def inference_detector_by_patches(model,
     sizes, steps = get_multiscale_patch(sizes, steps, ratios)
     windows = slide_window(width, height, sizes, steps)
 
+    num_workers = num_workers or min(4, os.cpu_count() or 1)
+    batches = (windows[i:i + bs] for i in range(0, len(windows), bs))
     results = []
-    start = 0
-    while True:
-        # prepare patch data
-        patch_datas = []
-        if (start + bs) > len(windows):
-            end = len(windows)
-        else:
-            end = start + bs
-        for window in windows[start:end]:
-            data = dict(img=img, win=window.tolist())
-            data = test_pipeline(data)
-            patch_datas.append(data)
-        data = collate(patch_datas, samples_per_gpu=len(patch_datas))
-        # just get the actual data from DataContainer
-        data['img_metas'] = [
-            img_metas.data[0] for img_metas in data['img_metas']
-        ]
-        data['img'] = [img.data[0] for img in data['img']]
-        if next(model.parameters()).is_cuda:
-            # scatter to specified GPU
-            data = scatter(data, [device])[0]
-        else:
-            for m in model.modules():
-                assert not isinstance(
-                    m, RoIPool
-                ), 'CPU inference with RoIPool is not supported currently.'
-
-        # forward the model
-        with torch.no_grad():
-            results.extend(model(return_loss=False, rescale=True, **data))
-
-        if end >= len(windows):
-            break
-        start += bs
+    wait_time = 0.
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(num_workers) as executor:
+        # keep every worker busy while the model runs, with one batch
+        # ready ahead of the model
+        pending = deque(
+            executor.submit(_prepare_batch, img, batch, test_pipeline,
+                            is_cuda)
+            for batch in islice(batches, num_workers + 1))
+        while pending:
+            wait_start = time.perf_counter()
+            data = pending.popleft().result()
+            wait_time += time.perf_counter() - wait_start
+            for batch in islice(batches, 1):
+                pending.append(
+                    executor.submit(_prepare_batch, img, batch, test_pipeline,
+                                    is_cuda))
+            if is_cuda:
+                # scatter to specified GPU
+                data = scatter(data, [device])[0]
+
+            # forward the model
+            with torch.no_grad():
+                results.extend(model(return_loss=False, rescale=True, **data))
+    elapsed = time.perf_counter() - start_time
+    print_log(
+        f'Inferred {len(windows)} windows in {elapsed:.2f} s '
+        f'({len(windows) / max(elapsed, 1e-6):.1f} windows/s, '
+        f'{wait_time:.2f} s waiting for preprocessing)',
+        logger=logger)
 
     results = merge_results(
         results,
         windows[:, :2],
         img_shape=(width, height),
         iou_thr=merge_iou_thr,
-        device=device)
+        device=device,
+        bucketed=bucketed_merge)
     return results
@@ -1,4 +1,5 @@
 # Copyright (c) OpenMMLab. All rights reserved.
+import atexit
 from multiprocessing import get_context
 
 import numpy as np
@@ -8,6 +9,199 @@ from mmcv.utils import print_log
 from mmdet.core import average_precision
 from terminaltables import AsciiTable
 
+# Maximum number of (det, gt) pairs sent to box_iou_rotated at once.
+IOU_CHUNK_SIZE = 1 << 20
+
+# Worker pool kept alive across evaluations, keyed by its number of processes.
+_pool = None
+_pool_nproc = 0
+
+
+def _get_pool(nproc):
+    """Return a long-lived 'spawn' pool with ``nproc`` processes.
+
+    The pool is created on first use and reused by later calls (e.g. the
+    evaluation hook after every epoch), so the cost of spawning workers and
+    importing torch/mmcv in them is only paid once.
+    """
+    global _pool, _pool_nproc
+    if _pool is None or _pool_nproc != nproc:
+        if _pool is not None:
+            _pool.close()
+        _pool = get_context('spawn').Pool(nproc)
+        _pool_nproc = nproc
+    return _pool
+
+
+@atexit.register
+def _close_pool():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+
+
+def match_dets_to_gts(det_bboxes, gt_bboxes, num_dets, num_gts):
+    """Find the best matching gt of every det within its own image.
+
+    The IoUs of all (det, gt) pairs that belong to the same image are
+    computed with a single aligned ``box_iou_rotated`` call (split into
+    chunks of ``IOU_CHUNK_SIZE`` pairs), instead of one call per image.
+
+    Args:
+        det_bboxes (ndarray): Dets of all images, of shape (m, 5) or (m, 6).
+        gt_bboxes (ndarray): Gts of all images, of shape (n, 5).
+        num_dets (ndarray): Number of dets of each image.
+        num_gts (ndarray): Number of gts of each image.
+
+    Returns:
+        tuple[np.ndarray]: (ious_max, ious_argmax) of shape (m, ). The
+            argmax is an index into ``gt_bboxes``; dets of images without
+            gts get an IoU of -1 and an argmax of -1.
+    """
+    num_dets = np.asarray(num_dets, dtype=np.int64)
+    num_gts = np.asarray(num_gts, dtype=np.int64)
+    total_dets = int(num_dets.sum())
+    ious_max = np.full(total_dets, -1, dtype=np.float32)
+    ious_argmax = np.full(total_dets, -1, dtype=np.int64)
+    if total_dets == 0 or gt_bboxes.shape[0] == 0:
+        return ious_max, ious_argmax
+
+    # image index and first gt index of every det, number of pairs per det
+    det_img = np.repeat(np.arange(len(num_dets)), num_dets)
+    gt_start = np.cumsum(num_gts) - num_gts
+    pairs_per_det = num_gts[det_img]
+    pair_det = np.repeat(np.arange(total_dets), pairs_per_det)
+    pair_start = np.cumsum(pairs_per_det) - pairs_per_det
+    pair_gt = (np.repeat(gt_start[det_img], pairs_per_det) +
+               np.arange(pair_det.shape[0]) -
+               np.repeat(pair_start, pairs_per_det))
+
+    dets = torch.from_numpy(np.ascontiguousarray(det_bboxes[:, :5])).float()
+    gts = torch.from_numpy(np.ascontiguousarray(gt_bboxes[:, :5])).float()
+    ious = np.empty(pair_det.shape[0], dtype=np.float32)
+    for i in range(0, pair_det.shape[0], IOU_CHUNK_SIZE):
+        inds = slice(i, i + IOU_CHUNK_SIZE)
+        ious[inds] = box_iou_rotated(
+            dets[torch.from_numpy(pair_det[inds])],
+            gts[torch.from_numpy(pair_gt[inds])],
+            aligned=True).numpy()
+
+    # segment-wise max and first argmax (same tie rule as np.argmax)
+    has_gt = pairs_per_det > 0
+    ious_max[has_gt] = np.maximum.reduceat(ious, pair_start[has_gt])
+    is_max = ious == ious_max[pair_det]
+    first_dets, first_pairs = np.unique(pair_det[is_max], return_index=True)
+    ious_argmax[first_dets] = pair_gt[is_max][first_pairs]
+    return ious_max, ious_argmax
+
+
+def tpfp_rotated(cls_dets,
+                 cls_gts,
+                 cls_gts_ignore=None,
+                 iou_thr=0.5,
+                 area_ranges=None):
+    """Check if the detected bboxes of all images of a class are TP or FP.
+
+    This is the batched version of :func:`tpfp_default`. IoUs are computed
+    once for all images, and the greedy matching (each det, in descending
+    score order, is a TP if its best gt is not ignored and not yet covered)
+    is done with array operations: the first det claiming a gt is the TP.
+    Several IoU thresholds can be evaluated from the same IoUs.
+
+    Args:
+        cls_dets (list[ndarray]): Detected bboxes of each image, of shape
+            (m_i, 6) or (m_i, 5).
+        cls_gts (list[ndarray]): GT bboxes of each image, of shape (n_i, 5).
+        cls_gts_ignore (list[ndarray] | None): Ignored gt bboxes of each
+            image, of shape (k_i, 5). Default: None
+        iou_thr (float | list[float]): IoU threshold(s) to be considered as
+            matched. Default: 0.5.
+        area_ranges (list[tuple] | None): Range of bbox areas to be evaluated,
+            in the format [(min1, max1), (min2, max2), ...]. All ranges are
+            evaluated from the same IoUs and matching. Default: None.
+
+    Returns:
+        tuple[np.ndarray]: (tp, fp, scores). tp and fp are of shape
+            (num_scales, m) with m the total number of dets, sorted by
+            descending score (ties keep the image order), or of shape
+            (num_thrs, num_scales, m) if ``iou_thr`` is a list; scores is
+            the sorted score array of shape (m, ).
+    """
+    if cls_gts_ignore is None:
+        cls_gts_ignore = [np.zeros((0, 5)) for _ in cls_gts]
+    # dets are (m, 6), or (m, 5) with the last column used as the score
+    cls_dets = [np.asarray(dets) for dets in cls_dets]
+    width = max((dets.shape[-1] for dets in cls_dets if dets.ndim == 2),
+                default=6)
+    cls_dets = [dets.reshape(-1, width) for dets in cls_dets]
+    cls_gts_ignore = [np.asarray(gts).reshape(-1, 5) for gts in cls_gts_ignore]
+    # stack gt_bboxes and gt_bboxes_ignore of each image for convenience
+    gt_bboxes = [
+        np.vstack((gts, gts_ignore))
+        for gts, gts_ignore in zip(cls_gts, cls_gts_ignore)
+    ]
+    gt_ignore_inds = np.concatenate([
+        np.concatenate((np.zeros(gts.shape[0], dtype=bool),
+                        np.ones(gts_ignore.shape[0], dtype=bool)))
+        for gts, gts_ignore in zip(cls_gts, cls_gts_ignore)
+    ])
+    num_dets = np.array([dets.shape[0] for dets in cls_dets])
+    num_gts = np.array([gts.shape[0] for gts in gt_bboxes])
+    det_bboxes = np.vstack(cls_dets)
+    gt_bboxes = np.vstack(gt_bboxes)
+
+    if area_ranges is None:
+        area_ranges = [(None, None)]
+    num_scales = len(area_ranges)
+    total_dets = det_bboxes.shape[0]
+
+    ious_max, ious_argmax = match_dets_to_gts(det_bboxes, gt_bboxes,
+                                              num_dets, num_gts)
+    # sort all dets in descending order by scores
+    sort_inds = np.argsort(-det_bboxes[:, -1], kind='stable')
+    ious_max = ious_max[sort_inds]
+    ious_argmax = ious_argmax[sort_inds]
+
+    iou_thrs = np.atleast_1d(iou_thr)
+    tp = np.zeros((len(iou_thrs), num_scales, total_dets), dtype=np.float32)
+    fp = np.zeros((len(iou_thrs), num_scales, total_dets), dtype=np.float32)
+    gt_areas = gt_bboxes[:, 2] * gt_bboxes[:, 3]
+    det_areas = det_bboxes[sort_inds, 2] * det_bboxes[sort_inds, 3]
+    # the best gt of each det does not depend on the threshold, only whether
+    # it is matched does, so every threshold reuses ious_max and ious_argmax
+    for t, thr in enumerate(iou_thrs):
+        matched = ious_max >= thr
+        # dets matched to an ignored gt are neither tp nor fp
+        claims = matched.copy()
+        claims[matched] = ~gt_ignore_inds[ious_argmax[matched]]
+        # the first (highest scoring) det claiming a gt covers it
+        first = np.zeros(total_dets, dtype=bool)
+        _, first_inds = np.unique(ious_argmax[claims], return_index=True)
+        first[np.flatnonzero(claims)[first_inds]] = True
+
+        # all scales share the matching above: the dets claiming a gt are
+        # the same in every scale, only whether that gt is counted depends
+        # on its area, so each scale is a mask over the same IoU results
+        for k, (min_area, max_area) in enumerate(area_ranges):
+            if min_area is None:
+                counted = claims
+                unmatched_fp = ~matched
+            else:
+                gt_area_ignore = (gt_areas < min_area) | (
+                    gt_areas >= max_area)
+                counted = claims.copy()
+                counted[claims] = ~gt_area_ignore[ious_argmax[claims]]
+                # unmatched dets are fp only when within the area range
+                unmatched_fp = ~matched & (det_areas >= min_area) & (
+                    det_areas < max_area)
+            tp[t, k, counted & first] = 1
+            fp[t, k, counted & ~first] = 1
+            fp[t, k, unmatched_fp] = 1
+    if np.ndim(iou_thr) == 0:
+        tp, fp = tp[0], fp[0]
+    return tp, fp, det_bboxes[sort_inds, -1]
+
 
 def tpfp_default(det_bboxes,
                  gt_bboxes,
@@ -21,77 +215,26 @@ def tpfp_default(det_bboxes,
         gt_bboxes (ndarray): GT bboxes of this image, of shape (n, 5).
         gt_bboxes_ignore (ndarray): Ignored gt bboxes of this image,
             of shape (k, 5). Default: None
-        iou_thr (float): IoU threshold to be considered as matched.
-            Default: 0.5.
+        iou_thr (float | list[float]): IoU threshold(s) to be considered as
+            matched. Default: 0.5.
         area_ranges (list[tuple] | None): Range of bbox areas to be evaluated,
             in the format [(min1, max1), (min2, max2), ...]. Default: None.
 
     Returns:
         tuple[np.ndarray]: (tp, fp) whose elements are 0 and 1. The shape of
-            each array is (num_scales, m).
+            each array is (num_scales, m), or (num_thrs, num_scales, m) if
+            ``iou_thr`` is a list.
     """
-    # an indicator of ignored gts
-    det_bboxes = np.array(det_bboxes)
-    gt_ignore_inds = np.concatenate(
-        (np.zeros(gt_bboxes.shape[0],
-                  dtype=bool), np.ones(gt_bboxes_ignore.shape[0], dtype=bool)))
-    # stack gt_bboxes and gt_bboxes_ignore for convenience
-    gt_bboxes = np.vstack((gt_bboxes, gt_bboxes_ignore))
-
-    num_dets = det_bboxes.shape[0]
-    num_gts = gt_bboxes.shape[0]
-    if area_ranges is None:
-        area_ranges = [(None, None)]
-    num_scales = len(area_ranges)
-    # tp and fp are of shape (num_scales, num_gts), each row is tp or fp of
-    # a certain scale
-    tp = np.zeros((num_scales, num_dets), dtype=np.float32)
-    fp = np.zeros((num_scales, num_dets), dtype=np.float32)
-
-    # if there is no gt bboxes in this image, then all det bboxes
-    # within area range are false positives
-    if gt_bboxes.shape[0] == 0:
-        if area_ranges == [(None, None)]:
-            fp[...] = 1
-        else:
-            raise NotImplementedError
-        return tp, fp
-
-    ious = box_iou_rotated(
-        torch.from_numpy(det_bboxes).float(),
-        torch.from_numpy(gt_bboxes).float()).numpy()
-    # for each det, the max iou with all gts
-    ious_max = ious.max(axis=1)
-    # for each det, which gt overlaps most with it
-    ious_argmax = ious.argmax(axis=1)
-    # sort all dets in descending order by scores
-    sort_inds = np.argsort(-det_bboxes[:, -1])
-    for k, (min_area, max_area) in enumerate(area_ranges):
-        gt_covered = np.zeros(num_gts, dtype=bool)
-        # if no area range is specified, gt_area_ignore is all False
-        if min_area is None:
-            gt_area_ignore = np.zeros_like(gt_ignore_inds, dtype=bool)
-        else:
-            raise NotImplementedError
-        for i in sort_inds:
-            if ious_max[i] >= iou_thr:
-                matched_gt = ious_argmax[i]
-                if not (gt_ignore_inds[matched_gt]
-                        or gt_area_ignore[matched_gt]):
-                    if not gt_covered[matched_gt]:
-                        gt_covered[matched_gt] = True
-                        tp[k, i] = 1
-                    else:
-                        fp[k, i] = 1
-                # otherwise ignore this detected bbox, tp = 0, fp = 0
-            elif min_area is None:
-                fp[k, i] = 1
-            else:
-                bbox = det_bboxes[i, :5]
-                area = bbox[2] * bbox[3]
-                if area >= min_area and area < max_area:
-                    fp[k, i] = 1
-    return tp, fp
+    det_bboxes = np.array(det_bboxes).reshape(-1, 6)
+    if gt_bboxes_ignore is None:
+        gt_bboxes_ignore = np.zeros((0, 5))
+    tp, fp, _ = tpfp_rotated([det_bboxes], [gt_bboxes], [gt_bboxes_ignore],
+                             iou_thr, area_ranges)
+    # restore the input order of the dets
+    sort_inds = np.argsort(-det_bboxes[:, -1], kind='stable')
+    restore_inds = np.empty_like(sort_inds)
+    restore_inds[sort_inds] = np.arange(sort_inds.shape[0])
+    return tp[..., restore_inds], fp[..., restore_inds]
 
 
 def get_cls_results(det_results, annotations, class_id):
@@ -118,7 +261,7 @@ def get_cls_results(det_results, annotations, class_id):
             cls_gts_ignore.append(ann['bboxes_ignore'][ignore_inds, :])
 
         else:
-            cls_gts_ignore.append(torch.zeros((0, 5), dtype=torch.float64))
+            cls_gts_ignore.append(np.zeros((0, 5), dtype=np.float64))
 
     return cls_dets, cls_gts, cls_gts_ignore
 
@@ -148,102 +291,115 @@ def eval_rbbox_map(det_results,
             in the format [(min1, max1), (min2, max2), ...]. A range of
             (32, 64) means the area range between (32**2, 64**2).
             Default: None.
-        iou_thr (float): IoU threshold to be considered as matched.
-            Default: 0.5.
+        iou_thr (float | list[float]): IoU threshold to be considered as
+            matched. If a list is given, e.g. ``np.arange(0.5, 0.96, 0.05)``
+            for AP50:95, the IoUs are computed once and every threshold is
+            evaluated from them. Default: 0.5.
         use_07_metric (bool): Whether to use the voc07 metric.
         dataset (list[str] | str | None): Dataset name or dataset classes,
             there are minor differences in metrics for different datasets, e.g.
             "voc07", "imagenet_det", etc. Default: None.
         logger (logging.Logger | str | None): The way to print the mAP
             summary. See `mmcv.utils.print_log()` for details. Default: None.
-        nproc (int): Processes used for computing TP and FP.
+        nproc (int): Processes used for computing TP and FP, one class per
+            task. The pool is kept alive and reused by later calls with the
+            same ``nproc``; 1 computes everything in the calling process.
             Default: 4.
 
     Returns:
-        tuple: (mAP, [dict, dict, ...])
+        tuple: (mAP, [dict, dict, ...]). If ``iou_thr`` is a list, both are
+            lists with one entry per threshold.
     """
     assert len(det_results) == len(annotations)
+    iou_thrs = np.atleast_1d(iou_thr).tolist()
 
-    num_imgs = len(det_results)
     num_scales = len(scale_ranges) if scale_ranges is not None else 1
     num_classes = len(det_results[0])  # positive class num
     area_ranges = ([(rg[0]**2, rg[1]**2) for rg in scale_ranges]
                    if scale_ranges is not None else None)
 
-    pool = get_context('spawn').Pool(nproc)
-    eval_results = []
-    for i in range(num_classes):
-        # get gt and det bboxes of this class
-        cls_dets, cls_gts, cls_gts_ignore = get_cls_results(
-            det_results, annotations, i)
-
-        # compute tp and fp for each image with multiple processes
-        tpfp = pool.starmap(
-            tpfp_default,
-            zip(cls_dets, cls_gts, cls_gts_ignore,
-                [iou_thr for _ in range(num_imgs)],
-                [area_ranges for _ in range(num_imgs)]))
-        tp, fp = tuple(zip(*tpfp))
-        # calculate gt number of each scale
-        # ignored gts or gts beyond the specific scale are not counted
-        num_gts = np.zeros(num_scales, dtype=int)
-        for _, bbox in enumerate(cls_gts):
-            if area_ranges is None:
-                num_gts[0] += bbox.shape[0]
-            else:
-                gt_areas = bbox[:, 2] * bbox[:, 3]
-                for k, (min_area, max_area) in enumerate(area_ranges):
-                    num_gts[k] += np.sum((gt_areas >= min_area)
-                                         & (gt_areas < max_area))
-        # sort all det bboxes by score, also sort tp and fp
-        cls_dets = np.vstack(cls_dets)
-        num_dets = cls_dets.shape[0]
-        sort_inds = np.argsort(-cls_dets[:, -1])
-        tp = np.hstack(tp)[:, sort_inds]
-        fp = np.hstack(fp)[:, sort_inds]
-        # calculate recall and precision with tp and fp
-        tp = np.cumsum(tp, axis=1)
-        fp = np.cumsum(fp, axis=1)
-        eps = np.finfo(np.float32).eps
-        recalls = tp / np.maximum(num_gts[:, np.newaxis], eps)
-        precisions = tp / np.maximum((tp + fp), eps)
-        # calculate AP
-        if scale_ranges is None:
-            recalls = recalls[0, :]
-            precisions = precisions[0, :]
-            num_gts = num_gts.item()
-        mode = 'area' if not use_07_metric else '11points'
-        ap = average_precision(recalls, precisions, mode)
-        eval_results.append({
-            'num_gts': num_gts,
-            'num_dets': num_dets,
-            'recall': recalls,
-            'precision': precisions,
-            'ap': ap
-        })
-    pool.close()
-    if scale_ranges is not None:
-        # shape (num_classes, num_scales)
-        all_ap = np.vstack([cls_result['ap'] for cls_result in eval_results])
-        all_num_gts = np.vstack(
-            [cls_result['num_gts'] for cls_result in eval_results])
-        mean_ap = []
-        for i in range(num_scales):
-            if np.any(all_num_gts[:, i] > 0):
-                mean_ap.append(all_ap[all_num_gts[:, i] > 0, i].mean())
-            else:
-                mean_ap.append(0.0)
+    # compute tp and fp of every class; each task covers all images of a
+    # class, so the IoUs of a class are computed in one batched pass that
+    # serves all thresholds
+    tasks = [
+        get_cls_results(det_results, annotations, i) + (iou_thrs, area_ranges)
+        for i in range(num_classes)
+    ]
+    if nproc > 1 and num_classes > 1:
+        tpfp = _get_pool(min(nproc, num_classes)).starmap(tpfp_rotated, tasks)
     else:
-        aps = []
-        for cls_result in eval_results:
-            if cls_result['num_gts'] > 0:
-                aps.append(cls_result['ap'])
-        mean_ap = np.array(aps).mean().item() if aps else 0.0
-
-    print_map_summary(
-        mean_ap, eval_results, dataset, area_ranges, logger=logger)
-
-    return mean_ap, eval_results
+        tpfp = [tpfp_rotated(*task) for task in tasks]
+
+    # calculate gt number of each scale
+    # ignored gts or gts beyond the specific scale are not counted
+    cls_num_gts = []
+    for _, cls_gts, _, _, _ in tasks:
+        gt_areas = np.concatenate(
+            [bbox[:, 2] * bbox[:, 3] for bbox in cls_gts])
+        if area_ranges is None:
+            num_gts = np.array([gt_areas.shape[0]], dtype=int)
+        else:
+            min_areas, max_areas = np.array(area_ranges, dtype=float).T
+            num_gts = np.sum((gt_areas >= min_areas[:, None]) &
+                             (gt_areas < max_areas[:, None]),
+                             axis=1)
+        cls_num_gts.append(num_gts)
+
+    mean_aps, thr_results = [], []
+    for t, thr in enumerate(iou_thrs):
+        eval_results = []
+        for num_gts, (tp, fp, _) in zip(cls_num_gts, tpfp):
+            num_dets = tp.shape[2]
+            # tp and fp are already sorted by score
+            # calculate recall and precision with tp and fp
+            tp = np.cumsum(tp[t], axis=1)
+            fp = np.cumsum(fp[t], axis=1)
+            eps = np.finfo(np.float32).eps
+            recalls = tp / np.maximum(num_gts[:, np.newaxis], eps)
+            precisions = tp / np.maximum((tp + fp), eps)
+            # calculate AP
+            if scale_ranges is None:
+                recalls = recalls[0, :]
+                precisions = precisions[0, :]
+                num_gts = num_gts.item()
+            mode = 'area' if not use_07_metric else '11points'
+            ap = average_precision(recalls, precisions, mode)
+            eval_results.append({
+                'num_gts': num_gts,
+                'num_dets': num_dets,
+                'recall': recalls,
+                'precision': precisions,
+                'ap': ap
+            })
+        if scale_ranges is not None:
+            # shape (num_classes, num_scales)
+            all_ap = np.vstack(
+                [cls_result['ap'] for cls_result in eval_results])
+            all_num_gts = np.vstack(
+                [cls_result['num_gts'] for cls_result in eval_results])
+            mean_ap = []
+            for i in range(num_scales):
+                if np.any(all_num_gts[:, i] > 0):
+                    mean_ap.append(all_ap[all_num_gts[:, i] > 0, i].mean())
+                else:
+                    mean_ap.append(0.0)
+        else:
+            aps = []
+            for cls_result in eval_results:
+                if cls_result['num_gts'] > 0:
+                    aps.append(cls_result['ap'])
+            mean_ap = np.array(aps).mean().item() if aps else 0.0
+
+        if len(iou_thrs) > 1:
+            print_log(f'\n{"-" * 15}iou_thr: {thr}{"-" * 15}', logger=logger)
+        print_map_summary(
+            mean_ap, eval_results, dataset, area_ranges, logger=logger)
+        mean_aps.append(mean_ap)
+        thr_results.append(eval_results)
+
+    if np.ndim(iou_thr) == 0:
+        return mean_aps[0], thr_results[0]
+    return mean_aps, thr_results
 
 
 def print_map_summary(mean_ap,
@@ -66,7 +66,102 @@ def map_masks(masks, offset, new_shape):
     return mapped
 
 
-def merge_results(results, offsets, img_shape, iou_thr=0.1, device='cpu'):
+def overlap_groups(bboxes):
+    """Group bboxes whose horizontal bounding boxes overlap transitively.
+
+    Two bboxes can only have a positive IoU if their horizontal bounding
+    boxes overlap, so NMS never acts across groups. Overlapping pairs are
+    found by sorting the boxes by their left edge, and the groups are the
+    connected components of these pairs.
+
+    Args:
+        bboxes (np.ndarray): Horizontal bboxes of shape (n, 4) in
+            (x1, y1, x2, y2) format or rotated bboxes of shape (n, 5) in
+            (x, y, w, h, theta) format.
+
+    Returns:
+        np.ndarray: Group label of each bbox, i.e. the smallest index of the
+            bboxes in its group, with shape being (n, ).
+    """
+    num_bboxes = bboxes.shape[0]
+    if bboxes.shape[1] == 4:
+        hbbs = bboxes
+    else:
+        x, y, w, h, theta = bboxes[:, :5].T
+        cos, sin = np.abs(np.cos(theta)), np.abs(np.sin(theta))
+        half_w, half_h = (w * cos + h * sin) / 2, (w * sin + h * cos) / 2
+        hbbs = np.stack([x - half_w, y - half_h, x + half_w, y + half_h],
+                        axis=1)
+
+    # pairs (i, j) with the left edge of j within the x extent of i
+    order = np.argsort(hbbs[:, 0], kind='stable')
+    hbbs = hbbs[order]
+    ends = np.searchsorted(hbbs[:, 0], hbbs[:, 2], side='right')
+    counts = np.maximum(ends - np.arange(num_bboxes) - 1, 0)
+    first = np.repeat(np.arange(num_bboxes), counts)
+    second = first + 1 + np.arange(counts.sum()) - np.repeat(
+        np.cumsum(counts) - counts, counts)
+    y_overlap = (hbbs[first, 1] <= hbbs[second, 3]) & (
+        hbbs[second, 1] <= hbbs[first, 3])
+    first, second = order[first[y_overlap]], order[second[y_overlap]]
+
+    # min label propagation with pointer jumping
+    labels = np.arange(num_bboxes)
+    while True:
+        new_labels = labels.copy()
+        min_labels = np.minimum(labels[first], labels[second])
+        np.minimum.at(new_labels, first, min_labels)
+        np.minimum.at(new_labels, second, min_labels)
+        new_labels = new_labels[new_labels]
+        if np.array_equal(new_labels, labels):
+            return labels
+        labels = new_labels
+
+
+def bucketed_nms(dets, iou_thr, device='cpu'):
+    """NMS only between bboxes that can overlap.
+
+    Bboxes overlapping no other bbox are kept directly, and NMS is run
+    separately on each group of :func:`overlap_groups`, so the work scales
+    with the number of overlapping bboxes instead of the square of all
+    bboxes. The result is the same as one NMS over all bboxes.
+
+    Args:
+        dets (np.ndarray): Bboxes with scores, of shape (n, 5) or (n, 6).
+        iou_thr (float): The IoU threshold of NMS.
+        device (str): The device to call nms.
+
+    Returns:
+        tuple[np.ndarray]: (dets, keeps). The kept bboxes sorted by score in
+            descending order and their indices.
+    """
+    nms_func = nms if dets.shape[1] == 5 else nms_rotated
+    labels = overlap_groups(dets[:, :-1])
+    group_sizes = np.bincount(labels, minlength=labels.shape[0])
+
+    keeps = [np.flatnonzero(group_sizes[labels] == 1)]
+    grouped = np.flatnonzero(group_sizes[labels] > 1)
+    grouped = grouped[np.argsort(labels[grouped], kind='stable')]
+    if grouped.size > 0:
+        dets_tensor = torch.from_numpy(dets[grouped]).to(device)
+        bounds = np.flatnonzero(np.diff(labels[grouped])) + 1
+        starts = np.concatenate([[0], bounds])
+        ends = np.concatenate([bounds, [grouped.shape[0]]])
+        for start, end in zip(starts, ends):
+            _, keep = nms_func(dets_tensor[start:end, :-1],
+                               dets_tensor[start:end, -1], iou_thr)
+            keeps.append(grouped[start + keep.cpu().numpy()])
+    keeps = np.concatenate(keeps)
+    keeps = keeps[np.argsort(-dets[keeps, -1], kind='stable')]
+    return dets[keeps], keeps
+
+
+def merge_results(results,
+                  offsets,
+                  img_shape,
+                  iou_thr=0.1,
+                  device='cpu',
+                  bucketed=False):
     """Merge patch results via nms.
 
     Args:
@@ -75,6 +170,10 @@ def merge_results(results, offsets, img_shape, iou_thr=0.1, device='cpu'):
         img_shape (tuple): A tuple of the huge image's width and height.
         iou_thr (float): The IoU threshold of NMS.
         device (str): The device to call nms.
+        bucketed (bool): Whether to use :func:`bucketed_nms`, which keeps
+            isolated bboxes directly and only runs NMS within groups of
+            overlapping bboxes (e.g. in the overlaps of patches). It is
+            much faster for huge images with many bboxes. Default: False.
 
     Retunrns:
         list[np.ndarray]: Detection results after merging.
@@ -111,6 +210,11 @@ def merge_results(results, offsets, img_shape, iou_thr=0.1, device='cpu'):
             merged_bboxes.append(dets_per_cls)
             if with_mask:
                 merged_masks.append(masks_per_cls)
+        elif bucketed:
+            nms_dets, keeps = bucketed_nms(dets_per_cls, iou_thr, device)
+            merged_bboxes.append(nms_dets)
+            if with_mask:
+                merged_masks.append([masks_per_cls[i] for i in keeps])
         else:
             dets_per_cls = torch.from_numpy(dets_per_cls).to(device)
             nms_func = nms if dets_per_cls.size(1) == 5 else nms_rotated
@@ -73,3 +73,104 @@ def slide_window(width, height, sizes, steps, img_rate_thr=0.6):
     if not (img_rates >= img_rate_thr).any():
         img_rates[img_rates == img_rates.max()] = 1
     return windows[img_rates >= img_rate_thr]
+
+
+def clip_polys_by_rects(polys, rects):
+    """Clip polygons by axis-aligned rectangles (Sutherland-Hodgman).
+
+    The i-th polygon is clipped by the i-th rectangle, all pairs are clipped
+    at once against the left, top, right and bottom edges in turn.
+
+    Args:
+        polys (np.array): Polygons with shape (N, V, 2).
+        rects (np.array): Rectangles in (l, t, r, b) format with shape (N, 4).
+
+    Returns:
+        tuple[np.array]: Vertices of the clipped polygons with shape (N, M, 2)
+            and the number of valid vertices of each polygon with shape (N, ).
+    """
+    pts = polys.astype(np.float64)
+    nums = np.full(pts.shape[0], pts.shape[1])
+    rects = rects.astype(np.float64)
+    # signed distances to the left, top, right and bottom edges, positive
+    # inside the rectangle
+    for axis, sign, bound in ((0, 1, rects[:, 0]), (1, 1, rects[:, 1]),
+                              (0, -1, rects[:, 2]), (1, -1, rects[:, 3])):
+        if pts.shape[1] == 0:
+            break
+        inds = np.arange(pts.shape[1])
+        valid = inds < nums[:, None]
+        prev_inds = np.where(inds == 0, nums[:, None] - 1, inds - 1)
+        prev_inds = np.where(valid, prev_inds, 0)
+        prev = np.take_along_axis(pts, prev_inds[..., None], axis=1)
+
+        dist = sign * (pts[..., axis] - bound[:, None])
+        prev_dist = np.take_along_axis(dist, prev_inds, axis=1)
+        inside, prev_inside = dist >= 0, prev_dist >= 0
+        # the crossing point is only used where the edge crosses the line
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = prev_dist / (prev_dist - dist)
+            cross = prev + t[..., None] * (pts - prev)
+
+        # each edge (prev -> cur) emits its crossing point and/or cur
+        emit = np.stack([inside != prev_inside, inside], axis=-1) & valid[
+            ..., None]
+        cands = np.stack([cross, pts], axis=2).reshape(pts.shape[0], -1, 2)
+        emit = emit.reshape(pts.shape[0], -1)
+        nums = emit.sum(axis=1)
+        out = np.zeros((pts.shape[0], nums.max(initial=0), 2))
+        rows, cols = np.nonzero(emit)
+        out[rows, np.cumsum(emit, axis=1)[rows, cols] - 1] = cands[rows, cols]
+        pts = out
+    return pts, nums
+
+
+def poly_areas(pts, nums):
+    """Compute the areas of polygons with the shoelace formula.
+
+    Args:
+        pts (np.array): Vertices of polygons with shape (N, M, 2).
+        nums (np.array): Number of valid vertices of each polygon.
+
+    Returns:
+        np.array: Areas with shape (N, ).
+    """
+    if pts.shape[1] == 0:
+        return np.zeros(pts.shape[0])
+    pts = pts.astype(np.float64)
+    inds = np.arange(pts.shape[1])
+    valid = inds < nums[:, None]
+    next_inds = np.where(inds + 1 < nums[:, None], inds + 1, 0)
+    nxt = np.take_along_axis(pts, next_inds[..., None], axis=1)
+    cross = pts[..., 0] * nxt[..., 1] - nxt[..., 0] * pts[..., 1]
+    return np.abs(np.where(valid, cross, 0).sum(axis=1)) / 2
+
+
+def poly_window_iof(polys, windows, eps=1e-6):
+    """Compute the overlaps of polygons and windows divided by the polygon
+    areas (iof).
+
+    Args:
+        polys (np.ndarray): Polygons with shape (N, 8).
+        windows (np.ndarray): Windows in (l, t, r, b) format with shape
+            (M, 4).
+        eps (float, optional): Defaults to 1e-6.
+
+    Returns:
+        np.ndarray: IoFs with shape (N, M).
+    """
+    rows, cols = polys.shape[0], windows.shape[0]
+    if rows * cols == 0:
+        return np.zeros((rows, cols), dtype=np.float32)
+
+    polys = polys.reshape(rows, -1, 2)
+    hbbs = np.concatenate([polys.min(axis=1), polys.max(axis=1)], axis=1)
+    lt = np.maximum(hbbs[:, None, :2], windows[..., :2])
+    rb = np.minimum(hbbs[:, None, 2:], windows[..., 2:])
+    inds1, inds2 = np.nonzero((rb > lt).all(axis=-1))
+
+    overlaps = np.zeros((rows, cols))
+    overlaps[inds1, inds2] = poly_areas(
+        *clip_polys_by_rects(polys[inds1], windows[inds2]))
+    areas = poly_areas(polys, np.full(rows, polys.shape[1]))
+    return overlaps / np.clip(areas, eps, np.inf)[:, None]
@@ -1,8 +1,12 @@
 # Copyright (c) OpenMMLab. All rights reserved.
 from .builder import build_dataset  # noqa: F401, F403
 from .dota import DOTADataset  # noqa: F401, F403
+from .dota_patch import DOTAPatchDataset  # noqa: F401, F403
 from .hrsc import HRSCDataset  # noqa: F401, F403
 from .pipelines import *  # noqa: F401, F403
 from .sar import SARDataset  # noqa: F401, F403
 
-__all__ = ['SARDataset', 'DOTADataset', 'build_dataset', 'HRSCDataset']
+__all__ = [
+    'SARDataset', 'DOTADataset', 'DOTAPatchDataset', 'build_dataset',
+    'HRSCDataset'
+]
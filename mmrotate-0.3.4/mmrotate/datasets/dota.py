@@ -1,12 +1,15 @@
 # Copyright (c) OpenMMLab. All rights reserved.
 import glob
+import hashlib
 import os
 import os.path as osp
 import re
 import tempfile
 import time
+import warnings
 import zipfile
-from collections import defaultdict
+from collections import Counter, OrderedDict, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
 from functools import partial
 
 import mmcv
@@ -18,6 +21,11 @@ from mmdet.datasets.custom import CustomDataset
 from mmrotate.core import eval_rbbox_map, obb2poly_np, poly2obb_np
 from .builder import ROTATED_DATASETS
 
+# offsets of a patch in its original image, e.g. P0000__1024__0___824
+PATCH_OFFSET_PATTERN = re.compile(r'__(\d+)___(\d+)')
+# version of the cached annotation index, bump it when the format changes
+ANN_CACHE_VERSION = '1.0'
+
 
 @ROTATED_DATASETS.register_module()
 class DOTADataset(CustomDataset):
@@ -28,6 +36,13 @@ class DOTADataset(CustomDataset):
         pipeline (list[dict]): Processing pipeline.
         version (str, optional): Angle representations. Defaults to 'oc'.
         difficulty (bool, optional): The difficulty threshold of GT.
+        ann_cache (bool | str, optional): Path of the cached annotation
+            index, e.g. under the work dir. The index is rebuilt when the
+            annotation files or the parsing options change. If True, it is
+            saved as ``<ann_file>.cache.pkl``; if False, annotations are
+            parsed every time. Defaults to False.
+        ann_nproc (int, optional): Processes used to parse the annotation
+            files when the index is built. Defaults to 4.
     """
     CLASSES = ('plane', 'baseball-diamond', 'bridge', 'ground-track-field',
                'small-vehicle', 'large-vehicle', 'ship', 'tennis-court',
@@ -44,9 +59,13 @@ class DOTADataset(CustomDataset):
                  pipeline,
                  version='oc',
                  difficulty=100,
+                 ann_cache=False,
+                 ann_nproc=4,
                  **kwargs):
         self.version = version
         self.difficulty = difficulty
+        self.ann_cache = ann_cache
+        self.ann_nproc = ann_nproc
 
         super(DOTADataset, self).__init__(ann_file, pipeline, **kwargs)
 
@@ -62,7 +81,7 @@ class DOTADataset(CustomDataset):
         cls_map = {c: i
                    for i, c in enumerate(self.CLASSES)
                    }  # in mmdet v2.0 label is 0-based
-        ann_files = glob.glob(ann_folder + '/*.txt')
+        ann_files = sorted(glob.glob(ann_folder + '/*.txt'))
         data_infos = []
         if not ann_files:  # test phase
             ann_files = glob.glob(ann_folder + '/*.png')
@@ -76,75 +95,77 @@ class DOTADataset(CustomDataset):
                 data_info['ann']['labels'] = []
                 data_infos.append(data_info)
         else:
-            for ann_file in ann_files:
-                data_info = {}
-                img_id = osp.split(ann_file)[1][:-4]
-                img_name = img_id + '.png'
-                data_info['filename'] = img_name
-                data_info['ann'] = {}
-                gt_bboxes = []
-                gt_labels = []
-                gt_polygons = []
-                gt_bboxes_ignore = []
-                gt_labels_ignore = []
-                gt_polygons_ignore = []
-
-                if os.path.getsize(ann_file) == 0 and self.filter_empty_gt:
-                    continue
-
-                with open(ann_file) as f:
-                    s = f.readlines()
-                    for si in s:
-                        bbox_info = si.split()
-                        poly = np.array(bbox_info[:8], dtype=np.float32)
-                        try:
-                            x, y, w, h, a = poly2obb_np(poly, self.version)
-                        except:  # noqa: E722
-                            continue
-                        cls_name = bbox_info[8]
-                        difficulty = int(bbox_info[9])
-                        label = cls_map[cls_name]
-                        if difficulty > self.difficulty:
-                            pass
-                        else:
-                            gt_bboxes.append([x, y, w, h, a])
-                            gt_labels.append(label)
-                            gt_polygons.append(poly)
-
-                if gt_bboxes:
-                    data_info['ann']['bboxes'] = np.array(
-                        gt_bboxes, dtype=np.float32)
-                    data_info['ann']['labels'] = np.array(
-                        gt_labels, dtype=np.int64)
-                    data_info['ann']['polygons'] = np.array(
-                        gt_polygons, dtype=np.float32)
-                else:
-                    data_info['ann']['bboxes'] = np.zeros((0, 5),
-                                                          dtype=np.float32)
-                    data_info['ann']['labels'] = np.array([], dtype=np.int64)
-                    data_info['ann']['polygons'] = np.zeros((0, 8),
-                                                            dtype=np.float32)
-
-                if gt_polygons_ignore:
-                    data_info['ann']['bboxes_ignore'] = np.array(
-                        gt_bboxes_ignore, dtype=np.float32)
-                    data_info['ann']['labels_ignore'] = np.array(
-                        gt_labels_ignore, dtype=np.int64)
-                    data_info['ann']['polygons_ignore'] = np.array(
-                        gt_polygons_ignore, dtype=np.float32)
+            cache_file = self.ann_cache
+            if cache_file is True:
+                cache_file = osp.normpath(ann_folder) + '.cache.pkl'
+            # the index depends on the files and on how they are parsed
+            key = self._ann_index_key(ann_files, cls_map)
+            cache = self._load_ann_index(cache_file, key)
+            if cache is not None:
+                data_infos = cache['data_infos']
+            else:
+                parse = partial(
+                    _load_ann_file,
+                    cls_map=cls_map,
+                    version=self.version,
+                    difficulty=self.difficulty,
+                    filter_empty_gt=self.filter_empty_gt)
+                nproc = min(self.ann_nproc, os.cpu_count() or 1)
+                if nproc > 1:
+                    with ProcessPoolExecutor(nproc) as executor:
+                        data_infos = list(
+                            executor.map(parse, ann_files, chunksize=256))
                 else:
-                    data_info['ann']['bboxes_ignore'] = np.zeros(
-                        (0, 5), dtype=np.float32)
-                    data_info['ann']['labels_ignore'] = np.array(
-                        [], dtype=np.int64)
-                    data_info['ann']['polygons_ignore'] = np.zeros(
-                        (0, 8), dtype=np.float32)
-
-                data_infos.append(data_info)
+                    data_infos = list(map(parse, ann_files))
+                data_infos = [info for info in data_infos if info is not None]
+                if cache_file:
+                    self._save_ann_index(
+                        cache_file,
+                        dict(
+                            version=ANN_CACHE_VERSION,
+                            key=key,
+                            data_infos=data_infos))
 
         self.img_ids = [*map(lambda x: x['filename'][:-4], data_infos)]
         return data_infos
 
+    def _load_ann_index(self, cache_file, key):
+        """Load the cached annotation index, or None if there is none or it
+        is stale."""
+        if not cache_file or not osp.exists(cache_file):
+            return None
+        cache = mmcv.load(cache_file, file_format='pkl')
+        if cache.get('version') != ANN_CACHE_VERSION or \
+                cache.get('key') != key:
+            return None
+        return cache
+
+    def _ann_index_key(self, ann_files, cls_map):
+        """Hash the annotation files (paths, sizes and modification times)
+        and the parsing options."""
+        md5 = hashlib.md5(
+            repr((self.version, self.difficulty, self.filter_empty_gt,
+                  cls_map)).encode())
+        for ann_file in ann_files:
+            stat = os.stat(ann_file)
+            md5.update(
+                f'{ann_file}{stat.st_size}{stat.st_mtime_ns}'.encode())
+        return md5.hexdigest()
+
+    @staticmethod
+    def _save_ann_index(cache_file, cache):
+        """Save the annotation index, skipping unwritable folders."""
+        tmp_file = f'{cache_file}.{os.getpid()}.tmp'
+        try:
+            mmcv.mkdir_or_exist(osp.dirname(osp.abspath(cache_file)))
+            mmcv.dump(cache, tmp_file, file_format='pkl')
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            warnings.warn(
+                f'Failed to save the annotation index {cache_file}: {e}')
+            if osp.exists(tmp_file):
+                os.remove(tmp_file)
+
     def _filter_imgs(self):
         """Filter images without ground truths."""
         valid_inds = []
@@ -179,9 +200,11 @@ class DOTADataset(CustomDataset):
             proposal_nums (Sequence[int]): Proposal number used for evaluating
                 recalls, such as recall@100, recall@1000.
                 Default: (100, 300, 1000).
-            iou_thr (float | list[float]): IoU threshold. It must be a float
-                when evaluating mAP, and can be a list when evaluating recall.
-                Default: 0.5.
+            iou_thr (float | list[float]): IoU threshold. If a list is given,
+                e.g. [0.5, 0.55, ..., 0.95], all thresholds are evaluated from
+                one IoU computation, ``APxx`` is reported for each of them
+                and ``mAP`` is their mean. With ``scale_ranges``, each of them
+                is a list over the scales. Default: 0.5.
             scale_ranges (list[tuple] | None): Scale ranges for evaluating mAP.
                 Default: None.
             nproc (int): Processes used for computing TP and FP.
@@ -195,9 +218,8 @@ class DOTADataset(CustomDataset):
         if metric not in allowed_metrics:
             raise KeyError(f'metric {metric} is not supported')
         annotations = [self.get_ann_info(i) for i in range(len(self))]
-        eval_results = {}
+        eval_results = OrderedDict()
         if metric == 'mAP':
-            assert isinstance(iou_thr, float)
             mean_ap, _ = eval_rbbox_map(
                 results,
                 annotations,
@@ -206,7 +228,16 @@ class DOTADataset(CustomDataset):
                 dataset=self.CLASSES,
                 logger=logger,
                 nproc=nproc)
-            eval_results['mAP'] = mean_ap
+            if np.ndim(iou_thr) == 0:
+                eval_results['mAP'] = mean_ap
+            else:
+                # (num_thrs, ) or (num_thrs, num_scales) with scale_ranges
+                mean_ap = np.array(mean_ap)
+                for thr, thr_mean_ap in zip(iou_thr, mean_ap):
+                    eval_results[f'AP{int(round(thr * 100)):02d}'] = np.round(
+                        thr_mean_ap, 3).tolist()
+                eval_results['mAP'] = mean_ap.mean(axis=0).tolist()
+                eval_results.move_to_end('mAP', last=False)
         else:
             raise NotImplementedError
 
@@ -219,47 +250,70 @@ class DOTADataset(CustomDataset):
             results (list): Testing results of the dataset.
             nproc (int): number of process. Default: 4.
         """
-        collector = defaultdict(list)
-        for idx in range(len(self)):
-            result = results[idx]
-            img_id = self.img_ids[idx]
-            splitname = img_id.split('__')
-            oriname = splitname[0]
-            pattern1 = re.compile(r'__\d+___\d+')
-            x_y = re.findall(pattern1, img_id)
-            x_y_2 = re.findall(r'\d+', x_y[0])
-            x, y = int(x_y_2[0]), int(x_y_2[1])
-            new_result = []
-            for i, dets in enumerate(result):
-                bboxes, scores = dets[:, :-1], dets[:, [-1]]
-                ori_bboxes = bboxes.copy()
-                ori_bboxes[..., :2] = ori_bboxes[..., :2] + np.array(
-                    [x, y], dtype=np.float32)
-                labels = np.zeros((bboxes.shape[0], 1)) + i
-                new_result.append(
-                    np.concatenate([labels, ori_bboxes, scores], axis=1))
-
-            new_result = np.concatenate(new_result, axis=0)
-            collector[oriname].append(new_result)
-
-        merge_func = partial(_merge_func, CLASSES=self.CLASSES, iou_thr=0.1)
-        if nproc <= 1:
-            print('Single processing')
-            merged_results = mmcv.track_iter_progress(
-                (map(merge_func, collector.items()), len(collector)))
-        else:
-            print('Multiple processing')
-            merged_results = mmcv.track_parallel_progress(
-                merge_func, list(collector.items()), nproc)
+        return zip(*self.iter_merged_det(results, nproc))
 
-        return zip(*merged_results)
+    def iter_merged_det(self, results, nproc=4):
+        """Merge patch bboxes into full images as their patches arrive.
+
+        The patches of an original image are collected until all of them are
+        in, then the image is merged by rotated NMS and yielded, so only the
+        images whose patches are still arriving are kept in memory.
+
+        Args:
+            results (Iterable): Testing results of the dataset, in the order
+                of the dataset.
+            nproc (int): number of process. Default: 4.
 
-    def _results2submission(self, id_list, dets_list, out_folder=None):
+        Yields:
+            tuple: (img_id, dets_per_cls) of a full image.
+        """
+        patch_infos = [_parse_patch_id(img_id) for img_id in self.img_ids]
+        num_patches = Counter(oriname for oriname, _ in patch_infos)
+        collector = defaultdict(lambda: [[] for _ in self.CLASSES])
+
+        def collect():
+            for (oriname, offset), result in zip(patch_infos, results):
+                for cls_dets, dets in zip(collector[oriname], result):
+                    if dets.shape[0] > 0:
+                        dets = dets.copy()
+                        dets[:, :2] += offset
+                        cls_dets.append(dets)
+                num_patches[oriname] -= 1
+                if num_patches[oriname] == 0:
+                    yield oriname, collector.pop(oriname)
+            # images with missing results are merged with what arrived
+            while collector:
+                yield collector.popitem()
+
+        prog_bar = mmcv.ProgressBar(len(num_patches))
+        if nproc <= 1:
+            device = 'cuda' if torch.cuda.is_available() else 'cpu'
+            merge_func = partial(_merge_func, iou_thr=0.1, device=device)
+            for merged in map(merge_func, collect()):
+                prog_bar.update()
+                yield merged
+            return
+
+        # CUDA can not be used in forked workers, they run NMS on the CPU;
+        # at most 2 * nproc images are in flight
+        merge_func = partial(_merge_func, iou_thr=0.1, device='cpu')
+        with ProcessPoolExecutor(nproc) as executor:
+            pending = deque()
+            for info in collect():
+                pending.append(executor.submit(merge_func, info))
+                if len(pending) >= 2 * nproc:
+                    prog_bar.update()
+                    yield pending.popleft().result()
+            while pending:
+                prog_bar.update()
+                yield pending.popleft().result()
+
+    def _results2submission(self, merged_results, out_folder=None):
         """Generate the submission of full images.
 
         Args:
-            id_list (list): Id of images.
-            dets_list (list): Detection results of per class.
+            merged_results (Iterable): (img_id, dets_per_cls) of each full
+                image, the lines of an image are written as it arrives.
             out_folder (str, optional): Folder of submission.
         """
         if osp.exists(out_folder):
@@ -272,15 +326,14 @@ class DOTADataset(CustomDataset):
             for cls in self.CLASSES
         ]
         file_objs = [open(f, 'w') for f in files]
-        for img_id, dets_per_cls in zip(id_list, dets_list):
+        for img_id, dets_per_cls in merged_results:
             for f, dets in zip(file_objs, dets_per_cls):
                 if dets.size == 0:
                     continue
                 bboxes = obb2poly_np(dets, self.version)
-                for bbox in bboxes:
-                    txt_element = [img_id, str(bbox[-1])
-                                   ] + [f'{p:.2f}' for p in bbox[:-1]]
-                    f.writelines(' '.join(txt_element) + '\n')
+                f.writelines(' '.join([img_id, str(bbox[-1])] +
+                                      [f'{p:.2f}' for p in bbox[:-1]]) + '\n'
+                             for bbox in bboxes)
 
         for f in file_objs:
             f.close()
@@ -324,38 +377,116 @@ class DOTADataset(CustomDataset):
 
         print('\nMerging patch bboxes into full image!!!')
         start_time = time.time()
-        id_list, dets_list = self.merge_det(results, nproc)
+        result_files = self._results2submission(
+            self.iter_merged_det(results, nproc), submission_dir)
         stop_time = time.time()
         print(f'Used time: {(stop_time - start_time):.1f} s')
 
-        result_files = self._results2submission(id_list, dets_list,
-                                                submission_dir)
-
         return result_files, tmp_dir
 
 
-def _merge_func(info, CLASSES, iou_thr):
+def _load_ann_file(ann_file, cls_map, version, difficulty, filter_empty_gt):
+    """Parse a DOTA annotation file.
+
+    Args:
+        ann_file (str): Path of the annotation txt file.
+        cls_map (dict): Map from class names to labels.
+        version (str): Angle representations.
+        difficulty (int): The difficulty threshold of GT.
+        filter_empty_gt (bool): Whether to skip empty annotation files.
+
+    Returns:
+        dict | None: The data info of the image, None if it is skipped.
+    """
+    data_info = {}
+    img_id = osp.split(ann_file)[1][:-4]
+    img_name = img_id + '.png'
+    data_info['filename'] = img_name
+    data_info['ann'] = {}
+    gt_bboxes = []
+    gt_labels = []
+    gt_polygons = []
+    gt_bboxes_ignore = []
+    gt_labels_ignore = []
+    gt_polygons_ignore = []
+
+    if os.path.getsize(ann_file) == 0 and filter_empty_gt:
+        return None
+
+    with open(ann_file) as f:
+        s = f.readlines()
+        for si in s:
+            bbox_info = si.split()
+            poly = np.array(bbox_info[:8], dtype=np.float32)
+            try:
+                x, y, w, h, a = poly2obb_np(poly, version)
+            except:  # noqa: E722
+                continue
+            cls_name = bbox_info[8]
+            obj_difficulty = int(bbox_info[9])
+            label = cls_map[cls_name]
+            if obj_difficulty > difficulty:
+                pass
+            else:
+                gt_bboxes.append([x, y, w, h, a])
+                gt_labels.append(label)
+                gt_polygons.append(poly)
+
+    if gt_bboxes:
+        data_info['ann']['bboxes'] = np.array(gt_bboxes, dtype=np.float32)
+        data_info['ann']['labels'] = np.array(gt_labels, dtype=np.int64)
+        data_info['ann']['polygons'] = np.array(
+            gt_polygons, dtype=np.float32)
+    else:
+        data_info['ann']['bboxes'] = np.zeros((0, 5), dtype=np.float32)
+        data_info['ann']['labels'] = np.array([], dtype=np.int64)
+        data_info['ann']['polygons'] = np.zeros((0, 8), dtype=np.float32)
+
+    if gt_polygons_ignore:
+        data_info['ann']['bboxes_ignore'] = np.array(
+            gt_bboxes_ignore, dtype=np.float32)
+        data_info['ann']['labels_ignore'] = np.array(
+            gt_labels_ignore, dtype=np.int64)
+        data_info['ann']['polygons_ignore'] = np.array(
+            gt_polygons_ignore, dtype=np.float32)
+    else:
+        data_info['ann']['bboxes_ignore'] = np.zeros((0, 5), dtype=np.float32)
+        data_info['ann']['labels_ignore'] = np.array([], dtype=np.int64)
+        data_info['ann']['polygons_ignore'] = np.zeros((0, 8),
+                                                       dtype=np.float32)
+    return data_info
+
+
+def _parse_patch_id(img_id):
+    """Get the original image name and the patch offset of a patch id.
+
+    Args:
+        img_id (str): Patch id, e.g. ``P0000__1024__0___824``.
+
+    Returns:
+        tuple: (oriname, offset) where offset is the (x, y) float32 array.
+    """
+    x, y = PATCH_OFFSET_PATTERN.search(img_id).groups()
+    return img_id.split('__')[0], np.array([x, y], dtype=np.float32)
+
+
+def _merge_func(info, iou_thr, device='cpu'):
     """Merging patch bboxes into full image.
 
     Args:
-        CLASSES (list): Label category.
+        info (tuple): (img_id, dets_per_cls), dets_per_cls holds the patch
+            bboxes of each class, already shifted into the full image.
         iou_thr (float): Threshold of IoU.
+        device (str): Device to run rotated NMS on. Default: 'cpu'.
     """
-    img_id, label_dets = info
-    label_dets = np.concatenate(label_dets, axis=0)
-
-    labels, dets = label_dets[:, 0], label_dets[:, 1:]
+    img_id, dets_per_cls = info
 
     big_img_results = []
-    for i in range(len(CLASSES)):
-        if len(dets[labels == i]) == 0:
-            big_img_results.append(dets[labels == i])
-        else:
-            try:
-                cls_dets = torch.from_numpy(dets[labels == i]).cuda()
-            except:  # noqa: E722
-                cls_dets = torch.from_numpy(dets[labels == i])
-            nms_dets, keep_inds = nms_rotated(cls_dets[:, :5], cls_dets[:, -1],
-                                              iou_thr)
-            big_img_results.append(nms_dets.cpu().numpy())
+    for cls_dets in dets_per_cls:
+        if len(cls_dets) == 0:
+            big_img_results.append(np.zeros((0, 6), dtype=np.float32))
+            continue
+        cls_dets = torch.from_numpy(np.concatenate(cls_dets)).to(device)
+        nms_dets, _ = nms_rotated(cls_dets[:, :5], cls_dets[:, -1], iou_thr)
+        big_img_results.append(nms_dets.cpu().numpy())
     return img_id, big_img_results
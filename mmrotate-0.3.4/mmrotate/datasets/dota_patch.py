@@ -0,0 +1,242 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import glob
+import hashlib
+import os
+import os.path as osp
+import threading
+from collections import OrderedDict
+
+import mmcv
+import numpy as np
+from PIL import Image
+
+from mmrotate.core import (get_multiscale_patch, poly2obb_np, poly_window_iof,
+                           slide_window)
+from .builder import ROTATED_DATASETS
+from .dota import ANN_CACHE_VERSION, DOTADataset
+
+
+@ROTATED_DATASETS.register_module()
+class DOTAPatchDataset(DOTADataset):
+    """DOTA dataset of sliding windows over the original images.
+
+    The windows are computed from the original images and annotations when
+    the dataset is built, like ``tools/data/dota/split/img_split.py`` does,
+    but no patch is written to disk: ``data_infos`` only keeps the image
+    name, the window and its annotations, and the patch is cropped when the
+    sample is loaded. Images are decoded once into ``.npy`` files in
+    ``scene_cache`` and memory-mapped, so only the pages under a window are
+    read. The pipeline should start with ``LoadPatchFromImage``.
+
+    Args:
+        ann_file (str): Folder of the annotations of the original images.
+        pipeline (list[dict]): Processing pipeline.
+        sizes (list[int]): Sizes of the windows. Defaults to [1024].
+        gaps (list[int]): Gaps between the windows. Defaults to [200].
+        rates (list[float]): Multiscale rates, each size and gap is divided
+            by every rate. The patches are not resized, which is left to
+            the pipeline. Defaults to [1.].
+        img_rate_thr (float): Threshold of window area divided by image
+            area. Defaults to 0.6.
+        iof_thr (float): Threshold of overlaps between an object and a
+            window divided by the object area. Defaults to 0.7.
+        img_suffix (str): Suffix of the original images. Defaults to '.png'.
+        scene_cache (str, optional): Folder of the decoded images. Defaults
+            to ``scene_cache`` next to ``img_prefix``.
+        max_open_scenes (int): Number of memory-mapped images kept open by
+            each worker. Defaults to 64.
+        ann_cache (bool | str, optional): Path of the cached windows and
+            their annotations, see :obj:`DOTADataset`. The cache is also
+            rebuilt when the images or the window options change. If True,
+            it is saved as ``<ann_file>.patches.cache.pkl``. Defaults to
+            False.
+    """
+
+    def __init__(self,
+                 ann_file,
+                 pipeline,
+                 sizes=[1024],
+                 gaps=[200],
+                 rates=[1.],
+                 img_rate_thr=0.6,
+                 iof_thr=0.7,
+                 img_suffix='.png',
+                 scene_cache=None,
+                 max_open_scenes=64,
+                 **kwargs):
+        assert len(sizes) == len(gaps), \
+            'The length of `sizes` and `gaps` should be the same.'
+        self.sizes, self.steps = get_multiscale_patch(
+            sizes, [size - gap for size, gap in zip(sizes, gaps)], rates)
+        self.img_rate_thr = img_rate_thr
+        self.iof_thr = iof_thr
+        self.img_suffix = img_suffix
+        self.scene_cache = scene_cache
+        self.max_open_scenes = max_open_scenes
+        self._scenes = OrderedDict()
+
+        super(DOTAPatchDataset, self).__init__(ann_file, pipeline, **kwargs)
+        # keep the patch ids aligned with the filtered data_infos
+        self.img_ids = [data_info['patch_id'] for data_info in self.data_infos]
+
+        if self.scene_cache is None:
+            self.scene_cache = osp.join(
+                osp.dirname(osp.normpath(self.img_prefix)), 'scene_cache')
+
+    def load_annotations(self, ann_folder):
+        """
+            Args:
+                ann_folder: folder that contains DOTA v1 annotations txt files
+                    of the original images
+        """
+        cls_map = {c: i
+                   for i, c in enumerate(self.CLASSES)
+                   }  # in mmdet v2.0 label is 0-based
+        ann_files = sorted(glob.glob(ann_folder + '/*.txt'))
+        test_mode = not ann_files
+        if test_mode:
+            ann_files = sorted(
+                glob.glob(osp.join(self.img_prefix, '*' + self.img_suffix)))
+        img_files = [
+            osp.join(self.img_prefix,
+                     osp.splitext(osp.split(ann_file)[1])[0] + self.img_suffix)
+            for ann_file in ann_files
+        ]
+
+        cache_file = self.ann_cache
+        if cache_file is True:
+            cache_file = osp.normpath(ann_folder) + '.patches.cache.pkl'
+        # the windows also depend on the image sizes
+        key = self._ann_index_key(
+            ann_files if test_mode else ann_files + img_files, cls_map)
+        cache = self._load_ann_index(cache_file, key)
+        if cache is not None:
+            return cache['data_infos']
+
+        data_infos = []
+        for ann_file, img_file in zip(ann_files, img_files):
+            filename = osp.split(img_file)[1]
+            img_id = osp.splitext(filename)[0]
+            width, height = Image.open(img_file).size
+            windows = slide_window(width, height, self.sizes, self.steps,
+                                   self.img_rate_thr)
+
+            polys = np.zeros((0, 8), dtype=np.float32)
+            labels = np.zeros((0, ), dtype=np.int64)
+            difficulties = np.zeros((0, ), dtype=np.int64)
+            if not test_mode:
+                with open(ann_file) as f:
+                    objs = [line.split() for line in f]
+                objs = [obj for obj in objs if len(obj) >= 9]
+                if objs:
+                    polys = np.array([obj[:8] for obj in objs],
+                                     dtype=np.float32)
+                    labels = np.array([cls_map[obj[8]] for obj in objs],
+                                      dtype=np.int64)
+                    difficulties = np.array(
+                        [int(obj[9]) if len(obj) > 9 else 0 for obj in objs],
+                        dtype=np.int64)
+            iofs = poly_window_iof(polys, windows)
+
+            for i, window in enumerate(windows.tolist()):
+                x_start, y_start, x_stop, y_stop = window
+                data_info = dict(
+                    filename=filename,
+                    width=x_stop - x_start,
+                    height=y_stop - y_start,
+                    win=window,
+                    patch_id=f'{img_id}__{x_stop - x_start}__'
+                    f'{x_start}___{y_start}')
+                inds = np.nonzero(iofs[:, i] >= self.iof_thr)[0]
+                # truncated objects are marked as difficulty 2 like
+                # img_split.py does
+                win_difficulties = np.where(iofs[inds, i] < 1, 2,
+                                            difficulties[inds])
+                win_polys = polys[inds] - np.tile(
+                    np.array([x_start, y_start], dtype=np.float32), 4)
+                data_info['ann'] = self._window_ann(win_polys, labels[inds],
+                                                    win_difficulties)
+                data_infos.append(data_info)
+        if cache_file:
+            self._save_ann_index(
+                cache_file,
+                dict(
+                    version=ANN_CACHE_VERSION,
+                    key=key,
+                    data_infos=data_infos))
+        return data_infos
+
+    def _ann_index_key(self, ann_files, cls_map):
+        """Extend the key of :obj:`DOTADataset` with the window options."""
+        key = super(DOTAPatchDataset, self)._ann_index_key(ann_files, cls_map)
+        return hashlib.md5(
+            repr((key, self.sizes, self.steps, self.img_rate_thr,
+                  self.iof_thr, self.img_suffix)).encode()).hexdigest()
+
+    def _window_ann(self, polys, labels, difficulties):
+        """Convert the polygons in a window to the annotation format of
+        :obj:`DOTADataset`."""
+        gt_bboxes, gt_labels, gt_polygons = [], [], []
+        for poly, label, difficulty in zip(polys, labels, difficulties):
+            if difficulty > self.difficulty:
+                continue
+            try:
+                x, y, w, h, a = poly2obb_np(poly, self.version)
+            except:  # noqa: E722
+                continue
+            gt_bboxes.append([x, y, w, h, a])
+            gt_labels.append(label)
+            gt_polygons.append(poly)
+
+        ann = dict(
+            bboxes=np.array(gt_bboxes, dtype=np.float32).reshape(-1, 5),
+            labels=np.array(gt_labels, dtype=np.int64),
+            polygons=np.array(gt_polygons, dtype=np.float32).reshape(-1, 8),
+            bboxes_ignore=np.zeros((0, 5), dtype=np.float32),
+            labels_ignore=np.array([], dtype=np.int64),
+            polygons_ignore=np.zeros((0, 8), dtype=np.float32))
+        return ann
+
+    def get_scene(self, filename):
+        """Get an original image, decoding it at most once.
+
+        The decoded image is stored as a ``.npy`` file in ``scene_cache``,
+        keyed by its path, size and modification time, and opened as a
+        copy-on-write memory map. The last ``max_open_scenes`` maps are kept
+        open.
+
+        Args:
+            filename (str): Name of the image in ``img_prefix``.
+
+        Returns:
+            np.ndarray: The (h, w, 3) BGR image.
+        """
+        scene = self._scenes.pop(filename, None)
+        if scene is None:
+            img_path = osp.join(self.img_prefix, filename)
+            stat = os.stat(img_path)
+            key = hashlib.md5(f'{osp.abspath(img_path)}{stat.st_size}'
+                              f'{stat.st_mtime_ns}'.encode()).hexdigest()[:12]
+            cache_path = osp.join(self.scene_cache,
+                                  f'{osp.splitext(filename)[0]}.{key}.npy')
+            if not osp.exists(cache_path):
+                img = mmcv.imread(img_path)
+                os.makedirs(self.scene_cache, exist_ok=True)
+                # workers and their threads may decode the same image
+                # concurrently
+                tmp_path = (f'{cache_path[:-4]}.{os.getpid()}.'
+                            f'{threading.get_ident()}.part.npy')
+                np.save(tmp_path, img)
+                os.replace(tmp_path, cache_path)
+            scene = np.load(cache_path, mmap_mode='c')
+            if len(self._scenes) >= self.max_open_scenes:
+                self._scenes.popitem(last=False)
+        self._scenes[filename] = scene
+        return scene
+
+    def pre_pipeline(self, results):
+        """Prepare the original image and the window for
+        ``LoadPatchFromImage``."""
+        super(DOTAPatchDataset, self).pre_pipeline(results)
+        results['img'] = self.get_scene(results['img_info']['filename'])
+        results['win'] = results['img_info']['win']
@@ -5,7 +5,6 @@ from collections import OrderedDict
 
 import mmcv
 import numpy as np
-from mmcv import print_log
 from mmdet.datasets import CustomDataset
 from PIL import Image
 
@@ -223,9 +222,10 @@ class HRSCDataset(CustomDataset):
             proposal_nums (Sequence[int]): Proposal number used for evaluating
                 recalls, such as recall@100, recall@1000.
                 Default: (100, 300, 1000).
-            iou_thr (float | list[float]): IoU threshold. It must be a float
-                when evaluating mAP, and can be a list when evaluating recall.
-                Default: 0.5.
+            iou_thr (float | list[float]): IoU threshold. All thresholds are
+                evaluated from one IoU computation, ``APxx`` is reported for
+                each of them and ``mAP`` is their mean.
+                Default: [0.5, 0.55, ..., 0.95].
             scale_ranges (list[tuple] | None): Scale ranges for evaluating mAP.
                 Default: None.
             use_07_metric (bool): Whether to use the voc07 metric.
@@ -244,19 +244,16 @@ class HRSCDataset(CustomDataset):
         iou_thrs = [iou_thr] if isinstance(iou_thr, float) else iou_thr
         if metric == 'mAP':
             assert isinstance(iou_thrs, list)
-            mean_aps = []
-            for iou_thr in iou_thrs:
-                print_log(f'\n{"-" * 15}iou_thr: {iou_thr}{"-" * 15}')
-                mean_ap, _ = eval_rbbox_map(
-                    results,
-                    annotations,
-                    scale_ranges=scale_ranges,
-                    iou_thr=iou_thr,
-                    use_07_metric=use_07_metric,
-                    dataset=self.CLASSES,
-                    logger=logger,
-                    nproc=nproc)
-                mean_aps.append(mean_ap)
+            mean_aps, _ = eval_rbbox_map(
+                results,
+                annotations,
+                scale_ranges=scale_ranges,
+                iou_thr=iou_thrs,
+                use_07_metric=use_07_metric,
+                dataset=self.CLASSES,
+                logger=logger,
+                nproc=nproc)
+            for iou_thr, mean_ap in zip(iou_thrs, mean_aps):
                 eval_results[f'AP{int(iou_thr * 100):02d}'] = round(mean_ap, 3)
             eval_results['mAP'] = sum(mean_aps) / len(mean_aps)
             eval_results.move_to_end('mAP', last=False)
@@ -3,6 +3,7 @@ import os.path as osp
 import shutil
 import tempfile
 
+import mmcv
 import numpy as np
 import pytest
 from mmdet.datasets import build_dataset
@@ -61,6 +62,11 @@ def test_dota_dataset(angle_version):
     dataset.format_results(fake_results, submission_dir=tmp_filename)
     shutil.rmtree(tmp_filename)
 
+    # test merge_det
+    id_list, dets_list = dataset.merge_det(fake_results, nproc=1)
+    assert id_list == ('P0004', )
+    assert len(dets_list[0]) == len(dataset.CLASSES)
+
     # test filter_empty_gt=False
     full_data_config = dict(
         type=DOTADataset,
@@ -71,3 +77,78 @@ def test_dota_dataset(angle_version):
         filter_empty_gt=False)
     full_dataset = build_dataset(full_data_config)
     assert len(dataset) == 1 and len(full_dataset) == 2
+
+
+def test_dota_dataset_ann_cache():
+    """Test the cached annotation index of DOTA dataset."""
+    tmp_dir = tempfile.mkdtemp()
+    ann_folder = osp.join(tmp_dir, 'labelTxt')
+    shutil.copytree('tests/data/labelTxt', ann_folder)
+    cache_file = osp.join(tmp_dir, 'labelTxt.cache.pkl')
+    data_config = dict(
+        type=DOTADataset,
+        ann_file=ann_folder,
+        img_prefix='tests/data/images/',
+        pipeline=[],
+        filter_empty_gt=False,
+        ann_cache=True,
+        ann_nproc=2)
+    dataset = build_dataset(data_config)
+    assert osp.exists(cache_file)
+
+    # the second build loads the index
+    cached_dataset = build_dataset(data_config)
+    assert cached_dataset.img_ids == dataset.img_ids
+    for info, cached_info in zip(dataset.data_infos,
+                                 cached_dataset.data_infos):
+        assert info['filename'] == cached_info['filename']
+        for k, v in info['ann'].items():
+            np.testing.assert_array_equal(v, cached_info['ann'][k])
+
+    # a changed annotation file or option invalidates the index
+    with open(osp.join(ann_folder, 'P0004__1__0___0.txt'), 'a') as f:
+        f.write('1 1 50 1 50 50 1 50 plane 0\n')
+    changed_dataset = build_dataset(data_config)
+    assert sum(len(info['ann']['labels'])
+               for info in changed_dataset.data_infos) == sum(
+                   len(info['ann']['labels'])
+                   for info in dataset.data_infos) + 1
+    key = mmcv.load(cache_file)['key']
+    data_config['version'] = 'le90'
+    build_dataset(data_config)
+    assert mmcv.load(cache_file)['key'] != key
+    shutil.rmtree(tmp_dir)
+
+
+def test_dota_dataset_eval_iou_thrs():
+    """Test evaluating DOTA dataset with a list of IoU thresholds."""
+    data_config = dict(
+        type=DOTADataset,
+        ann_file='tests/data/labelTxt/',
+        img_prefix='tests/data/images/',
+        pipeline=[])
+    dataset = build_dataset(data_config)
+    dataset.CLASSES = ('plane', )
+    fake_results = _create_dummy_results()
+    eval_results = dataset.evaluate(fake_results, iou_thr=[0.5, 0.75])
+    assert list(eval_results) == ['mAP', 'AP50', 'AP75']
+    np.testing.assert_almost_equal(eval_results['AP50'], 0.727, decimal=3)
+    np.testing.assert_almost_equal(
+        eval_results['mAP'],
+        (eval_results['AP50'] + eval_results['AP75']) / 2,
+        decimal=3)
+
+    # with scale_ranges, each result is a list over the scales
+    scale_ranges = [(0, 1e5), (0, 32)]
+    eval_results = dataset.evaluate(
+        fake_results, iou_thr=[0.5, 0.75], scale_ranges=scale_ranges)
+    assert len(eval_results['mAP']) == len(eval_results['AP50']) == 2
+    np.testing.assert_almost_equal(eval_results['AP50'][0], 0.727, decimal=3)
+    np.testing.assert_almost_equal(
+        eval_results['mAP'],
+        np.mean([eval_results['AP50'], eval_results['AP75']], axis=0),
+        decimal=3)
+    single_results = dataset.evaluate(
+        fake_results, iou_thr=0.5, scale_ranges=scale_ranges)
+    np.testing.assert_almost_equal(single_results['mAP'],
+                                   eval_results['AP50'], decimal=3)
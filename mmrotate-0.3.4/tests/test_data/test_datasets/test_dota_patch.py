@@ -0,0 +1,88 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import os
+import os.path as osp
+import shutil
+import tempfile
+
+import mmcv
+import numpy as np
+from mmdet.datasets import build_dataset
+
+from mmrotate.datasets import DOTAPatchDataset, dota_patch
+
+
+def test_dota_patch_dataset():
+    """Test DOTA dataset of sliding windows."""
+    tmp_dir = tempfile.mkdtemp()
+    img = np.random.randint(0, 255, (1200, 1500, 3), dtype=np.uint8)
+    mmcv.imwrite(img, osp.join(tmp_dir, 'images', 'P0000.png'))
+    os.makedirs(osp.join(tmp_dir, 'labelTxt'))
+    with open(osp.join(tmp_dir, 'labelTxt', 'P0000.txt'), 'w') as f:
+        f.write('imagesource:GoogleEarth\ngsd:null\n'
+                '100 100 200 100 200 150 100 150 plane 0\n'
+                '1000 500 1100 500 1100 560 1000 560 ship 0\n')
+
+    pipeline = [dict(type='LoadPatchFromImage')]
+    data_config = dict(
+        type=DOTAPatchDataset,
+        ann_file=osp.join(tmp_dir, 'labelTxt'),
+        img_prefix=osp.join(tmp_dir, 'images'),
+        pipeline=pipeline,
+        sizes=[1024],
+        gaps=[200])
+    dataset = build_dataset(data_config)
+    # the window without objects is filtered
+    assert dataset.img_ids == [
+        'P0000__1024__0___0', 'P0000__1024__476___0', 'P0000__1024__476___176'
+    ]
+    assert dataset.data_infos[0]['ann']['labels'].tolist() == [0]
+    np.testing.assert_array_equal(
+        dataset.data_infos[1]['ann']['polygons'],
+        [[524, 500, 624, 500, 624, 560, 524, 560]])
+
+    # patches are cropped from the decoded image
+    results = dataset.prepare_test_img(2)
+    np.testing.assert_array_equal(results['img'], img[176:1200, 476:1500])
+    assert len(os.listdir(osp.join(tmp_dir, 'scene_cache'))) == 1
+    shutil.rmtree(tmp_dir)
+
+
+def test_dota_patch_dataset_ann_cache(monkeypatch):
+    """Test the cached windows of DOTA dataset of sliding windows."""
+    tmp_dir = tempfile.mkdtemp()
+    img = np.random.randint(0, 255, (1200, 1500, 3), dtype=np.uint8)
+    mmcv.imwrite(img, osp.join(tmp_dir, 'images', 'P0000.png'))
+    os.makedirs(osp.join(tmp_dir, 'labelTxt'))
+    with open(osp.join(tmp_dir, 'labelTxt', 'P0000.txt'), 'w') as f:
+        f.write('100 100 200 100 200 150 100 150 plane 0\n'
+                '1000 500 1100 500 1100 560 1000 560 ship 0\n')
+
+    data_config = dict(
+        type=DOTAPatchDataset,
+        ann_file=osp.join(tmp_dir, 'labelTxt'),
+        img_prefix=osp.join(tmp_dir, 'images'),
+        pipeline=[],
+        sizes=[1024],
+        gaps=[200],
+        ann_cache=True)
+    dataset = build_dataset(data_config)
+    assert osp.exists(osp.join(tmp_dir, 'labelTxt.patches.cache.pkl'))
+
+    # the second build loads the windows without computing them
+    def fail(*args, **kwargs):
+        raise AssertionError('the windows should be loaded from the cache')
+
+    monkeypatch.setattr(dota_patch, 'poly_window_iof', fail)
+    cached_dataset = build_dataset(data_config)
+    assert cached_dataset.img_ids == dataset.img_ids
+    for info, cached_info in zip(dataset.data_infos,
+                                 cached_dataset.data_infos):
+        assert info['win'] == cached_info['win']
+        for k, v in info['ann'].items():
+            np.testing.assert_array_equal(v, cached_info['ann'][k])
+
+    # changed window options invalidate the cache
+    monkeypatch.undo()
+    data_config['sizes'] = [800]
+    assert build_dataset(data_config).img_ids != dataset.img_ids
+    shutil.rmtree(tmp_dir)
@@ -0,0 +1,114 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import numpy as np
+
+from mmrotate.core.evaluation.eval_map import (eval_rbbox_map, tpfp_default,
+                                               tpfp_rotated)
+
+gts = [
+    np.array([[10., 10., 10., 10., 0.], [50., 50., 10., 10., 0.]]),
+    np.array([[30., 30., 20., 10., 0.5]]),
+    np.zeros((0, 5)),
+]
+dets = [
+    np.array([[10., 10., 10., 10., 0., 0.8], [10., 10., 10., 10., 0., 0.9],
+              [80., 80., 10., 10., 0., 0.7]]),
+    np.array([[30., 30., 20., 10., 0.5, 0.6]]),
+    np.array([[5., 5., 4., 4., 0., 0.95]]),
+]
+gts_ignore = [np.zeros((0, 5)), np.zeros((0, 5)), np.zeros((0, 5))]
+
+
+def test_tpfp_default():
+    tp, fp = tpfp_default(dets[0], gts[0], gts_ignore[0], iou_thr=0.5)
+    # the higher scoring duplicate covers the gt, the other one is a fp
+    assert tp.tolist() == [[0., 1., 0.]]
+    assert fp.tolist() == [[1., 0., 1.]]
+
+    # dets matching an ignored gt are neither tp nor fp
+    tp, fp = tpfp_default(dets[1], np.zeros((0, 5)), gts[1], iou_thr=0.5)
+    assert tp.tolist() == [[0.]] and fp.tolist() == [[0.]]
+
+    # no gts at all
+    tp, fp = tpfp_default(dets[2], gts[2], gts_ignore[2])
+    assert tp.tolist() == [[0.]] and fp.tolist() == [[1.]]
+
+
+def test_tpfp_rotated_matches_per_image():
+    tp, fp, scores = tpfp_rotated(dets, gts, gts_ignore, iou_thr=0.5)
+    assert np.all(np.diff(scores) <= 0)
+    expect_tp, expect_fp = [], []
+    for det, gt, gt_ignore in zip(dets, gts, gts_ignore):
+        img_tp, img_fp = tpfp_default(det, gt, gt_ignore, iou_thr=0.5)
+        expect_tp.append(img_tp)
+        expect_fp.append(img_fp)
+    all_scores = np.concatenate([det[:, -1] for det in dets])
+    sort_inds = np.argsort(-all_scores, kind='stable')
+    assert np.array_equal(tp, np.hstack(expect_tp)[:, sort_inds])
+    assert np.array_equal(fp, np.hstack(expect_fp)[:, sort_inds])
+
+
+def test_eval_rbbox_map():
+    det_results = [[det] for det in dets]
+    annotations = [
+        dict(bboxes=gt.astype(np.float32), labels=np.zeros(len(gt), int))
+        for gt in gts
+    ]
+    mean_ap, results = eval_rbbox_map(
+        det_results, annotations, iou_thr=0.5, logger='silent', nproc=1)
+    assert results[0]['num_gts'] == 3
+    assert results[0]['num_dets'] == 5
+    np.testing.assert_allclose(results[0]['recall'][-1], 2 / 3, atol=1e-6)
+    assert 0 < mean_ap < 1
+
+
+def test_tpfp_default_area_ranges():
+    area_ranges = [(None, None), (0, 150), (150, 1e5)]
+    tp, fp = tpfp_default(
+        dets[0], gts[0], gts_ignore[0], iou_thr=0.5, area_ranges=area_ranges)
+    assert tp.shape == fp.shape == (3, 3)
+    # every box is 10x10, so the large range matches nothing and the
+    # unmatched det is not counted as a fp there either
+    assert tp.tolist() == [[0., 1., 0.]] * 2 + [[0., 0., 0.]]
+    assert fp.tolist() == [[1., 0., 1.]] * 2 + [[0., 0., 0.]]
+
+    # a det matched to a gt outside the range is neither tp nor fp
+    tp, fp = tpfp_default(
+        dets[1], gts[1], gts_ignore[1], area_ranges=[(0, 150)])
+    assert tp.tolist() == [[0.]] and fp.tolist() == [[0.]]
+
+    det_results = [[det] for det in dets]
+    annotations = [
+        dict(bboxes=gt.astype(np.float32), labels=np.zeros(len(gt), int))
+        for gt in gts
+    ]
+    _, results = eval_rbbox_map(
+        det_results,
+        annotations,
+        scale_ranges=[(0, 12), (12, 1e3)],
+        logger='silent',
+        nproc=1)
+    assert results[0]['num_gts'].tolist() == [2, 1]
+
+
+def test_eval_rbbox_map_multi_iou_thr():
+    det_results = [[det] for det in dets]
+    annotations = [
+        dict(bboxes=gt.astype(np.float32), labels=np.zeros(len(gt), int))
+        for gt in gts
+    ]
+    iou_thrs = [0.5, 0.75, 0.95]
+    mean_aps, thr_results = eval_rbbox_map(
+        det_results, annotations, iou_thr=iou_thrs, logger='silent', nproc=1)
+    assert len(mean_aps) == len(thr_results) == len(iou_thrs)
+    for iou_thr, mean_ap, results in zip(iou_thrs, mean_aps, thr_results):
+        expect_ap, expect_results = eval_rbbox_map(
+            det_results,
+            annotations,
+            iou_thr=iou_thr,
+            logger='silent',
+            nproc=1)
+        assert mean_ap == expect_ap
+        np.testing.assert_array_equal(results[0]['recall'],
+                                      expect_results[0]['recall'])
+        np.testing.assert_array_equal(results[0]['precision'],
+                                      expect_results[0]['precision'])
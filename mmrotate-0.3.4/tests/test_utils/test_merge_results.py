@@ -0,0 +1,47 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import numpy as np
+import torch
+from mmcv.ops import nms_rotated
+
+from mmrotate.core.patch import merge_results
+from mmrotate.core.patch.merge_results import bucketed_nms, overlap_groups
+
+
+def _random_dets(num_dets, scene_size=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.concatenate([
+        rng.uniform(0, scene_size, (num_dets, 2)),
+        rng.uniform(5, 80, (num_dets, 2)),
+        rng.uniform(-1.5, 1.5, (num_dets, 1)),
+        rng.uniform(0, 1, (num_dets, 1))
+    ],
+                          axis=1).astype(np.float32)
+
+
+def test_overlap_groups():
+    bboxes = np.array([[10, 10, 10, 10, 0], [14, 10, 10, 10, 0],
+                       [22, 10, 10, 10, 0], [100, 100, 10, 10, 0]],
+                      dtype=np.float32)
+    # the first three are chained, the last one is isolated
+    assert overlap_groups(bboxes).tolist() == [0, 0, 0, 3]
+    hbbs = np.array([[0, 0, 10, 10], [5, 5, 15, 15], [20, 0, 30, 10]],
+                    dtype=np.float32)
+    assert overlap_groups(hbbs).tolist() == [0, 0, 2]
+
+
+def test_bucketed_nms():
+    dets = _random_dets(500)
+    nms_dets, keeps = bucketed_nms(dets, iou_thr=0.1)
+    expect_dets, expect_keeps = nms_rotated(
+        torch.from_numpy(dets[:, :5]), torch.from_numpy(dets[:, 5]), 0.1)
+    assert np.array_equal(np.sort(keeps), np.sort(expect_keeps.numpy()))
+    np.testing.assert_allclose(nms_dets, expect_dets.numpy(), atol=1e-4)
+
+
+def test_merge_results_bucketed():
+    results = [[_random_dets(100, 1024, seed)] for seed in range(4)]
+    offsets = np.array([[0, 0], [824, 0], [0, 824], [824, 824]])
+    expect = merge_results([[dets.copy() for dets in result]
+                            for result in results], offsets, (1848, 1848))
+    merged = merge_results(results, offsets, (1848, 1848), bucketed=True)
+    np.testing.assert_allclose(merged[0], expect[0], atol=1e-4)
@@ -0,0 +1,53 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import numpy as np
+import pytest
+
+from mmrotate.core.patch import poly_window_iof
+
+
+def _shapely_iof(polys, windows):
+    geometry = pytest.importorskip('shapely.geometry')
+    iofs = np.zeros((len(polys), len(windows)))
+    for i, poly in enumerate(polys):
+        poly = geometry.Polygon(poly.reshape(4, 2))
+        for j, (x1, y1, x2, y2) in enumerate(windows):
+            window = geometry.box(x1, y1, x2, y2)
+            iofs[i, j] = poly.intersection(window).area / poly.area
+    return iofs
+
+
+def test_poly_window_iof_random():
+    rng = np.random.default_rng(0)
+    ctr = rng.uniform(-50, 1100, (300, 2))
+    wh = rng.uniform(5, 200, (300, 2))
+    theta = rng.uniform(-np.pi, np.pi, 300)
+    vec1 = np.stack([np.cos(theta), np.sin(theta)], axis=1) * wh[:, :1] / 2
+    vec2 = np.stack([-np.sin(theta), np.cos(theta)], axis=1) * wh[:, 1:] / 2
+    polys = np.stack([
+        ctr - vec1 - vec2, ctr + vec1 - vec2, ctr + vec1 + vec2,
+        ctr - vec1 + vec2
+    ],
+                     axis=1).reshape(-1, 8)
+    windows = np.array([[0, 0, 1024, 1024], [0, 824, 1024, 1848],
+                        [476, 0, 1500, 1024], [300, 300, 500, 500]])
+    np.testing.assert_allclose(
+        poly_window_iof(polys, windows),
+        _shapely_iof(polys, windows),
+        atol=1e-6)
+
+
+def test_poly_window_iof_special_cases():
+    polys = np.array([
+        [10, 10, 50, 10, 50, 40, 10, 40],  # fully inside
+        [200, 200, 250, 200, 250, 260, 200, 260],  # fully outside
+        [100, 20, 140, 20, 140, 60, 100, 60],  # edge touching the window
+        [80, 50, 120, 50, 120, 90, 80, 90],  # half inside
+        [100, 0, 120, 20, 100, 40, 80, 20],  # rotated, vertex on the edge
+    ], dtype=np.float32)
+    windows = np.array([[0, 0, 100, 100]])
+    iofs = poly_window_iof(polys, windows)
+    np.testing.assert_allclose(iofs[:, 0], [1, 0, 0, 0.5, 0.5], atol=1e-6)
+    np.testing.assert_allclose(iofs, _shapely_iof(polys, windows), atol=1e-6)
+
+    assert poly_window_iof(np.zeros((0, 8)), windows).shape == (0, 1)
+    assert poly_window_iof(polys, np.zeros((0, 4))).shape == (5, 0)
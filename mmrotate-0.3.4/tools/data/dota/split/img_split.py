@@ -5,12 +5,15 @@
 import argparse
 import codecs
 import datetime
+import hashlib
 import itertools
 import json
 import logging
 import os
 import os.path as osp
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial, reduce
 from math import ceil
 from multiprocessing import Manager, Pool
@@ -19,12 +22,14 @@ import cv2
 import numpy as np
 from PIL import Image
 
+from mmrotate.core.patch.split import clip_polys_by_rects, poly_areas
+
 Image.MAX_IMAGE_PIXELS = None
 
 try:
-    import shapely.geometry as shgeo
+    from osgeo import gdal
 except ImportError:
-    shgeo = None
+    gdal = None
 
 
 def add_parser(parser):
@@ -102,6 +107,17 @@ def add_parser(parser):
         type=str,
         default='.png',
         help='the extension of saving images')
+    parser.add_argument(
+        '--encode-threads',
+        type=int,
+        default=4,
+        help='the number of threads encoding patches of an image')
+    parser.add_argument(
+        '--cache-dir',
+        type=str,
+        default=None,
+        help='if given, decoded images are kept here as memory-mapped raw '
+        'arrays and reused by later splits of the same images')
 
 
 def parse_args():
@@ -224,18 +240,13 @@ def bbox_overlaps_iof(bboxes1, bboxes2, eps=1e-6):
     wh = np.clip(rb - lt, 0, np.inf)
     h_overlaps = wh[..., 0] * wh[..., 1]
 
-    l, t, r, b = [bboxes2[..., i] for i in range(4)]
-    polys2 = np.stack([l, t, r, t, r, b, l, b], axis=-1)
-    if shgeo is None:
-        raise ImportError('Please run "pip install shapely" '
-                          'to install shapely first.')
-    sg_polys1 = [shgeo.Polygon(p) for p in bboxes1.reshape(rows, -1, 2)]
-    sg_polys2 = [shgeo.Polygon(p) for p in polys2.reshape(cols, -1, 2)]
+    polys1 = bboxes1.reshape(rows, -1, 2)
     overlaps = np.zeros(h_overlaps.shape)
-    for p in zip(*np.nonzero(h_overlaps)):
-        overlaps[p] = sg_polys1[p[0]].intersection(sg_polys2[p[-1]]).area
-    unions = np.array([p.area for p in sg_polys1], dtype=np.float32)
-    unions = unions[..., None]
+    inds1, inds2 = np.nonzero(h_overlaps)
+    overlaps[inds1, inds2] = poly_areas(
+        *clip_polys_by_rects(polys1[inds1], bboxes2[inds2]))
+    unions = poly_areas(polys1, np.full(rows, polys1.shape[1]))
+    unions = unions.astype(np.float32)[..., None]
 
     unions = np.clip(unions, eps, np.inf)
     outputs = overlaps / unions
@@ -274,8 +285,95 @@ def get_window_obj(info, windows, iof_thr):
     return window_anns
 
 
-def crop_and_save_img(info, windows, window_anns, img_dir, no_padding,
-                      padding_value, save_dir, anno_dir, img_ext):
+class GDALScene:
+    """Read windows of a (tiled) GeoTIFF without decoding the whole scene.
+
+    Windows are sliced like an (h, w, 3) BGR uint8 array, e.g.
+    ``scene[y_start:y_stop, x_start:x_stop]``, and only the tiles under the
+    window are read.
+
+    Args:
+        path (str): Path of the GeoTIFF.
+    """
+
+    def __init__(self, path):
+        self.dataset = gdal.Open(path)
+        if self.dataset is None:
+            raise IOError(f'Can not open {path}')
+        self.shape = (self.dataset.RasterYSize, self.dataset.RasterXSize, 3)
+
+    def __getitem__(self, index):
+        rows, cols = index[:2]
+        y_start, y_stop, _ = rows.indices(self.shape[0])
+        x_start, x_stop, _ = cols.indices(self.shape[1])
+        num_bands = min(self.dataset.RasterCount, 3)
+        patch = np.stack([
+            self.dataset.GetRasterBand(i + 1).ReadAsArray(
+                x_start, y_start, max(x_stop - x_start, 0),
+                max(y_stop - y_start, 0)) for i in range(num_bands)
+        ])
+        if patch.dtype == np.uint16:
+            # the same conversion as cv2.imread
+            patch = patch >> 8
+        patch = np.clip(patch, 0, 255).astype(np.uint8)
+        # gray to BGR and RGB to BGR
+        patch = np.repeat(patch, 3, axis=0) if num_bands == 1 else patch
+        return np.ascontiguousarray(patch[::-1].transpose(1, 2, 0))
+
+
+def load_scene(img_path, cache_dir=None):
+    """Load an image to be split, decoding it at most once.
+
+    GeoTIFFs are read window by window with GDAL if it is installed. Other
+    images are decoded once; with ``cache_dir`` the decoded pixels are stored
+    as a raw ``.npy`` file and memory-mapped, so the scene is paged from disk
+    instead of being held in memory, and later splits of the same image
+    (e.g. with other sizes or rates) skip the decoding.
+
+    Args:
+        img_path (str): Path of the image.
+        cache_dir (str, optional): Folder of the decoded images.
+
+    Returns:
+        np.ndarray | GDALScene: The (h, w, 3) BGR image.
+    """
+    if gdal is not None and osp.splitext(img_path)[-1].lower() in ('.tif',
+                                                                   '.tiff'):
+        return GDALScene(img_path)
+    if cache_dir is None:
+        return cv2.imread(img_path)
+
+    # a changed image or another image with the same name gets a new key
+    stat = os.stat(img_path)
+    key = hashlib.md5(f'{osp.abspath(img_path)}{stat.st_size}'
+                      f'{stat.st_mtime_ns}'.encode()).hexdigest()[:12]
+    cache_path = osp.join(
+        cache_dir,
+        f'{osp.splitext(osp.basename(img_path))[0]}.{key}.npy')
+    if not osp.exists(cache_path):
+        img = cv2.imread(img_path)
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = cache_path[:-4] + '.part.npy'
+        cache = np.lib.format.open_memmap(
+            tmp_path, mode='w+', dtype=img.dtype, shape=img.shape)
+        cache[...] = img
+        cache.flush()
+        del cache, img
+        os.replace(tmp_path, cache_path)
+    return np.load(cache_path, mmap_mode='r')
+
+
+def crop_and_save_img(info,
+                      windows,
+                      window_anns,
+                      img_dir,
+                      no_padding,
+                      padding_value,
+                      save_dir,
+                      anno_dir,
+                      img_ext,
+                      encode_threads=4,
+                      cache_dir=None):
     """
 
     Args:
@@ -288,12 +386,17 @@ def crop_and_save_img(info, windows, window_anns, img_dir, no_padding,
         save_dir (str): Save filename.
         anno_dir (str): Annotation filename.
         img_ext (str): Picture suffix.
+        encode_threads (int): Number of threads encoding the patches.
+        cache_dir (str, optional): Folder of the decoded images, see
+            :func:`load_scene`.
 
     Returns:
         list[dict]: Information of paths.
     """
-    img = cv2.imread(osp.join(img_dir, info['filename']))
+    img = load_scene(osp.join(img_dir, info['filename']), cache_dir)
     patch_infos = []
+    executor = ThreadPoolExecutor(encode_threads)
+    writes = deque()
     for i in range(windows.shape[0]):
         patch_info = dict()
         for k, v in info.items():
@@ -328,7 +431,15 @@ def crop_and_save_img(info, windows, window_anns, img_dir, no_padding,
         patch_info['height'] = patch.shape[0]
         patch_info['width'] = patch.shape[1]
 
-        cv2.imwrite(osp.join(save_dir, patch_info['id'] + img_ext), patch)
+        # cv2 releases the GIL while encoding, the number of patches waiting
+        # to be saved is bounded to keep the memory flat
+        if len(writes) >= 2 * encode_threads:
+            assert writes.popleft().result(), \
+                'Failed to save a patch of ' + info['filename']
+        writes.append(
+            executor.submit(cv2.imwrite,
+                            osp.join(save_dir, patch_info['id'] + img_ext),
+                            patch))
         patch_info['filename'] = patch_info['id'] + img_ext
         patch_infos.append(patch_info)
 
@@ -347,12 +458,28 @@ def crop_and_save_img(info, windows, window_anns, img_dir, no_padding,
                     outline = outline + ' ' + obj['labels'][idx] + ' ' + diffs
                     f_out.write(outline + '\n')
 
+    executor.shutdown()
+    for write in writes:
+        assert write.result(), 'Failed to save a patch of ' + info['filename']
     return patch_infos
 
 
-def single_split(arguments, sizes, gaps, img_rate_thr, iof_thr, no_padding,
-                 padding_value, save_dir, anno_dir, img_ext, lock, prog, total,
-                 logger):
+def single_split(arguments,
+                 sizes,
+                 gaps,
+                 img_rate_thr,
+                 iof_thr,
+                 no_padding,
+                 padding_value,
+                 save_dir,
+                 anno_dir,
+                 img_ext,
+                 lock,
+                 prog,
+                 total,
+                 logger,
+                 encode_threads=4,
+                 cache_dir=None):
     """
 
     Args:
@@ -370,6 +497,8 @@ def single_split(arguments, sizes, gaps, img_rate_thr, iof_thr, no_padding,
         prog (object): Progress of Manager.
         total (object): Length of infos.
         logger (object): Logger.
+        encode_threads (int): Number of threads encoding the patches.
+        cache_dir (str, optional): Folder of the decoded images.
 
     Returns:
         list[dict]: Information of paths.
@@ -379,7 +508,8 @@ def single_split(arguments, sizes, gaps, img_rate_thr, iof_thr, no_padding,
     window_anns = get_window_obj(info, windows, iof_thr)
     patch_infos = crop_and_save_img(info, windows, window_anns, img_dir,
                                     no_padding, padding_value, save_dir,
-                                    anno_dir, img_ext)
+                                    anno_dir, img_ext, encode_threads,
+                                    cache_dir)
     assert patch_infos
 
     lock.acquire()
@@ -574,7 +704,9 @@ def main():
         lock=manager.Lock(),
         prog=manager.Value('i', 0),
         total=len(infos),
-        logger=logger)
+        logger=logger,
+        encode_threads=args.encode_threads,
+        cache_dir=args.cache_dir)
 
     if args.nproc > 1:
         pool = Pool(args.nproc)
@@ -0,0 +1,38 @@
+import os
+
+import pandas as pd
+
+from dataset_statistics import update_statistics
+
+OBJECT = ('<object><name>{}</name><robndbox><cx>10</cx><cy>10</cy><w>5</w><h>3</h>'
+          '<angle>0.1</angle></robndbox></object>')
+
+
+def _write(folder, name, classes):
+    with open(os.path.join(folder, name), 'w') as f:
+        f.write('<annotation>' + ''.join(OBJECT.format(c) for c in classes) + '</annotation>')
+
+
+def _classes(totals):
+    return {split: dict(+total['classes']) for split, total in totals.items() if +total['classes']}
+
+
+def test_update_statistics_touch_and_resplit(tmp_path):
+    """A touched file whose content is unchanged still follows its new split."""
+    folder = str(tmp_path / 'labels')
+    os.makedirs(folder)
+    _write(folder, '0.xml', ['dam'])
+    _write(folder, '1.xml', ['weir'])
+    metadata = pd.DataFrame({'ID': ['0', '1'], 'Folder': ['train', 'train']})
+    assert _classes(update_statistics(folder, metadata)) == {'train': {'dam': 1, 'weir': 1}}
+
+    path = os.path.join(folder, '1.xml')
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    metadata['Folder'] = ['train', 'val']
+    totals = update_statistics(folder, metadata)
+    assert _classes(totals) == {'train': {'dam': 1}, 'val': {'weir': 1}}
+
+    # the incremental totals match a fresh build
+    os.remove(folder + '.stats.pkl')
+    assert _classes(update_statistics(folder, metadata)) == _classes(totals)
@@ -1,29 +1,146 @@
-# 删除没有标签文件的图片
+# 删除没有标签文件的图片，并检查数据集完整性
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-def remove_images_without_labels(im_dir, lb_dir):
+IMG_FORMATS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff"}
+MAGIC = {".jpg": b"\xff\xd8", ".jpeg": b"\xff\xd8", ".png": b"\x89PNG"}
+MIN_AREA = 1e-8  # minimum normalized polygon area of a non-degenerate box
+
+
+def list_stems(directory, suffixes):
+    """List a directory once with os.scandir and map file stems to paths for the given suffixes."""
+    stems = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            stem, suffix = os.path.splitext(entry.name)
+            if suffix.lower() in suffixes and entry.is_file():
+                stems[stem] = entry.path
+    return stems
+
+
+def check_image(path):
+    """Return an error string if the image header (and JPEG end marker) is wrong, else None."""
+    suffix = os.path.splitext(path)[1].lower()
+    try:
+        with open(path, "rb") as f:
+            head = f.read(4)
+            if not head:
+                return "empty file"
+            magic = MAGIC.get(suffix)
+            if magic and not head.startswith(magic):
+                return "bad header"
+            if magic == MAGIC[".jpg"]:
+                f.seek(-2, 2)
+                if f.read() != b"\xff\xd9":
+                    return "truncated JPEG"
+    except OSError as e:
+        return str(e)
+    return None
+
+
+def check_label(path):
+    """
+    Check a YOLO-OBB label file (class x1 y1 x2 y2 x3 y3 x4 y4, normalized).
+
+    Returns (error, degenerate line numbers): error is a syntax problem string or None.
+    """
+    degenerate = []
+    with open(path) as f:
+        for n, line in enumerate(f, 1):
+            parts = line.split()
+            if not parts:
+                continue
+            if len(parts) != 9:
+                return f"line {n}: expected 9 fields, got {len(parts)}", degenerate
+            try:
+                cls = int(parts[0])
+                xy = [float(p) for p in parts[1:]]
+            except ValueError:
+                return f"line {n}: non-numeric field", degenerate
+            if cls < 0:
+                return f"line {n}: negative class", degenerate
+            if min(xy) < -0.01 or max(xy) > 1.01:
+                return f"line {n}: coordinates outside [0, 1]", degenerate
+            xs, ys = xy[0::2], xy[1::2]
+            area = 0.5 * abs(sum(xs[i] * ys[i - 1] - xs[i - 1] * ys[i] for i in range(4)))
+            if area < MIN_AREA:
+                degenerate.append(n)
+    return None, degenerate
+
+
+def scan_split(im_dir, lb_dir, workers=16):
+    """
+    Scan one split for orphan images, orphan labels, corrupt images, invalid labels and degenerate boxes.
+    Args:
+        im_dir (str): Image directory
+        lb_dir (str): label directory
+        workers (int): Number of threads for the header and label checks
+    Returns:
+        (dict): Machine-readable report
+    """
+    images = list_stems(im_dir, IMG_FORMATS)
+    labels = list_stems(lb_dir, {".txt"})
+    paired = images.keys() & labels.keys()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        image_errors = dict(zip(images.values(), executor.map(check_image, images.values())))
+        label_results = dict(zip(labels.values(), executor.map(check_label, labels.values())))
+
+    return {
+        "images": len(images),
+        "labels": len(labels),
+        "paired": len(paired),
+        "orphan_images": sorted(images[s] for s in images.keys() - labels.keys()),
+        "orphan_labels": sorted(labels[s] for s in labels.keys() - images.keys()),
+        "corrupt_images": {p: e for p, e in sorted(image_errors.items()) if e},
+        "invalid_labels": {p: r[0] for p, r in sorted(label_results.items()) if r[0]},
+        "degenerate_boxes": {p: r[1] for p, r in sorted(label_results.items()) if r[1]},
+    }
+
+
+def remove_files(report, kinds=("orphan_images",), dry_run=True):
+    """Delete the files listed under the given report keys; with dry_run only print what would be deleted."""
+    for kind in kinds:
+        for path in report[kind]:
+            print(f"{'Would delete' if dry_run else 'Deleting'} {path} ({kind}).")
+            if not dry_run:
+                os.remove(path)
+
+
+def remove_images_without_labels(im_dir, lb_dir, report_file=None, dry_run=False, suffixes=(".jpg",)):
     """
     Remove images that do not contain target instances.
     Args:
         im_dir (str): Image directory
         lb_dir (str): label directory
+        report_file (str): Optional path of the JSON integrity report
+        dry_run (bool): Only print the files that would be deleted
+        suffixes (tuple): Suffixes of the orphan images to delete, the report still covers every image format
     """
-    im_dir = Path(im_dir)
-    lb_dir = Path(lb_dir)
-
-    for im_file in im_dir.glob("*.jpg"):
-        label_file = lb_dir / (im_file.stem + ".txt")
-        if not label_file.exists():
-            print(f"Deleting {im_file} because it has no label.")
-            os.remove(im_file)
-
-print("删除--train--中的无标签图片")
-remove_images_without_labels("/root/autodl-tmp/ultralytics-main/dataset/YRBD_ms/images/train",
-                             "/root/autodl-tmp/ultralytics-main/dataset/YRBD_ms/labels/train")
-print("删除--val--中的无标签图片")
-remove_images_without_labels("/root/autodl-tmp/ultralytics-main/dataset/YRBD_ms/images/val",
-                             "/root/autodl-tmp/ultralytics-main/dataset/YRBD_ms/labels/val")
-print("删除--test--中的无标签图片")
-remove_images_without_labels("/root/autodl-tmp/ultralytics-main/dataset/YRBD_ms/images/test",
-                             "/root/autodl-tmp/ultralytics-main/dataset/YRBD_ms/labels/test")
\ No newline at end of file
+    report = scan_split(im_dir, lb_dir)
+    if report_file:
+        Path(report_file).write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    print(
+        f"images {report['images']}, labels {report['labels']}, orphan images {len(report['orphan_images'])}, "
+        f"orphan labels {len(report['orphan_labels'])}, corrupt images {len(report['corrupt_images'])}, "
+        f"invalid labels {len(report['invalid_labels'])}, files with degenerate boxes {len(report['degenerate_boxes'])}"
+    )
+    labels = list_stems(lb_dir, {".txt"})
+    with os.scandir(im_dir) as entries:
+        orphans = sorted(
+            entry.path
+            for entry in entries
+            if os.path.splitext(entry.name)[1] in suffixes and os.path.splitext(entry.name)[0] not in labels
+        )
+    remove_files({"orphan_images": orphans}, dry_run=dry_run)
+    return report
+
+
+if __name__ == "__main__":
+    root = "/root/autodl-tmp/ultralytics-main/dataset/YRBD_ms"
+    for split in ("train", "val", "test"):
+        print(f"删除--{split}--中的无标签图片")
+        remove_images_without_labels(f"{root}/images/{split}", f"{root}/labels/{split}",
+                                     report_file=f"{root}/integrity_{split}.json")
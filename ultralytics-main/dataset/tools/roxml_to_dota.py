@@ -1,147 +1,101 @@
 import os
 import xml.etree.ElementTree as ET
-import math
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
 
 cls_list = ['dam', 'groyne', 'lock', 'sluice', 'weir']  # Modify to your own labels.
 
 
-def edit_xml(xml_file, dotaxml_file):
-    tree = ET.parse(xml_file)
-    objs = tree.findall('object')
-    for ix, obj in enumerate(objs):
-        x0 = ET.Element("x0")
-        y0 = ET.Element("y0")
-        x1 = ET.Element("x1")
-        y1 = ET.Element("y1")
-        x2 = ET.Element("x2")
-        y2 = ET.Element("y2")
-        x3 = ET.Element("x3")
-        y3 = ET.Element("y3")
-        # obj_type = obj.find('bndbox')
-        # type = obj_type.text
-        # print(xml_file)
-
-        if (obj.find('robndbox') == None):
-            obj_bnd = obj.find('bndbox')
-            obj_xmin = obj_bnd.find('xmin')
-            obj_ymin = obj_bnd.find('ymin')
-            obj_xmax = obj_bnd.find('xmax')
-            obj_ymax = obj_bnd.find('ymax')
-            # 以防有负值坐标
-            xmin = max(float(obj_xmin.text), 0)
-            ymin = max(float(obj_ymin.text), 0)
-            xmax = max(float(obj_xmax.text), 0)
-            ymax = max(float(obj_ymax.text), 0)
-            obj_bnd.remove(obj_xmin)  # 删除节点
-            obj_bnd.remove(obj_ymin)
-            obj_bnd.remove(obj_xmax)
-            obj_bnd.remove(obj_ymax)
-            x0.text = str(xmin)
-            y0.text = str(ymax)
-            x1.text = str(xmax)
-            y1.text = str(ymax)
-            x2.text = str(xmax)
-            y2.text = str(ymin)
-            x3.text = str(xmin)
-            y3.text = str(ymin)
+def parse_xml(xml_file):
+    """
+    Parse a roLabelImg XML file once.
+    Returns the class names, an (n, 5) array of (cx, cy, w, h, angle) for robndbox objects or
+    (xmin, ymin, xmax, ymax, nan) for bndbox objects, a boolean mask of rotated objects and the image (width, height).
+    """
+    root = ET.parse(xml_file).getroot()
+    names, boxes, rotated = [], [], []
+    for obj in root.iter('object'):
+        names.append(obj.find('name').text)
+        robndbox = obj.find('robndbox')
+        if robndbox is None:
+            bndbox = obj.find('bndbox')
+            boxes.append([float(bndbox.find(k).text) for k in ('xmin', 'ymin', 'xmax', 'ymax')] + [np.nan])
+            rotated.append(False)
         else:
-            obj_bnd = obj.find('robndbox')
-            obj_bnd.tag = 'bndbox'
-            obj_cx = obj_bnd.find('cx')
-            obj_cy = obj_bnd.find('cy')
-            obj_w = obj_bnd.find('w')
-            obj_h = obj_bnd.find('h')
-            obj_angle = obj_bnd.find('angle')
-            cx = float(obj_cx.text)
-            cy = float(obj_cy.text)
-            w = float(obj_w.text)
-            h = float(obj_h.text)
-            angle = float(obj_angle.text)
-            obj_bnd.remove(obj_cx)  # 删除节点
-            obj_bnd.remove(obj_cy)
-            obj_bnd.remove(obj_w)
-            obj_bnd.remove(obj_h)
-            obj_bnd.remove(obj_angle)
-
-            x0.text, y0.text = rotatePoint(cx, cy, cx - w / 2, cy - h / 2, -angle)
-            x1.text, y1.text = rotatePoint(cx, cy, cx + w / 2, cy - h / 2, -angle)
-            x2.text, y2.text = rotatePoint(cx, cy, cx + w / 2, cy + h / 2, -angle)
-            x3.text, y3.text = rotatePoint(cx, cy, cx - w / 2, cy + h / 2, -angle)
-
-        # obj.remove(obj_type)
-        obj_bnd.append(x0)
-        obj_bnd.append(y0)
-        obj_bnd.append(x1)
-        obj_bnd.append(y1)
-        obj_bnd.append(x2)
-        obj_bnd.append(y2)
-        obj_bnd.append(x3)
-        obj_bnd.append(y3)
-
-        tree.write(dotaxml_file, method='xml', encoding='utf-8')
-
-def rotatePoint(xc, yc, xp, yp, theta):
-    xoff = xp - xc;
-    yoff = yp - yc;
-    cosTheta = math.cos(theta)
-    sinTheta = math.sin(theta)
-    pResx = cosTheta * xoff + sinTheta * yoff
-    pResy = - sinTheta * xoff + cosTheta * yoff
-    return str(int(xc + pResx)), str(int(yc + pResy))
-
-def totxt(xml_path, out_path):
-    files = os.listdir(xml_path)
-    i = 0
-    for file in files:
-
-        tree = ET.parse(xml_path + os.sep + file)
-        root = tree.getroot()
-
-        name = file.split('.')[0]
-
-        output = out_path + '\\' + name + '.txt'
-        file = open(output, 'w')
-        i = i + 1
-        objs = tree.findall('object')
-        for obj in objs:
-            cls = obj.find('name').text
-            box = obj.find('bndbox')
-            x0 = int(float(box.find('x0').text))
-            y0 = int(float(box.find('y0').text))
-            x1 = int(float(box.find('x1').text))
-            y1 = int(float(box.find('y1').text))
-            x2 = int(float(box.find('x2').text))
-            y2 = int(float(box.find('y2').text))
-            x3 = int(float(box.find('x3').text))
-            y3 = int(float(box.find('y3').text))
-            if x0 < 0:
-                x0 = 0
-            if x1 < 0:
-                x1 = 0
-            if x2 < 0:
-                x2 = 0
-            if x3 < 0:
-                x3 = 0
-            if y0 < 0:
-                y0 = 0
-            if y1 < 0:
-                y1 = 0
-            if y2 < 0:
-                y2 = 0
-            if y3 < 0:
-                y3 = 0
-            for cls_index, cls_name in enumerate(cls_list):
-                if cls == cls_name:
-                    file.write("{} {} {} {} {} {} {} {} {} {}\n".format(x0, y0, x1, y1, x2, y2, x3, y3, cls, cls_index))
-        file.close()
-        # print(output)
-        print(i)
+            boxes.append([float(robndbox.find(k).text) for k in ('cx', 'cy', 'w', 'h', 'angle')])
+            rotated.append(True)
+    size = root.find('size')
+    image_size = None
+    if size is not None and size.find('width') is not None:
+        image_size = (float(size.find('width').text), float(size.find('height').text))
+    return names, np.array(boxes, dtype=np.float64).reshape(-1, 5), np.array(rotated, dtype=bool), image_size
+
+
+def box_corners(boxes, rotated):
+    """
+    Compute the four DOTA corners of every object in one vectorized call.
+    Rotated boxes are rotated by -angle around their centre (same convention as the former rotatePoint);
+    horizontal boxes are ordered (xmin, ymax), (xmax, ymax), (xmax, ymin), (xmin, ymin).
+    Coordinates are truncated to integers and clipped at 0. Returns an (n, 4, 2) int array.
+    """
+    corners = np.empty((len(boxes), 4, 2), dtype=np.float64)
+
+    cx, cy, w, h, angle = boxes[rotated].T
+    dx = np.stack([-w, w, w, -w], axis=1) / 2
+    dy = np.stack([-h, -h, h, h], axis=1) / 2
+    cos, sin = np.cos(-angle)[:, None], np.sin(-angle)[:, None]
+    corners[rotated, :, 0] = np.trunc(cx[:, None] + cos * dx + sin * dy)
+    corners[rotated, :, 1] = np.trunc(cy[:, None] - sin * dx + cos * dy)
+
+    xmin, ymin, xmax, ymax = np.maximum(boxes[~rotated, :4], 0).T
+    corners[~rotated, :, 0] = np.stack([xmin, xmax, xmax, xmin], axis=1)
+    corners[~rotated, :, 1] = np.stack([ymax, ymax, ymin, ymin], axis=1)
+
+    return np.maximum(np.trunc(corners), 0).astype(np.int64)
+
+
+def convert_file(file, xml_path, out_path, yolo_path=None):
+    """Convert one XML file to a DOTA txt (and optionally a YOLO-OBB txt). Returns the number of objects written."""
+    names, boxes, rotated, image_size = parse_xml(os.path.join(xml_path, file))
+    if yolo_path is not None and image_size is None:
+        raise ValueError(f'{file} has no <size> element, cannot normalize YOLO-OBB coordinates.')
+    corners = box_corners(boxes, rotated)
+    name = file.split('.')[0]
+
+    lines, yolo_lines = [], []
+    for cls, pts in zip(names, corners):
+        if cls not in cls_list:
+            continue
+        cls_index = cls_list.index(cls)
+        lines.append("{} {} {} {} {} {} {} {} {} {}\n".format(*pts.ravel(), cls, cls_index))
+        if yolo_path is not None:
+            normalized = pts / np.asarray(image_size)
+            yolo_lines.append(f"{cls_index} {' '.join(f'{coord:.6g}' for coord in normalized.ravel())}\n")
+
+    with open(os.path.join(out_path, name + '.txt'), 'w') as f:
+        f.writelines(lines)
+    if yolo_path is not None:
+        with open(os.path.join(yolo_path, name + '.txt'), 'w') as f:
+            f.writelines(yolo_lines)
+    return len(lines)
+
+
+def convert(xml_path, out_path, yolo_path=None, workers=None):
+    """Convert every XML file in xml_path to DOTA txt files in out_path (and YOLO-OBB txt files in yolo_path)."""
+    os.makedirs(out_path, exist_ok=True)
+    if yolo_path is not None:
+        os.makedirs(yolo_path, exist_ok=True)
+    files = [f for f in os.listdir(xml_path) if f.endswith('.xml')]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        counts = list(executor.map(partial(convert_file, xml_path=xml_path, out_path=out_path, yolo_path=yolo_path),
+                                   files, chunksize=64))
+    print(f'{len(files)} files, {sum(counts)} objects converted.')
+
 
 if __name__ == '__main__':
     roxml_path = r'G:\ultralytics-main\dataset\yolodata\origin_xml'  # Path to the original XML file.
-    dotaxml_path = r'G:\ultralytics-main\dataset\yolodata\dota_xml'  # Path to the converted XML file that can be recognized by DOTA. The path must exist; otherwise, an error will occur.
-    out_path = r'G:\ultralytics-main\dataset\yolodata\dota_txt'  # Path of the converted txt file in dota format, the path needs to exist, or an error will be reported.
-    filelist = os.listdir(roxml_path)
-    for file in filelist:
-        edit_xml(os.path.join(roxml_path, file), os.path.join(dotaxml_path, file))
-    totxt(dotaxml_path, out_path)
\ No newline at end of file
+    out_path = r'G:\ultralytics-main\dataset\yolodata\dota_txt'  # Path of the converted txt file in dota format.
+    yolo_path = None  # Optional path of YOLO-OBB txt files, e.g. r'G:\ultralytics-main\dataset\yolodata\yolo_txt'.
+    convert(roxml_path, out_path, yolo_path)
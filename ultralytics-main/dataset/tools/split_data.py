@@ -1,5 +1,5 @@
-import os, shutil, random
-random.seed(0)
+import os, shutil
+from collections import Counter
 import numpy as np
 from sklearn.model_selection import train_test_split
 
@@ -9,26 +9,103 @@ postfix = 'jpg'
 imgpath = 'dataset/yolodata/images'
 txtpath = 'dataset/yolodata/labels'
 
-os.makedirs('images/train', exist_ok=True)
-os.makedirs('images/val', exist_ok=True)
-os.makedirs('images/test', exist_ok=True)
-os.makedirs('labels/train', exist_ok=True)
-os.makedirs('labels/val', exist_ok=True)
-os.makedirs('labels/test', exist_ok=True)
-
-listdir = np.array([i for i in os.listdir(txtpath) if 'txt' in i])
-random.shuffle(listdir)
-train, val, test = listdir[:int(len(listdir) * (1 - val_size - test_size))], listdir[int(len(listdir) * (1 - val_size - test_size)):int(len(listdir) * (1 - test_size))], listdir[int(len(listdir) * (1 - test_size)):]
-print(f'train set size:{len(train)} val set size:{len(val)} test set size:{len(test)}')
-
-for i in train:
-    shutil.copy('{}/{}.{}'.format(imgpath, i[:-4], postfix), 'images/train/{}.{}'.format(i[:-4], postfix))
-    shutil.copy('{}/{}'.format(txtpath, i), 'labels/train/{}'.format(i))
-
-for i in val:
-    shutil.copy('{}/{}.{}'.format(imgpath, i[:-4], postfix), 'images/val/{}.{}'.format(i[:-4], postfix))
-    shutil.copy('{}/{}'.format(txtpath, i), 'labels/val/{}'.format(i))
-
-for i in test:
-    shutil.copy('{}/{}.{}'.format(imgpath, i[:-4], postfix), 'images/test/{}.{}'.format(i[:-4], postfix))
-    shutil.copy('{}/{}'.format(txtpath, i), 'labels/test/{}'.format(i))
\ No newline at end of file
+# How splits are materialized:
+#   'auto'     - hard link, then reflink, then symlink, falling back to a copy
+#   'hardlink' / 'reflink' / 'symlink' / 'copy' - force one method (falls back to a copy if it fails)
+#   'manifest' - write images/{train,val,test}.txt lists of the original images instead of touching files;
+#                point the data yaml at them (train: path/to/train.txt), YOLODataset resolves labels from
+#                the sibling 'labels' folder of each image
+link_mode = 'auto'
+# Stratify the split by the dominant barrier class of each label file
+stratify = True
+
+FICLONE = 0x40049409  # Linux ioctl for copy-on-write clones (btrfs, xfs, ...)
+
+
+def reflink(src, dst):
+    """Create a copy-on-write clone of src at dst, raising OSError where unsupported."""
+    import fcntl
+
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.remove(dst)
+            raise
+
+
+LINKERS = {
+    'hardlink': os.link,
+    'reflink': reflink,
+    'symlink': lambda src, dst: os.symlink(os.path.abspath(src), dst),
+    'copy': shutil.copy,
+}
+
+
+def materialize(src, dst, mode='auto'):
+    """Place src at dst using the first method of `mode` that works, returning the method used."""
+    if os.path.lexists(dst):
+        os.remove(dst)
+    methods = ['hardlink', 'reflink', 'symlink', 'copy'] if mode == 'auto' else [mode, 'copy']
+    for method in methods:
+        try:
+            LINKERS[method](src, dst)
+            return method
+        except (OSError, ImportError, NotImplementedError):
+            continue
+    raise OSError(f'could not materialize {src} at {dst}')
+
+
+def dominant_class(label_file):
+    """Most frequent class index in a YOLO label file, or -1 for an empty file."""
+    with open(label_file) as f:
+        classes = Counter(line.split()[0] for line in f if line.strip())
+    return classes.most_common(1)[0][0] if classes else -1
+
+
+def split_files(files, labels=None):
+    """Split files into train/val/test, stratified by labels when given (rare classes are pooled)."""
+    files = np.asarray(files)
+    if val_size + test_size == 0:
+        return files, files[:0], files[:0]
+    if labels is not None:
+        counts = Counter(labels)
+        labels = np.array([str(label) if counts[label] >= 10 else 'rare' for label in labels])
+        # train_test_split needs at least two members per stratum
+        if min(Counter(labels).values()) < 2:
+            labels = None
+    train, rest, _, rest_labels = train_test_split(files, labels if labels is not None else files,
+                                                   test_size=val_size + test_size, random_state=0, stratify=labels)
+    if test_size == 0:
+        return train, rest, rest[:0]
+    if val_size == 0:
+        return train, rest[:0], rest
+    if labels is None or min(Counter(rest_labels).values()) < 2:
+        rest_labels = None
+    val, test = train_test_split(rest, test_size=test_size / (val_size + test_size), random_state=0,
+                                 stratify=rest_labels)
+    return train, val, test
+
+
+if __name__ == '__main__':
+    listdir = np.array(sorted(i for i in os.listdir(txtpath) if 'txt' in i))
+    labels = [dominant_class(os.path.join(txtpath, i)) for i in listdir] if stratify else None
+    train, val, test = split_files(listdir, labels)
+    print(f'train set size:{len(train)} val set size:{len(val)} test set size:{len(test)}')
+
+    methods = Counter()
+    for split, names in (('train', train), ('val', val), ('test', test)):
+        images = ['{}/{}.{}'.format(imgpath, i[:-4], postfix) for i in names]
+        if link_mode == 'manifest':
+            os.makedirs('images', exist_ok=True)
+            with open('images/{}.txt'.format(split), 'w') as f:
+                f.writelines(os.path.abspath(image) + '\n' for image in images)
+            continue
+        os.makedirs('images/{}'.format(split), exist_ok=True)
+        os.makedirs('labels/{}'.format(split), exist_ok=True)
+        for i, image in zip(names, images):
+            methods[materialize(image, 'images/{}/{}.{}'.format(split, i[:-4], postfix), link_mode)] += 1
+            methods[materialize('{}/{}'.format(txtpath, i), 'labels/{}/{}'.format(split, i), link_mode)] += 1
+    if methods:
+        print('files materialized by method: ' + ', '.join(f'{k}={v}' for k, v in methods.items()))
@@ -2,6 +2,7 @@
 
 import contextlib
 import csv
+import math
 import urllib
 from copy import copy
 from pathlib import Path
@@ -345,6 +346,37 @@ def test_data_annotator():
     )
 
 
+def test_data_patch_dataset():
+    """Test that YOLOPatchDataset crops the same windows and labels as the offline DOTA split."""
+    from ultralytics.cfg import get_cfg
+    from ultralytics.data.build import build_yolo_dataset
+    from ultralytics.data.split_dota import split_images_and_labels
+
+    root = TMP / "patch_dataset"
+    (root / "images" / "train").mkdir(parents=True)
+    (root / "labels" / "train").mkdir(parents=True)
+    scene = np.random.randint(0, 255, (1200, 1500, 3), dtype=np.uint8)
+    cv2.imwrite(str(root / "images" / "train" / "scene.png"), scene)
+    polys = np.array([[100, 100, 200, 100, 200, 150, 100, 150], [950, 500, 1100, 480, 1110, 560, 960, 580]]) / 1500
+    polys[:, 1::2] *= 1500 / 1200
+    np.savetxt(root / "labels" / "train" / "scene.txt", np.concatenate(([[0], [1]], polys), 1), fmt="%.6g")
+
+    split_images_and_labels(root, root / "split", crop_sizes=(1024,), gaps=(200,))
+    data = {"names": {0: "a", 1: "b"}, "patches": {"crop_sizes": (1024,), "gaps": (200,)}}
+    dataset = build_yolo_dataset(get_cfg(overrides={"task": "obb"}), str(root / "images" / "train"), 2, data, "val")
+    assert sorted(Path(f).stem for f in dataset.im_files) == sorted(
+        f.stem for f in (root / "split" / "images" / "train").glob("*.jpg")
+    )
+    for i, label in enumerate(dataset.labels):
+        x_start, y_start, x_stop, y_stop = label["window"]
+        assert np.array_equal(dataset.read_image(i), scene[y_start:y_stop, x_start:x_stop])
+        label_file = root / "split" / "labels" / "train" / f"{Path(label['im_file']).stem}.txt"
+        expected = np.loadtxt(label_file, ndmin=2) if label_file.exists() else np.zeros((0, 9))
+        window_label = np.concatenate((label["cls"], np.array(label["segments"]).reshape(-1, 8)), 1)
+        np.testing.assert_allclose(window_label, expected, atol=1e-5)
+    assert dataset[0]["img"].shape[1:] == (640, 640)
+
+
 def test_events():
     """Test event sending functionality."""
     from ultralytics.hub.utils import Events
@@ -447,6 +479,115 @@ def test_utils_ops():
     torch.allclose(boxes, xyxyxyxy2xywhr(xywhr2xyxyxyxy(boxes)), rtol=1e-3)
 
 
+def test_utils_nms_rotated():
+    """Test blocked rotated NMS against dense fast-NMS and a greedy NMS loop."""
+    from ultralytics.utils.metrics import batch_probiou
+    from ultralytics.utils.ops import nms_rotated
+
+    boxes = torch.cat((torch.rand(2000, 2) * 1000, torch.rand(2000, 2) * 80 + 5, torch.rand(2000, 1) * 3), 1)
+    scores = torch.rand(2000)
+    order = scores.argsort(descending=True)
+    ious = batch_probiou(boxes[order], boxes[order]).triu_(diagonal=1)
+    fast = order[ious.max(0)[0] < 0.45]
+    assert torch.equal(nms_rotated(boxes, scores, 0.45, block_size=256, max_pairs=5000).sort()[0], fast.sort()[0])
+
+    suppressed, greedy = torch.zeros(2000, dtype=torch.bool), []
+    for i in range(2000):
+        if not suppressed[i]:
+            greedy.append(order[i])
+            suppressed |= ious[i] >= 0.45
+    keep = nms_rotated(boxes, scores, 0.45, greedy=True, block_size=256)
+    assert torch.equal(keep.sort()[0], torch.stack(greedy).sort()[0])
+
+
+def test_utils_batched_nms_rotated():
+    """Test batched rotated NMS of several images against NMS of each image separately."""
+    from ultralytics.utils.ops import batched_nms_rotated, nms_rotated, non_max_suppression
+
+    boxes = torch.cat((torch.rand(600, 2) * 300, torch.rand(600, 2) * 60 + 5, torch.rand(600, 1) * 3), 1)
+    scores, idxs = torch.rand(600), torch.randint(0, 6, (600,))
+    keep = batched_nms_rotated(boxes, scores, idxs, 0.45)
+    for g in range(6):
+        i = (idxs == g).nonzero().squeeze(-1)
+        assert torch.equal(keep[idxs[keep] == g].sort()[0], i[nms_rotated(boxes[i], scores[i], 0.45)].sort()[0])
+
+    # non_max_suppression against NMS of each image with class offsets, with and without capped candidates
+    torch.manual_seed(0)
+    prediction = torch.cat((torch.rand(4, 2, 500) * 640, torch.rand(4, 2, 500) * 60 + 5, torch.rand(4, 3, 500)), 1)
+    prediction = torch.cat((prediction, torch.rand(4, 1, 500) * 3), 1)  # xywh, 3 classes, angle
+    prediction[2, 4:7] = 0  # an image without detections
+    for max_nms, max_det in ((30000, 300), (150, 40)):
+        output = non_max_suppression(prediction, 0.25, 0.45, nc=3, max_det=max_det, max_nms=max_nms, rotated=True)
+        assert len(output) == 4
+        for x, pred in zip(output, prediction):
+            pred = pred.T
+            conf, j = pred[:, 4:7].max(1, keepdim=True)
+            pred = torch.cat((pred[:, :4], conf, j.float(), pred[:, 7:]), 1)[conf.view(-1) > 0.25]
+            pred = pred[pred[:, 4].argsort(descending=True)[:max_nms]]
+            c = pred[:, 5:6] * 7680  # class offsets
+            i = nms_rotated(torch.cat((pred[:, :2] + c, pred[:, 2:4], pred[:, 6:]), 1), pred[:, 4], 0.45)
+            assert torch.equal(x, pred[i[:max_det]])
+
+
+def test_utils_polyiou():
+    """Test exact polygon IoU of rotated boxes and rotated NMS with the polygon IoU backend."""
+    from ultralytics.utils.metrics import batch_polyiou, polyiou
+    from ultralytics.utils.ops import nms_rotated
+
+    box = torch.tensor([[50.0, 50.0, 40.0, 20.0, 0.3]])
+    shifted = box + torch.tensor([[20.0 * math.cos(0.3), 20.0 * math.sin(0.3), 0.0, 0.0, 0.0]])
+    assert torch.allclose(polyiou(box, box), torch.ones(1), atol=1e-5)
+    assert torch.allclose(polyiou(box, shifted), torch.tensor([1 / 3]), atol=1e-5)  # half of each box overlaps
+
+    boxes = torch.cat((torch.rand(500, 2) * 500, torch.rand(500, 2) * 80 + 5, torch.rand(500, 1) * 3), 1)
+    scores = torch.rand(500)
+    order = scores.argsort(descending=True)
+    ious = batch_polyiou(boxes[order], boxes[order]).triu_(diagonal=1)
+    fast = order[ious.max(0)[0] < 0.45]
+    keep = nms_rotated(boxes, scores, 0.45, block_size=128, iou_type="poly")
+    assert torch.equal(keep.sort()[0], fast.sort()[0])
+
+
+def test_utils_rotated_assigner_sparse():
+    """Test the sparse rotated task-aligned assignment against the dense one."""
+    from ultralytics.utils.tal import RotatedTaskAlignedAssigner, make_anchors
+
+    anchors, strides = make_anchors([torch.zeros(1, 1, 256 // s, 256 // s) for s in (8, 16, 32)], [8, 16, 32])
+    anchors = anchors * strides
+    pd_scores = torch.rand(2, len(anchors), 3)
+    pd_bboxes = torch.cat((anchors.expand(2, -1, -1) + 2, torch.rand(2, len(anchors), 2) * 40 + 8), -1)
+    pd_bboxes = torch.cat((pd_bboxes, torch.rand(2, len(anchors), 1)), -1)
+    gt_bboxes = torch.cat((torch.rand(2, 20, 2) * 256, torch.rand(2, 20, 2) * 60 + 4, torch.rand(2, 20, 1) * 3), -1)
+    gt_labels = torch.randint(0, 3, (2, 20, 1)).float()
+    mask_gt = torch.ones(2, 20, 1)
+    mask_gt[1, 12:] = 0  # padded gts
+    args = (pd_scores, pd_bboxes, anchors, gt_labels, gt_bboxes * mask_gt, mask_gt)
+    dense = RotatedTaskAlignedAssigner(topk=10, num_classes=3, alpha=0.5, beta=6.0)(*args)
+    sparse = RotatedTaskAlignedAssigner(topk=10, num_classes=3, alpha=0.5, beta=6.0, sparse=True, block_size=2048)
+    sparse = sparse(*args)
+    for x, y in zip(dense, sparse):
+        assert torch.allclose(x.float(), y.float(), atol=1e-6)
+
+
+def test_loss_preprocess():
+    """Test that the loss target preprocessing pads the targets of each image in order."""
+    from types import SimpleNamespace
+
+    from ultralytics.utils.loss import v8DetectionLoss, v8OBBLoss
+
+    targets = torch.tensor(
+        [[0, 1, 0.5, 0.5, 0.2, 0.2, 0.1], [2, 3, 0.1, 0.2, 0.3, 0.4, 0.2], [0, 2, 0.3, 0.3, 0.2, 0.2, 0.3]]
+    )  # batch index, class, xywh, angle
+    scale = torch.tensor([100.0, 50.0, 100.0, 50.0])
+    out = v8OBBLoss.preprocess(SimpleNamespace(device="cpu"), targets, 3, scale)
+    assert out.shape == (3, 2, 6) and not out[1].any()
+    assert torch.allclose(out[0, 1], torch.tensor([2.0, 30, 15, 20, 10, 0.3]))
+    assert torch.allclose(out[2, 0], torch.tensor([3.0, 10, 10, 30, 20, 0.2]))
+
+    out = v8DetectionLoss.preprocess(SimpleNamespace(device="cpu"), targets[:, :6], 3, scale)
+    assert out.shape == (3, 2, 5) and torch.allclose(out[0, 0], torch.tensor([1.0, 40, 20, 60, 30]))
+
+
 def test_utils_files():
     """Test file handling utilities including file age, date, and paths with spaces."""
     from ultralytics.utils.files import file_age, file_date, get_latest_run, spaces_in_path
@@ -148,21 +148,24 @@ class BaseDataset(Dataset):
             if self.single_cls:
                 self.labels[i]["cls"][:, 0] = 0
 
+    def read_image(self, i):
+        """Reads image 'i' from its *.npy cache or image file, returns the BGR image or None if it can't be read."""
+        f, fn = self.im_files[i], self.npy_files[i]
+        if fn.exists():  # load npy
+            try:
+                return np.load(fn)
+            except Exception as e:
+                LOGGER.warning(f"{self.prefix}WARNING ⚠️ Removing corrupt *.npy image file {fn} due to: {e}")
+                Path(fn).unlink(missing_ok=True)
+        return cv2.imread(f)  # BGR
+
     def load_image(self, i, rect_mode=True):
         """Loads 1 image from dataset index 'i', returns (im, resized hw)."""
-        im, f, fn = self.ims[i], self.im_files[i], self.npy_files[i]
+        im = self.ims[i]
         if im is None:  # not cached in RAM
-            if fn.exists():  # load npy
-                try:
-                    im = np.load(fn)
-                except Exception as e:
-                    LOGGER.warning(f"{self.prefix}WARNING ⚠️ Removing corrupt *.npy image file {fn} due to: {e}")
-                    Path(fn).unlink(missing_ok=True)
-                    im = cv2.imread(f)  # BGR
-            else:  # read image
-                im = cv2.imread(f)  # BGR
+            im = self.read_image(i)
             if im is None:
-                raise FileNotFoundError(f"Image Not Found {f}")
+                raise FileNotFoundError(f"Image Not Found {self.im_files[i]}")
 
             h0, w0 = im.shape[:2]  # orig hw
             if rect_mode:  # resize long side to imgsz while maintaining aspect ratio
@@ -1,7 +1,7 @@
 # Ultralytics YOLO 🚀, AGPL-3.0 license
 
 import json
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from itertools import repeat
 from multiprocessing.pool import ThreadPool
 from pathlib import Path
@@ -13,7 +13,7 @@ from PIL import Image
 from torch.utils.data import ConcatDataset
 
 from ultralytics.utils import LOCAL_RANK, NUM_THREADS, TQDM, colorstr
-from ultralytics.utils.ops import resample_segments
+from ultralytics.utils.ops import resample_segments, segments2boxes, xywh2xyxy
 from ultralytics.utils.torch_utils import TORCHVISION_0_18
 
 from .augment import (
@@ -246,6 +246,135 @@ class YOLODataset(BaseDataset):
         return new_batch
 
 
+class YOLOPatchDataset(YOLODataset):
+    """
+    Dataset of sliding windows over large scenes, cropped on the fly instead of written to disk by split_dota.
+
+    The windows of every scene and their objects are computed once with `split_dota.get_windows` and
+    `split_dota.get_window_obj` and cached in a `*.patches.cache` file next to the labels cache, so the dataset only
+    holds the scene paths and the window table. Windows are cropped when loaded from scenes decoded once into
+    memory-mapped *.npy files (see `split_dota.load_scene`); GeoTIFFs are read window by window if GDAL is installed.
+    Objects truncated by a window keep their corners outside of it, like the labels written by split_dota.
+
+    Args:
+        crop_sizes (tuple): Window sizes. Defaults to (1024,).
+        gaps (tuple): Gaps between windows, one per crop size. Defaults to (200,).
+        rates (tuple): Multi-scale rates, every crop size and gap is divided by each rate. Defaults to (1.0,).
+        iof_thr (float): Minimum intersection over object area to keep an object in a window. Defaults to 0.7.
+        scene_cache (str, optional): Directory of the decoded scenes. Defaults to '<labels dir>.scenes'.
+        max_open_scenes (int): Number of memory-mapped scenes kept open by each worker. Defaults to 64.
+    """
+
+    def __init__(
+        self,
+        *args,
+        crop_sizes=(1024,),
+        gaps=(200,),
+        rates=(1.0,),
+        iof_thr=0.7,
+        scene_cache=None,
+        max_open_scenes=64,
+        **kwargs,
+    ):
+        """Initializes the YOLOPatchDataset with the sliding window configuration."""
+        assert len(crop_sizes) == len(gaps), "crop_sizes and gaps should have the same length"
+        self.crop_sizes = [int(size / r) for r in rates for size in crop_sizes]
+        self.gaps = [int(gap / r) for r in rates for gap in gaps]
+        self.iof_thr = iof_thr
+        self.scene_cache = scene_cache
+        self.max_open_scenes = max_open_scenes
+        self.scenes = OrderedDict()  # LRU of opened scenes
+        super().__init__(*args, **kwargs)
+
+    def get_labels(self):
+        """Returns the labels of every window, split from the scene labels once and cached."""
+        scene_labels = super().get_labels()
+        assert not (self.use_segments or self.use_keypoints), "YOLOPatchDataset supports 'detect' and 'obb' tasks"
+        labels_dir = Path(self.label_files[0]).parent
+        if self.scene_cache is None:
+            self.scene_cache = labels_dir.with_suffix(".scenes")
+        cache_path = labels_dir.with_suffix(".patches.cache")
+        params = f"{self.crop_sizes} {self.gaps} {self.iof_thr} {self.use_obb}"
+        key = get_hash(self.label_files + [lb["im_file"] for lb in scene_labels] + [params])
+        try:
+            cache = load_dataset_cache_file(cache_path)
+            assert cache["version"] == DATASET_CACHE_VERSION  # matches current version
+            assert cache["hash"] == key  # identical scenes, labels and windows
+        except (FileNotFoundError, AssertionError, AttributeError):
+            desc = f"{self.prefix}Splitting {len(scene_labels)} scenes into windows..."
+            cache = {"labels": [w for lb in TQDM(scene_labels, desc=desc) for w in self.split_label(lb)], "hash": key}
+            save_dataset_cache_file(self.prefix, cache_path, cache, DATASET_CACHE_VERSION)
+        labels = cache["labels"]
+        self.im_files = [lb["im_file"] for lb in labels]  # virtual window files
+        return labels
+
+    def split_label(self, label):
+        """Splits the label of a scene into the labels of its windows, in the format of YOLODataset labels."""
+        from .split_dota import get_window_obj, get_windows
+
+        h, w = label["shape"]
+        windows = get_windows((h, w), self.crop_sizes, self.gaps)
+        if len(label["segments"]):  # OBB corners
+            polys = np.stack(label["segments"]).reshape(-1, 8)
+        else:  # corners of xywh boxes
+            polys = xywh2xyxy(label["bboxes"])[:, [0, 1, 2, 1, 2, 3, 0, 3]]
+        anno = {"ori_size": (h, w), "label": np.concatenate([label["cls"], polys], axis=1).astype(np.float32)}
+
+        im_file = Path(label["im_file"])
+        window_labels = []
+        for window, objs in zip(windows, get_window_obj(anno, windows, self.iof_thr)):
+            x_start, y_start, x_stop, y_stop = window.tolist()
+            pw, ph = min(x_stop, w) - x_start, min(y_stop, h) - y_start  # cropped window size
+            segments = (objs[:, 1:].reshape(-1, 4, 2) - (x_start, y_start)) / (pw, ph)
+            segments = list(segments.astype(np.float32))
+            window_labels.append(
+                {
+                    "im_file": str(im_file.with_name(f"{im_file.stem}__{x_stop - x_start}__{x_start}___{y_start}"
+                                                     f"{im_file.suffix}")),
+                    "scene_file": label["im_file"],
+                    "window": (x_start, y_start, x_stop, y_stop),
+                    "shape": (ph, pw),
+                    "cls": objs[:, :1],
+                    "bboxes": segments2boxes(segments) if segments else np.zeros((0, 4), dtype=np.float32),
+                    "segments": segments if self.use_obb else [],
+                    "keypoints": None,
+                    "normalized": True,
+                    "bbox_format": "xywh",
+                }
+            )
+        return window_labels
+
+    def get_scene(self, im_file):
+        """Returns the decoded scene 'im_file', keeping the last `max_open_scenes` memory maps open."""
+        from .split_dota import load_scene
+
+        scene = self.scenes.pop(im_file, None)
+        if scene is None:
+            scene = load_scene(im_file, self.scene_cache)
+            if len(self.scenes) >= self.max_open_scenes:
+                self.scenes.popitem(last=False)
+        self.scenes[im_file] = scene
+        return scene
+
+    def read_image(self, i):
+        """Crops window 'i' from its scene."""
+        label = self.labels[i]
+        x_start, y_start, x_stop, y_stop = label["window"]
+        return np.ascontiguousarray(self.get_scene(label["scene_file"])[y_start:y_stop, x_start:x_stop])
+
+    def check_cache_disk(self, safety_margin=0.5):
+        """Windows are already cropped from memory-mapped scenes, *.npy caching of windows is disabled."""
+        LOGGER.info(f"{self.prefix}Scenes are cached in {self.scene_cache}, skipping caching windows to disk")
+        self.cache = None
+        return False
+
+    def update_labels_info(self, label):
+        """Drops the window keys before building instances."""
+        label.pop("scene_file", None)
+        label.pop("window", None)
+        return super().update_labels_info(label)
+
+
 class YOLOMultiModalDataset(YOLODataset):
     """
     Dataset class for loading object detection and/or segmentation labels in YOLO format.
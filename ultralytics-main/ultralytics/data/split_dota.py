@@ -1,6 +1,11 @@
 # Ultralytics YOLO 🚀, AGPL-3.0 license
 
+import hashlib
 import itertools
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from glob import glob
 from math import ceil
 from pathlib import Path
@@ -16,6 +21,11 @@ from ultralytics.utils.checks import check_requirements
 check_requirements("shapely")
 from shapely.geometry import Polygon
 
+try:
+    from osgeo import gdal
+except ImportError:
+    gdal = None
+
 
 def bbox_iof(polygon1, bbox2, eps=1e-6):
     """
@@ -145,7 +155,95 @@ def get_window_obj(anno, windows, iof_thr=0.7):
         return [np.zeros((0, 9), dtype=np.float32) for _ in range(len(windows))]  # window_anns
 
 
-def crop_and_save(anno, windows, window_objs, im_dir, lb_dir):
+class GDALScene:
+    """
+    Read windows of a (tiled) GeoTIFF without decoding the whole scene.
+
+    Windows are sliced like an (h, w, 3) BGR uint8 array, e.g. `scene[y_start:y_stop, x_start:x_stop]`, and only the
+    tiles under the window are read.
+    """
+
+    def __init__(self, path):
+        """Open the GeoTIFF at `path`."""
+        self.dataset = gdal.Open(str(path))
+        if self.dataset is None:
+            raise FileNotFoundError(f"Can't open {path}")
+        self.shape = (self.dataset.RasterYSize, self.dataset.RasterXSize, 3)
+
+    def __getitem__(self, index):
+        """Read the window given by a (rows, cols) pair of slices."""
+        y_start, y_stop, _ = index[0].indices(self.shape[0])
+        x_start, x_stop, _ = index[1].indices(self.shape[1])
+        n = min(self.dataset.RasterCount, 3)
+        w, h = max(x_stop - x_start, 0), max(y_stop - y_start, 0)
+        patch = np.stack([self.dataset.GetRasterBand(i + 1).ReadAsArray(x_start, y_start, w, h) for i in range(n)])
+        if patch.dtype == np.uint16:
+            patch = patch >> 8  # same conversion as cv2.imread
+        patch = np.clip(patch, 0, 255).astype(np.uint8)
+        patch = np.repeat(patch, 3, axis=0) if n == 1 else patch  # gray to BGR
+        return np.ascontiguousarray(patch[::-1].transpose(1, 2, 0))  # RGB to BGR, HWC
+
+
+def load_scene(im_file, cache_dir=None):
+    """
+    Load an image to be split, decoding it at most once.
+
+    GeoTIFFs are read window by window with GDAL if it is installed. Other images are decoded once; with `cache_dir`
+    the decoded pixels are stored as a raw .npy file and memory-mapped, so the scene is paged from disk instead of held
+    in memory and later splits of the same image (e.g. other crop sizes or rates) skip the decoding.
+
+    Args:
+        im_file (str): Image path.
+        cache_dir (str, optional): Directory of the decoded images.
+
+    Returns:
+        (np.ndarray | GDALScene): The (h, w, 3) BGR image.
+    """
+    im_file = Path(im_file)
+    if gdal is not None and im_file.suffix.lower() in {".tif", ".tiff"}:
+        return GDALScene(im_file)
+    if cache_dir is None:
+        return cv2.imread(str(im_file))
+
+    stat = im_file.stat()
+    key = hashlib.md5(f"{im_file.resolve()}{stat.st_size}{stat.st_mtime_ns}".encode()).hexdigest()[:12]
+    cache_file = Path(cache_dir) / f"{im_file.stem}.{key}.npy"  # a changed or different image gets a new key
+    if not cache_file.exists():
+        im = cv2.imread(str(im_file))
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = cache_file.with_suffix(f".{os.getpid()}.{threading.get_ident()}.part.npy")  # concurrent loaders
+        cache = np.lib.format.open_memmap(tmp_file, mode="w+", dtype=im.dtype, shape=im.shape)
+        cache[...] = im
+        cache.flush()
+        del cache, im
+        os.replace(tmp_file, cache_file)
+    return np.load(cache_file, mmap_mode="r")
+
+
+def imwrite_async(executor, writes, im_file, im, max_writes):
+    """
+    Save an image with `executor`, waiting for the oldest pending write once `max_writes` writes are in flight.
+
+    Args:
+        executor (ThreadPoolExecutor): Threads encoding the images.
+        writes (deque): Pending (im_file, future) writes, updated in place.
+        im_file (str): Output image path.
+        im (np.ndarray): Image to save.
+        max_writes (int): Maximum number of writes in flight, which bounds the number of patches held in memory.
+    """
+    while len(writes) >= max_writes:
+        wait_writes(writes, 1)
+    writes.append((im_file, executor.submit(cv2.imwrite, im_file, im)))
+
+
+def wait_writes(writes, n=None):
+    """Wait for the oldest `n` (default all) pending writes of `imwrite_async` and check that they succeeded."""
+    for _ in range(len(writes) if n is None else n):
+        im_file, future = writes.popleft()
+        assert future.result(), f"Failed to save {im_file}"
+
+
+def crop_and_save(anno, windows, window_objs, im_dir, lb_dir, cache_dir=None, workers=4):
     """
     Crop images and save new labels.
 
@@ -155,6 +253,8 @@ def crop_and_save(anno, windows, window_objs, im_dir, lb_dir):
         window_objs (list): A list of labels inside each window.
         im_dir (str): The output directory path of images.
         lb_dir (str): The output directory path of labels.
+        cache_dir (str, optional): Directory of decoded images, see `load_scene`.
+        workers (int): Number of threads encoding the patches, cv2 releases the GIL while encoding.
 
     Notes:
         The directory structure assumed for the DOTA dataset:
@@ -166,33 +266,40 @@ def crop_and_save(anno, windows, window_objs, im_dir, lb_dir):
                     - train
                     - val
     """
-    im = cv2.imread(anno["filepath"])
+    im = load_scene(anno["filepath"], cache_dir)
     name = Path(anno["filepath"]).stem
-    for i, window in enumerate(windows):
-        x_start, y_start, x_stop, y_stop = window.tolist()
-        new_name = f"{name}__{x_stop - x_start}__{x_start}___{y_start}"
-        patch_im = im[y_start:y_stop, x_start:x_stop]
-        ph, pw = patch_im.shape[:2]
-
-        cv2.imwrite(str(Path(im_dir) / f"{new_name}.jpg"), patch_im)
-        label = window_objs[i]
-        if len(label) == 0:
-            continue
-        label[:, 1::2] -= x_start
-        label[:, 2::2] -= y_start
-        label[:, 1::2] /= pw
-        label[:, 2::2] /= ph
-
-        with open(Path(lb_dir) / f"{new_name}.txt", "w") as f:
-            for lb in label:
-                formatted_coords = ["{:.6g}".format(coord) for coord in lb[1:]]
-                f.write(f"{int(lb[0])} {' '.join(formatted_coords)}\n")
-
-
-def split_images_and_labels(data_root, save_dir, split="train", crop_sizes=(1024,), gaps=(200,)):
+    writes = deque()
+    with ThreadPoolExecutor(workers) as executor:
+        for i, window in enumerate(windows):
+            x_start, y_start, x_stop, y_stop = window.tolist()
+            new_name = f"{name}__{x_stop - x_start}__{x_start}___{y_start}"
+            patch_im = im[y_start:y_stop, x_start:x_stop]
+            ph, pw = patch_im.shape[:2]
+
+            imwrite_async(executor, writes, str(Path(im_dir) / f"{new_name}.jpg"), patch_im, 2 * workers)
+            label = window_objs[i]
+            if len(label) == 0:
+                continue
+            label[:, 1::2] -= x_start
+            label[:, 2::2] -= y_start
+            label[:, 1::2] /= pw
+            label[:, 2::2] /= ph
+
+            with open(Path(lb_dir) / f"{new_name}.txt", "w") as f:
+                for lb in label:
+                    formatted_coords = ["{:.6g}".format(coord) for coord in lb[1:]]
+                    f.write(f"{int(lb[0])} {' '.join(formatted_coords)}\n")
+        wait_writes(writes)
+
+
+def split_images_and_labels(
+    data_root, save_dir, split="train", crop_sizes=(1024,), gaps=(200,), cache_dir=None, workers=4
+):
     """
     Split both images and labels.
 
+    Every scene is loaded once and all its windows (of every crop size) are cut from it, see `crop_and_save`.
+
     Notes:
         The directory structure assumed for the DOTA dataset:
             - data_root
@@ -216,10 +323,10 @@ def split_images_and_labels(data_root, save_dir, split="train", crop_sizes=(1024
     for anno in tqdm(annos, total=len(annos), desc=split):
         windows = get_windows(anno["ori_size"], crop_sizes, gaps)
         window_objs = get_window_obj(anno, windows)
-        crop_and_save(anno, windows, window_objs, str(im_dir), str(lb_dir))
+        crop_and_save(anno, windows, window_objs, str(im_dir), str(lb_dir), cache_dir, workers)
 
 
-def split_trainval(data_root, save_dir, crop_size=1024, gap=200, rates=(1.0,)):
+def split_trainval(data_root, save_dir, crop_size=1024, gap=200, rates=(1.0,), cache_dir=None, workers=4):
     """
     Split train and val set of DOTA.
 
@@ -246,10 +353,10 @@ def split_trainval(data_root, save_dir, crop_size=1024, gap=200, rates=(1.0,)):
         crop_sizes.append(int(crop_size / r))
         gaps.append(int(gap / r))
     for split in ["train", "val", "test"]: #因为split_test中不对对test进行裁剪因此修改这里
-        split_images_and_labels(data_root, save_dir, split, crop_sizes, gaps)
+        split_images_and_labels(data_root, save_dir, split, crop_sizes, gaps, cache_dir, workers)
 
 
-def split_test(data_root, save_dir, crop_size=1024, gap=200, rates=(1.0,)):
+def split_test(data_root, save_dir, crop_size=1024, gap=200, rates=(1.0,), cache_dir=None, workers=4):
     """
     Split test set of DOTA, labels are not included within this set.
 
@@ -276,13 +383,16 @@ def split_test(data_root, save_dir, crop_size=1024, gap=200, rates=(1.0,)):
     for im_file in tqdm(im_files, total=len(im_files), desc="test"):
         w, h = exif_size(Image.open(im_file))
         windows = get_windows((h, w), crop_sizes=crop_sizes, gaps=gaps)
-        im = cv2.imread(im_file)
+        im = load_scene(im_file, cache_dir)
         name = Path(im_file).stem
-        for window in windows:
-            x_start, y_start, x_stop, y_stop = window.tolist()
-            new_name = f"{name}__{x_stop - x_start}__{x_start}___{y_start}"
-            patch_im = im[y_start:y_stop, x_start:x_stop]
-            cv2.imwrite(str(save_dir / f"{new_name}.jpg"), patch_im)
+        writes = deque()
+        with ThreadPoolExecutor(workers) as executor:
+            for window in windows:
+                x_start, y_start, x_stop, y_stop = window.tolist()
+                new_name = f"{name}__{x_stop - x_start}__{x_start}___{y_start}"
+                patch_im = im[y_start:y_stop, x_start:x_stop]
+                imwrite_async(executor, writes, str(save_dir / f"{new_name}.jpg"), patch_im, 2 * workers)
+            wait_writes(writes)
 
 
 if __name__ == "__main__":
@@ -6,7 +6,7 @@ import torch
 
 from ultralytics.models.yolo.detect import DetectionValidator
 from ultralytics.utils import LOGGER, ops
-from ultralytics.utils.metrics import OBBMetrics, batch_probiou
+from ultralytics.utils.metrics import OBBMetrics, batch_rotated_iou
 from ultralytics.utils.plotting import output_to_rotated_target, plot_images
 
 
@@ -48,6 +48,7 @@ class OBBValidator(DetectionValidator):
             agnostic=self.args.single_cls or self.args.agnostic_nms,
             max_det=self.args.max_det,
             rotated=True,
+            iou_type=self.args.obb_iou,
         )
 
     def _process_batch(self, detections, gt_bboxes, gt_cls):
@@ -74,9 +75,11 @@ class OBBValidator(DetectionValidator):
             ```
 
         Note:
-            This method relies on `batch_probiou` to calculate IoU between detections and ground truth bounding boxes.
+            This method relies on `batch_rotated_iou` to calculate IoU between detections and ground truth bounding
+            boxes, with the IoU type given by `args.obb_iou`.
         """
-        iou = batch_probiou(gt_bboxes, torch.cat([detections[:, :4], detections[:, -1:]], dim=-1))
+        pred_bboxes = torch.cat([detections[:, :4], detections[:, -1:]], dim=-1)
+        iou = batch_rotated_iou(gt_bboxes, pred_bboxes, self.args.obb_iou)
         return self.match_predictions(detections[:, 5], gt_cls, iou)
 
     def _prepare_batch(self, si, batch):
@@ -166,7 +169,7 @@ class OBBValidator(DetectionValidator):
                 with open(f'{pred_txt / f"Task1_{classname}"}.txt', "a") as f:
                     f.writelines(f"{image_id} {score} {p[0]} {p[1]} {p[2]} {p[3]} {p[4]} {p[5]} {p[6]} {p[7]}\n")
             # Save merged results, this could result slightly lower map than using official merging script,
-            # because of the probiou calculation.
+            # because of the probiou calculation, use `obb_iou=poly` for the exact polygon IoU.
             pred_merged_txt = self.save_dir / "predictions_merged_txt"  # predictions
             pred_merged_txt.mkdir(parents=True, exist_ok=True)
             merged_results = defaultdict(list)
@@ -182,13 +185,8 @@ class OBBValidator(DetectionValidator):
                 merged_results[image_id].append(bbox)
             for image_id, bbox in merged_results.items():
                 bbox = torch.tensor(bbox)
-                max_wh = torch.max(bbox[:, :2]).item() * 2
-                c = bbox[:, 6:7] * max_wh  # classes
-                scores = bbox[:, 5]  # scores
-                b = bbox[:, :5].clone()
-                b[:, :2] += c
                 # 0.3 could get results close to the ones from official merging script, even slightly better.
-                i = ops.nms_rotated(b, scores, 0.3)
+                i = ops.batched_nms_rotated(bbox[:, :5], bbox[:, 5], bbox[:, 6], 0.3, iou_type=self.args.obb_iou)
                 bbox = bbox[i]
 
                 b = ops.xywhr2xyxyxyxy(bbox[:, :5]).view(-1, 8)
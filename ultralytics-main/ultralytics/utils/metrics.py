@@ -270,6 +270,119 @@ def batch_probiou(obb1, obb2, eps=1e-7):
     return 1 - hd
 
 
+def _obb_corners(obb):
+    """Returns the counter-clockwise corners of xywhr boxes, shape (N, 4, 2)."""
+    xy, w, h, r = obb[..., :2], obb[..., 2:3], obb[..., 3:4], obb[..., 4:5]
+    cos, sin = r.cos(), r.sin()
+    vec1 = torch.cat((w / 2 * cos, w / 2 * sin), dim=-1)
+    vec2 = torch.cat((-h / 2 * sin, h / 2 * cos), dim=-1)
+    return torch.stack((xy - vec1 - vec2, xy + vec1 - vec2, xy + vec1 + vec2, xy - vec1 + vec2), dim=-2)
+
+
+def polyiou(obb1, obb2, eps=1e-7):
+    """
+    Calculate the exact IoU between pairs of oriented bounding boxes, like mmcv's box_iou_rotated.
+
+    The intersection polygon is built from the corners of each box inside the other and the crossings of their edges,
+    sorted by angle around their mean and measured with the shoelace formula, all pairs at once.
+
+    Args:
+        obb1 (torch.Tensor): OBBs, shape (N, 5), format xywhr.
+        obb2 (torch.Tensor): OBBs, shape (N, 5), format xywhr.
+        eps (float, optional): Small value to avoid division by zero. Defaults to 1e-7.
+
+    Returns:
+        (torch.Tensor): OBB IoUs, shape (N,).
+    """
+    obb1, obb2 = obb1.float(), obb2.float()
+    origin = obb1[:, :2]  # centering on box 1 keeps float32 precision for class-offset boxes
+    obb1 = torch.cat((obb1[:, :2] - origin, obb1[:, 2:]), dim=-1)
+    obb2 = torch.cat((obb2[:, :2] - origin, obb2[:, 2:]), dim=-1)
+    p1, p2 = _obb_corners(obb1), _obb_corners(obb2)
+
+    def inside(points, obb):
+        """Whether points (N, K, 2) lie in the boxes (N, 5), with a small tolerance."""
+        d = points - obb[:, None, :2]
+        cos, sin = obb[:, None, 4].cos(), obb[:, None, 4].sin()
+        tol = 1e-5 * (obb[:, None, 2] + obb[:, None, 3]) + eps
+        return ((d[..., 0] * cos + d[..., 1] * sin).abs() <= obb[:, None, 2] / 2 + tol) & (
+            (d[..., 1] * cos - d[..., 0] * sin).abs() <= obb[:, None, 3] / 2 + tol
+        )
+
+    # Crossings of the edges a + t * r of box 1 and c + u * s of box 2
+    a, c = p1[:, :, None], p2[:, None]  # (N, 4, 1, 2), (N, 1, 4, 2)
+    r, s = p1.roll(-1, dims=1)[:, :, None] - a, p2.roll(-1, dims=1)[:, None] - c
+    denom = r[..., 0] * s[..., 1] - r[..., 1] * s[..., 0]  # (N, 4, 4)
+    ac = c - a
+    t = (ac[..., 0] * s[..., 1] - ac[..., 1] * s[..., 0]) / (denom + (denom == 0))
+    u = (ac[..., 0] * r[..., 1] - ac[..., 1] * r[..., 0]) / (denom + (denom == 0))
+    crossing = (denom != 0) & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)
+
+    points = torch.cat((p1, p2, (a + t[..., None] * r).flatten(1, 2)), dim=1)  # (N, 24, 2)
+    valid = torch.cat((inside(p1, obb2), inside(p2, obb1), crossing.flatten(1)), dim=1)
+    center = (points * valid[..., None]).sum(1, keepdim=True) / valid.sum(1, keepdim=True).clamp(min=1)[..., None]
+    angle = torch.atan2(points[..., 1] - center[..., 1], points[..., 0] - center[..., 0]).masked_fill(~valid, 4)
+    order = angle.argsort(dim=1)
+    points = points.gather(1, order[..., None].expand(-1, -1, 2))
+    valid = valid.gather(1, order)
+    points = torch.where(valid[..., None], points, points[:, :1])  # pad with the first vertex, adds no area
+    nxt = points.roll(-1, dims=1)
+    inter = (points[..., 0] * nxt[..., 1] - points[..., 1] * nxt[..., 0]).sum(1).abs() / 2
+
+    union = obb1[:, 2] * obb1[:, 3] + obb2[:, 2] * obb2[:, 3] - inter
+    return inter / (union + eps)
+
+
+def batch_polyiou(obb1, obb2, eps=1e-7, max_pairs=1 << 16):
+    """
+    Calculate the exact IoU between oriented bounding boxes.
+
+    Only pairs whose circumscribed circles intersect are computed with `polyiou`, at most `max_pairs` at a time; the
+    IoU of the others is 0.
+
+    Args:
+        obb1 (torch.Tensor | np.ndarray): A tensor of shape (N, 5) representing ground truth obbs, with xywhr format.
+        obb2 (torch.Tensor | np.ndarray): A tensor of shape (M, 5) representing predicted obbs, with xywhr format.
+        eps (float, optional): A small value to avoid division by zero. Defaults to 1e-7.
+        max_pairs (int, optional): Maximum number of pairs computed at once. Defaults to 1 << 16.
+
+    Returns:
+        (torch.Tensor): A tensor of shape (N, M) representing obb IoUs.
+    """
+    obb1 = torch.from_numpy(obb1) if isinstance(obb1, np.ndarray) else obb1
+    obb2 = torch.from_numpy(obb2) if isinstance(obb2, np.ndarray) else obb2
+
+    radius1, radius2 = (x[:, 2:4].float().pow(2).sum(-1).sqrt() / 2 for x in (obb1, obb2))
+    dist = (obb1[:, None, :2].float() - obb2[None, :, :2].float()).pow(2).sum(-1)
+    i, j = (dist <= (radius1[:, None] + radius2[None]).pow(2)).nonzero(as_tuple=True)
+    iou = torch.zeros(dist.shape, device=dist.device)
+    for k in range(0, len(i), max_pairs):
+        ik, jk = i[k : k + max_pairs], j[k : k + max_pairs]
+        iou[ik, jk] = polyiou(obb1[ik], obb2[jk], eps)
+    return iou
+
+
+def batch_rotated_iou(obb1, obb2, iou_type="probiou"):
+    """
+    Calculate the IoU between oriented bounding boxes with the given IoU type.
+
+    Args:
+        obb1 (torch.Tensor | np.ndarray): A tensor of shape (N, 5) representing ground truth obbs, with xywhr format.
+        obb2 (torch.Tensor | np.ndarray): A tensor of shape (M, 5) representing predicted obbs, with xywhr format.
+        iou_type (str, optional): 'probiou' for `batch_probiou` or 'poly' for the exact `batch_polyiou`.
+            Defaults to 'probiou'.
+
+    Returns:
+        (torch.Tensor): A tensor of shape (N, M) representing obb similarities.
+    """
+    assert iou_type in ROTATED_IOU, f"Invalid rotated IoU type '{iou_type}', valid types are {list(ROTATED_IOU)}"
+    return ROTATED_IOU[iou_type][1](obb1, obb2)
+
+
+# Rotated IoU types, (pairwise, batched) functions
+ROTATED_IOU = {"probiou": (probiou, batch_probiou), "poly": (polyiou, batch_polyiou)}
+
+
 def smooth_BCE(eps=0.1):
     """
     Computes smoothed positive and negative Binary Cross-Entropy targets.
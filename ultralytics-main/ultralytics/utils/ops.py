@@ -11,7 +11,7 @@ import torch
 import torch.nn.functional as F
 
 from ultralytics.utils import LOGGER
-from ultralytics.utils.metrics import batch_probiou
+from ultralytics.utils.metrics import ROTATED_IOU
 
 
 class Profile(contextlib.ContextDecorator):
@@ -139,25 +139,164 @@ def make_divisible(x, divisor):
     return math.ceil(x / divisor) * divisor
 
 
-def nms_rotated(boxes, scores, threshold=0.45):
+def nms_rotated(boxes, scores, threshold=0.45, greedy=False, block_size=1024, max_pairs=1 << 20, iou_type="probiou"):
     """
-    NMS for oriented bounding boxes using probiou and fast-nms.
+    NMS for oriented bounding boxes using probiou or exact polygon IoU, with fast-NMS or greedy suppression.
+
+    Boxes are sorted by score once and suppressed block by block. Only pairs whose centers are close enough for the
+    IoU to reach `threshold` are compared, all close pairs within a block and pairs against earlier blocks found
+    through a uniform grid. Peak memory is bounded by `block_size` ** 2 and `max_pairs` instead of N x N.
 
     Args:
         boxes (torch.Tensor): Rotated bounding boxes, shape (N, 5), format xywhr.
         scores (torch.Tensor): Confidence scores, shape (N,).
         threshold (float, optional): IoU threshold. Defaults to 0.45.
+        greedy (bool, optional): If True, boxes are only suppressed by kept boxes (greedy NMS), otherwise by any higher
+            scoring box (fast-NMS). Defaults to False.
+        block_size (int, optional): Number of boxes suppressed together. Defaults to 1024.
+        max_pairs (int, optional): Maximum number of box pairs compared at once between blocks. Defaults to 1 << 20.
+        iou_type (str, optional): 'probiou' or 'poly' for the exact polygon IoU. Defaults to 'probiou'.
 
     Returns:
         (torch.Tensor): Indices of boxes to keep after NMS.
     """
+    assert iou_type in ROTATED_IOU, f"Invalid rotated IoU type '{iou_type}', valid types are {list(ROTATED_IOU)}"
     if len(boxes) == 0:
         return np.empty((0,), dtype=np.int8)
     sorted_idx = torch.argsort(scores, descending=True)
     boxes = boxes[sorted_idx]
-    ious = batch_probiou(boxes, boxes).triu_(diagonal=1)
-    pick = torch.nonzero(ious.max(dim=0)[0] < threshold).squeeze_(-1)
-    return sorted_idx[pick]
+    n, device = len(boxes), boxes.device
+    pair_iou = ROTATED_IOU[iou_type][0]
+
+    reach = _iou_reach(boxes, threshold, iou_type)
+    keys, span = _grid_keys(boxes[:, :2], 2 * reach.max().item())
+    keep = torch.zeros(n, dtype=torch.bool, device=device)
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        suppressed = torch.zeros(stop - start, dtype=torch.bool, device=device)
+
+        # Suppression by earlier blocks, kept boxes only for greedy NMS
+        ref = keep[:start].nonzero().squeeze_(-1) if greedy else torch.arange(start, device=device)
+        if len(ref):
+            ref_keys, order = keys[ref].sort()
+            ref = ref[order]
+            for q, r in _grid_pairs(keys[start:stop], ref_keys, span, max_pairs):
+                q, r = q + start, ref[r]
+                close = (boxes[q, :2] - boxes[r, :2]).pow(2).sum(-1) <= (reach[q] + reach[r]).pow(2)
+                q, r = q[close], r[close]
+                suppressed[q[pair_iou(boxes[r], boxes[q]).view(-1) >= threshold] - start] = True
+
+        # Suppression within the block, pairs out of reach have an IoU below the threshold
+        xy, r = boxes[start:stop, :2], reach[start:stop]
+        close = ((xy[:, None] - xy[None]).pow(2).sum(-1) <= (r[:, None] + r[None]).pow(2)).triu_(diagonal=1)
+        q, k = close.nonzero(as_tuple=True)
+        ious = torch.zeros(close.shape, device=device)
+        ious[q, k] = pair_iou(boxes[start + q], boxes[start + k]).view(-1).float()
+        if greedy:  # Cluster-NMS iterations, converge to greedy NMS (https://arxiv.org/abs/2005.03572)
+            overlaps, alive = (ious >= threshold).triu_(diagonal=1), ~suppressed
+            block_keep = alive
+            while True:
+                new_keep = alive & ~(overlaps & block_keep[:, None]).any(0)
+                if torch.equal(new_keep, block_keep):
+                    break
+                block_keep = new_keep
+            keep[start:stop] = block_keep
+        else:
+            keep[start:stop] = ~suppressed & (ious.max(dim=0)[0] < threshold)
+    return sorted_idx[keep.nonzero().squeeze_(-1)]
+
+
+def batched_nms_rotated(boxes, scores, idxs, threshold=0.45, iou_type="probiou", **kwargs):
+    """
+    NMS for oriented bounding boxes of several groups (e.g. images and classes) in a single `nms_rotated` call.
+
+    Boxes of different groups never suppress each other. Like `torchvision.ops.batched_nms`, each group is moved to
+    its own region; the regions are laid out on a square lattice so that the offset coordinates stay small enough for
+    float32 IoUs.
+
+    Args:
+        boxes (torch.Tensor): Rotated bounding boxes, shape (N, 5), format xywhr.
+        scores (torch.Tensor): Confidence scores, shape (N,).
+        idxs (torch.Tensor): Group index of every box, shape (N,).
+        threshold (float, optional): IoU threshold. Defaults to 0.45.
+        iou_type (str, optional): 'probiou' or 'poly' for the exact polygon IoU. Defaults to 'probiou'.
+        **kwargs (Any): Additional arguments passed to `nms_rotated`.
+
+    Returns:
+        (torch.Tensor): Indices of boxes to keep after NMS, sorted by decreasing score.
+    """
+    if len(boxes) == 0:
+        return torch.empty((0,), dtype=torch.long, device=boxes.device)
+    groups = idxs.unique(return_inverse=True)[1]
+    side = math.ceil(math.sqrt(int(groups.max()) + 1))
+    xy = boxes[:, :2] - boxes[:, :2].min(0)[0]
+    step = xy.max() + 2 * _iou_reach(boxes, max(threshold, 1e-6), iou_type).max() + 1  # regions out of reach
+    offsets = torch.stack((groups % side, groups // side), -1).to(xy.dtype) * step
+    boxes = torch.cat((xy + offsets, boxes[:, 2:]), dim=-1)
+    return nms_rotated(boxes, scores, threshold, iou_type=iou_type, **kwargs)
+
+
+def _iou_reach(boxes, threshold, iou_type="probiou"):
+    """
+    Per-box distances such that two boxes can only reach IoU `threshold` if their centers are within reach1 + reach2.
+
+    For the polygon IoU the boxes must overlap, so the reach is half the box diagonal D. For probiou, reaching the
+    threshold needs a Bhattacharyya distance bd <= -ln(1 - (1 - threshold) ** 2), and the center term of bd alone is at
+    least 3 * d ** 2 / (D1 ** 2 + D2 ** 2) for center distance d, so d <= sqrt(bd / 3) * (D1 + D2). Margins cover the
+    eps terms of the IoUs.
+
+    Args:
+        boxes (torch.Tensor): Rotated bounding boxes, shape (N, 5), format xywhr.
+        threshold (float): IoU threshold.
+        iou_type (str, optional): 'probiou' or 'poly'. Defaults to 'probiou'.
+
+    Returns:
+        (torch.Tensor): Reach of every box, shape (N,).
+    """
+    if threshold <= 0:
+        scale = math.inf
+    elif iou_type == "poly":
+        scale = 0.5 * 1.01
+    else:
+        scale = 1.1 * math.sqrt(-math.log(1 - (1 - threshold) ** 2) / 3)
+    return scale * boxes[:, 2:4].float().pow(2).sum(-1).sqrt()
+
+
+def _grid_keys(xy, cell):
+    """Returns the grid cell keys of points `xy` for a cell size and the key span of one grid column."""
+    if not 0 < cell < math.inf:  # a single cell
+        return torch.zeros(len(xy), dtype=torch.long, device=xy.device), 3
+    ij = (xy.float() / cell).floor_().long()
+    ij -= ij.min(0)[0] - 1  # keep neighbouring cells positive
+    span = int(ij[:, 1].max()) + 2
+    return ij[:, 0] * span + ij[:, 1], span
+
+
+def _grid_pairs(keys, ref_keys, span, max_pairs):
+    """
+    Yields (query, reference) index pairs of boxes in the same or neighbouring grid cells, `max_pairs` at a time.
+
+    Args:
+        keys (torch.Tensor): Cell keys of the query boxes, shape (N,).
+        ref_keys (torch.Tensor): Sorted cell keys of the reference boxes, shape (M,).
+        span (int): Key span of one grid column.
+        max_pairs (int): Maximum number of pairs per chunk, at least one query is yielded per chunk.
+    """
+    # the 3 neighbouring cells in each grid column are consecutive keys
+    offsets = torch.tensor([-span, 0, span], device=keys.device)
+    lo = torch.searchsorted(ref_keys, keys[:, None] + offsets - 1)
+    counts = torch.searchsorted(ref_keys, keys[:, None] + offsets + 1, right=True) - lo
+    ends = counts.sum(-1).cumsum(0)
+    start = 0
+    while start < len(keys):
+        budget = ends.new_tensor(max_pairs) + (ends[start - 1] if start else 0)
+        stop = max(int(torch.searchsorted(ends, budget, right=True)), start + 1)
+        n = counts[start:stop].flatten()
+        q = torch.arange(start, stop, device=keys.device).repeat_interleave(3).repeat_interleave(n)
+        r = lo[start:stop].flatten().repeat_interleave(n)
+        r += torch.arange(len(r), device=keys.device) - (n.cumsum(0) - n).repeat_interleave(n)
+        yield q, r
+        start = stop
 
 
 def non_max_suppression(
@@ -175,6 +314,7 @@ def non_max_suppression(
     max_wh=7680,
     in_place=True,
     rotated=False,
+    iou_type="probiou",
 ):
     """
     Perform non-maximum suppression (NMS) on a set of boxes, with support for masks and multiple labels per box.
@@ -200,7 +340,9 @@ def non_max_suppression(
         max_nms (int): The maximum number of boxes into torchvision.ops.nms().
         max_wh (int): The maximum box width and height in pixels.
         in_place (bool): If True, the input prediction tensor will be modified in place.
-        rotated (bool): If Oriented Bounding Boxes (OBB) are being passed for NMS.
+        rotated (bool): If Oriented Bounding Boxes (OBB) are being passed for NMS, all images are then suppressed in
+            a single batched call.
+        iou_type (str): The rotated IoU used for OBB NMS, 'probiou' or 'poly' for the exact polygon IoU.
 
     Returns:
         (List[torch.Tensor]): A list of length batch_size, where each element is a tensor of
@@ -242,6 +384,36 @@ def non_max_suppression(
             prediction = torch.cat((xywh2xyxy(prediction[..., :4]), prediction[..., 4:]), dim=-1)  # xywh to xyxy
 
     t = time.time()
+    if rotated:  # NMS of all images in a single call
+        xi, k = xc.nonzero(as_tuple=True)  # image index, box index
+        x = prediction[xi, k]
+        box, cls, mask = x.split((4, nc, nm), 1)
+        if multi_label:
+            i, j = torch.where(cls > conf_thres)
+            x, xi = torch.cat((box[i], x[i, 4 + j, None], j[:, None].float(), mask[i]), 1), xi[i]
+        else:  # best class only
+            conf, j = cls.max(1, keepdim=True)
+            i = conf.view(-1) > conf_thres
+            x, xi = torch.cat((box, conf, j.float(), mask), 1)[i], xi[i]
+        if classes is not None:
+            i = (x[:, 5:6] == classes).any(1)
+            x, xi = x[i], xi[i]
+
+        # Sort by image then confidence and remove excess boxes of each image
+        i = x[:, 4].argsort(descending=True)
+        i = i[xi[i].sort(stable=True)[1]]
+        i = i[_group_rank(xi[i], bs) < max_nms]
+        x, xi = x[i], xi[i]
+
+        # Batched NMS, groups of image and class
+        groups = xi if agnostic else xi * nc + x[:, 5].long()
+        i = batched_nms_rotated(torch.cat((x[:, :4], x[:, -1:]), dim=-1), x[:, 4], groups, iou_thres, iou_type)
+        i = i[xi[i].sort(stable=True)[1]]
+        i = i[_group_rank(xi[i], bs) < max_det]  # limit detections
+        if (time.time() - t) > time_limit:
+            LOGGER.warning(f"WARNING ⚠️ NMS time limit {time_limit:.3f}s exceeded")
+        return list(x[i].split(xi[i].bincount(minlength=bs).tolist()))
+
     output = [torch.zeros((0, 6 + nm), device=prediction.device)] * bs
     for xi, x in enumerate(prediction):  # image index, image inference
         # Apply constraints
@@ -249,7 +421,7 @@ def non_max_suppression(
         x = x[xc[xi]]  # confidence
 
         # Cat apriori labels if autolabelling
-        if labels and len(labels[xi]) and not rotated:
+        if labels and len(labels[xi]):
             lb = labels[xi]
             v = torch.zeros((len(lb), nc + nm + 4), device=x.device)
             v[:, :4] = xywh2xyxy(lb[:, 1:5])  # box
@@ -284,12 +456,8 @@ def non_max_suppression(
         # Batched NMS
         c = x[:, 5:6] * (0 if agnostic else max_wh)  # classes
         scores = x[:, 4]  # scores
-        if rotated:
-            boxes = torch.cat((x[:, :2] + c, x[:, 2:4], x[:, -1:]), dim=-1)  # xywhr
-            i = nms_rotated(boxes, scores, iou_thres)
-        else:
-            boxes = x[:, :4] + c  # boxes (offset by class)
-            i = torchvision.ops.nms(boxes, scores, iou_thres)  # NMS
+        boxes = x[:, :4] + c  # boxes (offset by class)
+        i = torchvision.ops.nms(boxes, scores, iou_thres)  # NMS
         i = i[:max_det]  # limit detections
 
         # # Experimental
@@ -312,6 +480,12 @@ def non_max_suppression(
     return output
 
 
+def _group_rank(idxs, n):
+    """Returns the rank of every element within its group for sorted group indices `idxs` in [0, n)."""
+    counts = idxs.bincount(minlength=n)
+    return torch.arange(len(idxs), device=idxs.device) - (counts.cumsum(0) - counts)[idxs]
+
+
 def clip_boxes(boxes, shape):
     """
     Takes a list of bounding boxes and a shape (height, width) and clips the bounding boxes to the shape.
@@ -266,7 +266,127 @@ class TaskAlignedAssigner(nn.Module):
 
 
 class RotatedTaskAlignedAssigner(TaskAlignedAssigner):
-    """Assigns ground-truth objects to rotated bounding boxes using a task-aligned metric."""
+    """
+    Assigns ground-truth objects to rotated bounding boxes using a task-aligned metric.
+
+    In sparse mode the assignment is computed on (gt, anchor) pairs instead of dense (b, max_num_obj, h*w) tensors.
+    Only the anchors inside the axis-aligned envelope of each gt are tested and ground truths are processed in blocks,
+    so memory grows with the number of anchors inside the ground truths rather than with the padded batch of ground
+    truths times all anchors.
+
+    Attributes:
+        sparse (bool): Whether to compute the assignment on (gt, anchor) pairs.
+        block_size (int): The maximum number of (gt, anchor) envelope tests per block in sparse mode.
+    """
+
+    def __init__(self, topk=13, num_classes=80, alpha=1.0, beta=6.0, eps=1e-9, sparse=False, block_size=1 << 22):
+        """Initialize a RotatedTaskAlignedAssigner object with customizable hyperparameters."""
+        super().__init__(topk, num_classes, alpha, beta, eps)
+        self.sparse = sparse
+        self.block_size = block_size
+
+    @torch.no_grad()
+    def forward(self, pd_scores, pd_bboxes, anc_points, gt_labels, gt_bboxes, mask_gt):
+        """Compute the task-aligned assignment, on (gt, anchor) pairs in sparse mode. See `TaskAlignedAssigner`."""
+        if not self.sparse or gt_bboxes.shape[1] == 0:
+            return super().forward(pd_scores, pd_bboxes, anc_points, gt_labels, gt_bboxes, mask_gt)
+
+        self.bs, na = pd_scores.shape[:2]
+        self.n_max_boxes = gt_bboxes.shape[1]
+        bi, gi = mask_gt.squeeze(-1).bool().nonzero(as_tuple=True)  # batch and box index of the valid gts
+        gt, anc = self.select_candidate_pairs(anc_points, gt_bboxes[bi, gi])
+        b, gi_pair = bi[gt], gi[gt]
+
+        # Anchor alignment metric of the pairs
+        overlaps = self.iou_calculation(gt_bboxes[b, gi_pair], pd_bboxes[b, anc])
+        bbox_scores = pd_scores[b, anc, gt_labels[b, gi_pair, 0].long()]
+        align_metric = bbox_scores.pow(self.alpha) * overlaps.pow(self.beta)
+
+        # Top-k pairs of each gt
+        order, rank = self._sort_by_group(align_metric, gt)
+        pos = order[rank < self.topk]
+
+        # Anchors assigned to multiple gts take the gt of highest overlap
+        anchor = b * na + anc  # (b, h*w) flattened anchor index
+        multi = anchor[pos].bincount(minlength=self.bs * na)[anchor] > 1
+        order, rank = self._sort_by_group(overlaps, anchor)
+        best = order[rank == 0]
+        pos = torch.cat((pos[~multi[pos]], best[multi[best]]))
+
+        # Assigned targets
+        fg_mask = torch.zeros(self.bs * na, dtype=torch.bool, device=anchor.device)
+        fg_mask[anchor[pos]] = True
+        target_gt_idx = torch.zeros(self.bs * na, dtype=torch.long, device=anchor.device)
+        target_gt_idx[anchor[pos]] = gi_pair[pos]
+        fg_mask, target_gt_idx = fg_mask.view(self.bs, na), target_gt_idx.view(self.bs, na)
+        target_labels, target_bboxes, target_scores = self.get_targets(gt_labels, gt_bboxes, target_gt_idx, fg_mask)
+
+        # Normalize
+        pos_align_metrics = self._group_max(align_metric[pos], gt[pos], len(bi))  # valid gts
+        pos_overlaps = self._group_max(overlaps[pos], gt[pos], len(bi))
+        norm_align_metric = torch.zeros(self.bs * na, dtype=align_metric.dtype, device=anchor.device)
+        norm_align_metric[anchor[pos]] = (
+            align_metric[pos] * pos_overlaps[gt[pos]] / (pos_align_metrics[gt[pos]] + self.eps)
+        )
+        target_scores = target_scores * norm_align_metric.view(self.bs, na, 1)
+
+        return target_labels, target_bboxes, target_scores, fg_mask, target_gt_idx
+
+    def select_candidate_pairs(self, xy_centers, gt_bboxes):
+        """
+        Select the (gt, anchor) pairs of anchor centers in rotated gt boxes, testing only the anchors inside the
+        axis-aligned envelope of each gt and at most `block_size` envelope tests at once.
+
+        Args:
+            xy_centers (Tensor): shape(h*w, 2)
+            gt_bboxes (Tensor): shape(n_boxes, 5)
+
+        Returns:
+            gt (Tensor): shape(n_pairs), gt index of each pair, sorted.
+            anc (Tensor): shape(n_pairs), anchor index of each pair.
+        """
+        # (n_boxes, 4, 2)
+        corners = xywhr2xyxyxyxy(gt_bboxes)
+        lt, rb = corners.amin(1, keepdim=True), corners.amax(1, keepdim=True)  # envelope
+        block = max(self.block_size // max(len(xy_centers), 1), 1)
+        gt, anc = [xy_centers.new_zeros(0, dtype=torch.long)], [xy_centers.new_zeros(0, dtype=torch.long)]
+        for i in range(0, len(gt_bboxes), block):
+            in_envelope = ((xy_centers >= lt[i : i + block]) & (xy_centers <= rb[i : i + block])).all(-1)
+            g, k = in_envelope.nonzero(as_tuple=True)
+            gt.append(g + i)
+            anc.append(k)
+        gt, anc = torch.cat(gt), torch.cat(anc)
+
+        # (n_pairs, 2), same test as select_candidates_in_gts
+        a, b, _, d = corners[gt].unbind(-2)
+        ab = b - a
+        ad = d - a
+        ap = xy_centers[anc] - a
+        norm_ab = (ab * ab).sum(dim=-1)
+        norm_ad = (ad * ad).sum(dim=-1)
+        ap_dot_ab = (ap * ab).sum(dim=-1)
+        ap_dot_ad = (ap * ad).sum(dim=-1)
+        is_in_box = (ap_dot_ab >= 0) & (ap_dot_ab <= norm_ab) & (ap_dot_ad >= 0) & (ap_dot_ad <= norm_ad)
+        return gt[is_in_box], anc[is_in_box]
+
+    @staticmethod
+    def _sort_by_group(values, groups):
+        """Returns the order of pairs sorted by group and decreasing value, and the rank of each in its group."""
+        order = values.sort(descending=True, stable=True)[1]  # ties keep the gt order, like argmax
+        order = order[groups[order].sort(stable=True)[1]]
+        groups = groups[order]
+        idx = torch.arange(len(order), device=order.device)
+        start = torch.ones_like(groups, dtype=torch.bool)
+        start[1:] = groups[1:] != groups[:-1]
+        return order, idx - torch.where(start, idx, 0).cummax(0)[0]
+
+    @classmethod
+    def _group_max(cls, values, groups, n):
+        """Returns the maximum value of each of `n` groups, 0 for empty groups."""
+        order, rank = cls._sort_by_group(values, groups)
+        out = values.new_zeros(n)
+        out[groups[order[rank == 0]]] = values[order[rank == 0]]
+        return out
 
     def iou_calculation(self, gt_bboxes, pd_bboxes):
         """IoU calculation for rotated bounding boxes."""